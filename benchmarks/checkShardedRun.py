@@ -0,0 +1,71 @@
+import os
+import sys
+import shutil
+import pandas as pd
+from syntheticFleet import makeFleet
+import runBenchmarks
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','createWindProfiles'))
+from pipeline import runPipeline
+from shardedRun import makeTasks,runSharded
+
+# Checks that a sharded run of the plant level stages (see shardedRun.py) gives the same outputs as an unsharded run (see pipeline.py)
+# on a synthetic fleet (see syntheticFleet.py), when some of the plants to shard have nothing to run:
+#	extraPlantIds are sharded too, but aren't in the fleet, so they are left out before sharding (no shard is made of only them)
+#	the last nRepowered plants of the fleet are marked as repowered in every year, so they have wind speeds (and CFs) but getHourlyGenByIso.py and
+#	getMonthlyGenByPlant.py leave them out; the last shard is only those plants, so it has no plants left after the stages' filters and no output
+# Prints whether the outputs match, and raises an error if they don't
+
+# ----- User Input -----
+nPlants = 14 # number of plants in the synthetic fleet (at least 7, so every ISO has a plant)
+years = [2020,2021] # years of synthetic data
+seed = 0 # seed of the synthetic data
+plantsPerShard = 2
+nRepowered = 2 # at least plantsPerShard, so the last shard is only repowered plants
+extraPlantIds = [99999999] # EIA_IDs to shard that aren't in the fleet
+workers = 2 # number of local worker processes
+
+benchFolder = './benchmarkRuns' # folder the synthetic fleet and the runs' outputs are written to
+# ----------------------
+
+if __name__ == '__main__':
+	os.environ['MPLBACKEND'] = 'Agg'
+	runBenchmarks.years = years # the years of the stage runs (see runBenchmarks.stageRuns)
+	folder = os.path.abspath(os.path.join(benchFolder,f'shardCheck_{nPlants}'))
+	fleet = makeFleet(os.path.join(folder,'fleet'),nPlants,years,seed)
+
+	plantInfo = pd.read_csv(fleet['plantInfo'])
+	repowered = plantInfo['EIA_ID'].iloc[-nRepowered:]
+	for col in ['USWTDB-Retrofit'] + [f'USWTDB-Retrofit{year}' for year in years]: # getMonthlyGenByPlant.py reads the first, getHourlyGenByIso.py the others
+		plantInfo.loc[plantInfo['EIA_ID'].isin(repowered),col] = 1
+	plantInfoFile = os.path.join(folder,'plantInfo_repowered.csv')
+	plantInfo.to_csv(plantInfoFile,index=False)
+
+	stages = ['windSpeedsToCF_singleYr','getHourlyGenByIso','getMonthlyGenByPlant']
+	outputs = ['hourlyGen_*.csv','monthlyGen.csv']
+	runs = {}
+	for run in ['unsharded','sharded']:
+		outFolder = os.path.join(folder,run)
+		shutil.rmtree(outFolder,ignore_errors=True)
+		os.makedirs(outFolder)
+		config = {'common':{'years':years,'plantInfoFile':plantInfoFile},'stages':stages}
+		for stage in stages:
+			(_,_,overrides,_),*_ = runBenchmarks.stageRuns(stage,fleet,outFolder)
+			overrides = {k:v for k,v in overrides.items() if k not in ['years','plantInfoFile','airDensityFolder']}
+			config[stage] = overrides
+		config['windSpeedsToCF_singleYr'].update(writeOutputs=False,byYear={year:{'airDensityFolder':fleet['airDensity'].format(YEAR=year)} for year in years})
+		if run == 'unsharded':
+			runPipeline(config)
+		else:
+			shutil.rmtree(os.path.join(folder,'shards'),ignore_errors=True) # so no tasks done by an earlier check are kept
+			config['sharding'] = {'shardFolder':os.path.join(folder,'shards'),'plantsPerShard':plantsPerShard,'plantIds':plantInfo['EIA_ID'].tolist() + extraPlantIds}
+			tasks = makeTasks(config,stages)
+			assert not any(set(extraPlantIds) & set(plants) for _,plants,_ in tasks), 'plants not in the fleet were sharded'
+			assert sorted(tasks[-1][1]) == sorted(repowered), 'the last shard is not only the repowered plants'
+			runSharded(config,workers=workers)
+			assert not os.listdir(os.path.join(folder,'shards','partials',tasks[-1][0])), 'the shard of only repowered plants has outputs'
+		runs[run] = outFolder
+
+	matches,maxDev = runBenchmarks.compareToReference(runs['sharded'],runs['unsharded'],outputs)
+	print(f'Sharded outputs match the unsharded ones: {matches} (max abs deviation {maxDev})')
+	if not matches:
+		raise RuntimeError('The sharded outputs differ from the unsharded ones')
@@ -0,0 +1,48 @@
+import os
+import sys
+import shutil
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','createWindProfiles'))
+from timeCodec import hourOffsets,decodeTimes,civilHours
+from calendarAggregation import calendarLabels
+from profileStore import packProfiles,queryStore
+
+# Checks that the shared timestamp codec (see timeCodec.py) gives the same hours since the epoch whatever the resolution of the timestamps
+# (pandas 3 parses strings and builds date ranges at microsecond or second resolution, where pandas 2 used nanoseconds):
+#	hourOffsets and calendarLabels on indexes of every resolution, tz-naive and UTC
+#	decodeTimes of a format only pd.to_datetime parses
+#	profiles written like windSpeedsToCF_singleYr.py's outputs round-tripping through profileStore.packProfiles and queryStore
+# Raises an error if any don't match
+
+# ----- User Input -----
+year = 2020 # year of the profiles packed
+nPlants = 3
+
+benchFolder = './benchmarkRuns' # folder the profiles and their store are written to
+# ----------------------
+
+if __name__ == '__main__':
+	expected = civilHours(year,1,1) + np.arange(48)
+	for unit in ['ns','us','ms','s']:
+		for tz in [None,'UTC']:
+			gmt = pd.date_range(f'{year}-01-01',periods=48,freq='h',tz=tz).as_unit(unit)
+			assert np.array_equal(hourOffsets(gmt),expected), f'hourOffsets is wrong at {unit} resolution (tz {tz})'
+			labels = calendarLabels(gmt,['Year','Month','Hour'])
+			assert (labels['Year'] == year).all() and (labels['Hour'].to_numpy() == np.arange(48) % 24).all(), f'calendarLabels is wrong at {unit} resolution (tz {tz})'
+	assert decodeTimes([f'01/01/{year} 05:00'],'%m/%d/%Y %H:%M')[0] == expected[5], 'decodeTimes is wrong for a pd.to_datetime format'
+
+	folder = os.path.abspath(os.path.join(benchFolder,'timeCodecCheck'))
+	shutil.rmtree(folder,ignore_errors=True)
+	os.makedirs(os.path.join(folder,'profiles'))
+	rng = np.random.default_rng(0)
+	gmt = pd.date_range(f'{year}-01-01',f'{year}-12-31 23:00',freq='h')
+	profiles = {}
+	for eiaId in range(50000,50000+nPlants):
+		profiles[eiaId] = pd.DataFrame({'HRRR CF (raw)':rng.random(len(gmt)).round(4)},index=gmt.rename('gmt'))
+		profiles[eiaId].to_csv(os.path.join(folder,'profiles',f'{eiaId}_{year}.csv'),index_label='gmt',date_format='%Y%m%d%H')
+	store = packProfiles(os.path.join(folder,'profiles','{EIA_ID}_{YEAR}.csv'),os.path.join(folder,'store'),[year])
+	packed = queryStore(store)
+	for eiaId,prof in profiles.items():
+		assert np.array_equal(packed.loc[eiaId,'HRRR CF (raw)'].to_numpy(),prof['HRRR CF (raw)'].to_numpy()), f'the packed profile of {eiaId} differs from its file'
+	print(f'The time codec gives the same hours at every resolution, and {nPlants} profiles round-trip through the profile store (pandas {pd.__version__})')
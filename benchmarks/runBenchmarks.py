@@ -0,0 +1,189 @@
+import os
+import sys
+import glob
+import time
+import shutil
+import resource
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from syntheticFleet import makeFleet,hslCols
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','createWindProfiles'))
+from pipeline import runScript
+
+# Benchmarks every stage of the pipeline on synthetic fleets (see syntheticFleet.py) of several sizes
+# Each stage's script is run (unmodified, with the variables in its User Input section overridden to point at the synthetic fleet)
+# in a fresh process, which records the stage's wall time and peak memory (max resident set size).
+# Each stage's outputs can be saved as a reference and later runs compared against it, so optimizations can be checked to not change results.
+# The timings are written to reportFile, one row per fleet size and stage.
+# NOTE: peak memory is measured with the resource module, so this only runs on Unix-like systems
+
+# ----- User Input -----
+fleetSizes = [50,200,800] # numbers of plants in the synthetic fleets (at least 7, so every ISO has a plant)
+years = [2020,2021] # years of synthetic data (2021 is read from the scripts' separate 2021 inputs, like our real data)
+seed = 0 # seed of the synthetic data
+
+benchFolder = './benchmarkRuns' # folder the synthetic fleets and the stages' outputs are written to (fleets are only written once, and re-used on later runs)
+
+stages = [ # the stages to run, in order (later stages read the outputs of earlier ones)
+	'windSpeedsToCF_singleYr',
+	'getHourlyGenByIso',
+	'getMonthlyGenByPlant',
+	'curtAdjustHourlyGenByIso',
+	'curtAdjustMonthlyGenByPlant',
+	'summaryStatsOfWindModels',
+]
+
+referenceFolder = None # if not None, a folder of reference outputs to compare each stage's outputs against
+saveReference = False # if True, each stage's outputs are copied to referenceFolder (replacing any existing reference) instead of being compared against it
+rtol = 1e-6 # relative and absolute tolerances of the comparison against the reference (np.isclose)
+atol = 1e-6
+
+reportFile = './benchmarkReport.csv'
+
+smokeTest = False # if True, only a 7 plant fleet with one year (2020) of data is run instead of fleetSizes and years: a quick check that every stage runs (and matches its reference)
+# ----------------------
+
+if smokeTest:
+	fleetSizes,years = [7],[2020]
+
+repoFolder = os.path.join(os.path.dirname(os.path.abspath(__file__)),'..')
+
+# returns this process's peak memory use in MB
+def peakMemoryMB():
+	maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return maxRss / 2**20 if sys.platform == 'darwin' else maxRss / 2**10 # bytes on macOS, KB on Linux
+
+# runs a stage (in a worker process), with its printed output written to logFile
+# returns the wall time (seconds) and peak memory (MB) of the stage
+def runStage(script,overrides,argv,logFile):
+	with open(logFile,'w') as log, contextlib.redirect_stdout(log):
+		start = time.perf_counter()
+		runScript(script,overrides,argv)
+		seconds = time.perf_counter() - start
+	return seconds,peakMemoryMB()
+
+# returns the script, command line arguments, User Input overrides, and output files (glob patterns within outFolder) of each run of stage
+# fleet is the paths of the synthetic fleet's files (see syntheticFleet.fleetPaths)
+def stageRuns(stage,fleet,outFolder):
+	create = os.path.join(repoFolder,'createWindProfiles')
+	evaluate = os.path.join(repoFolder,'evaluateWindProfiles')
+	profiles = os.path.join(outFolder,'profiles')
+	plantYears = dict(years=years,plantInfoFile=fleet['plantInfo'],eia923FileFormat=fleet['eia923'],
+		genProfFolder=profiles,genProfFormat='{EIA_ID}_{YEAR}.csv',gen2021Folder=profiles,gen2021ProfFormat='{EIA_ID}_{YEAR}.csv')
+	if stage == 'windSpeedsToCF_singleYr':
+		os.makedirs(profiles,exist_ok=True)
+		return [(os.path.join(create,'windSpeedsToCF_singleYr.py'),[str(year)],dict(
+			windProfFolder=fleet['windSpeeds'],
+			airDensityFolder=fleet['airDensity'].format(YEAR=year),
+			powerCurvesFolder=fleet['powerCurves'],
+			specificPowerFile=fleet['plantInfo'],
+			fOutName=os.path.join(profiles,'{EIA_ID}_{YEAR}.csv'),
+		),[f'profiles/*_{year}.csv']) for year in years]
+	if stage == 'getHourlyGenByIso':
+		return [(os.path.join(create,'getHourlyGenByIso.py'),[],dict(plantYears,
+			reportedGenFile=fleet['reportedGen'],
+			reportedGen2021File=fleet['reportedGen2021'],
+			outN=os.path.join(outFolder,'hourlyGen_{ISO}.csv'),
+		),['hourlyGen_*.csv'])]
+	if stage == 'getMonthlyGenByPlant':
+		return [(os.path.join(create,'getMonthlyGenByPlant.py'),[],dict(plantYears,
+			outN=os.path.join(outFolder,'monthlyGen.csv'),
+		),['monthlyGen.csv'])]
+	if stage == 'curtAdjustHourlyGenByIso':
+		return [(os.path.join(create,'curtAdjustHourlyGenByIso.py'),[],dict(
+			years=years,
+			curtAdderFileForm=fleet['curtAdders'],
+			curtMultFileForm=fleet['curtMults'],
+			genFileForm=os.path.join(outFolder,'hourlyGen_{ISO}.csv'),
+			outN=os.path.join(outFolder,'curtAdjHourlyGen_{ISO}.csv'),
+		),['curtAdjHourlyGen_*.csv'])]
+	if stage == 'curtAdjustMonthlyGenByPlant':
+		return [(os.path.join(create,'curtAdjustMonthlyGenByPlant.py'),[],dict(
+			years=years,
+			plantInfoFile=fleet['plantInfo'],
+			curtMultFileForm=fleet['monthlyCurtMults'],
+			ercHSLPath=fleet['curtailment'],
+			ercHSLFileForm={year:fleet['hsl'].format(YEAR=year) for year in years},
+			ercHSLCols={year:hslCols for year in years},
+			genFile=os.path.join(outFolder,'monthlyGen.csv'),
+			outN=os.path.join(outFolder,'curtAdjMonthlyGen.csv'),
+		),['curtAdjMonthlyGen.csv'])]
+	if stage == 'summaryStatsOfWindModels':
+		stats = os.path.join(outFolder,'stats')
+		os.makedirs(stats,exist_ok=True)
+		return [(os.path.join(evaluate,'summaryStatsOfWindModels.py'),[],dict(
+			years=years,
+			plantInfoFile=fleet['plantInfo'],
+			genByIsoFileFormat=os.path.join(outFolder,'curtAdjHourlyGen_{ISO}.csv'),
+			genByPlantFile=os.path.join(outFolder,'curtAdjMonthlyGen.csv'),
+			outPath=stats,
+			nFigureWorkers=1,
+		),['stats/*.csv'])]
+	raise ValueError(f'Unknown stage: {stage}')
+
+# compares the CSVs matching patterns in outFolder to the CSVs of the same names in refFolder
+# returns whether they all match (within rtol and atol) and the maximum absolute deviation of their numeric columns
+def compareToReference(outFolder,refFolder,patterns):
+	matches,maxDev = True,0.0
+	for pattern in patterns:
+		for path in sorted(glob.glob(os.path.join(outFolder,pattern))):
+			refPath = os.path.join(refFolder,os.path.relpath(path,outFolder))
+			if not os.path.exists(refPath):
+				print(f'\tno reference for {refPath}')
+				matches = False
+				continue
+			out,ref = pd.read_csv(path),pd.read_csv(refPath)
+			if list(out.columns) != list(ref.columns) or len(out) != len(ref):
+				print(f'\t{path} has a different shape or columns than its reference')
+				matches = False
+				continue
+			numCols = out.columns[[out[c].dtype.kind in 'fiub' and ref[c].dtype.kind in 'fiub' for c in out.columns]]
+			otherCols = out.columns.difference(numCols)
+			outVals,refVals = out[numCols].to_numpy(dtype=np.float64),ref[numCols].to_numpy(dtype=np.float64)
+			if len(numCols) > 0:
+				maxDev = max(maxDev,np.nanmax(np.abs(outVals-refVals),initial=0))
+			if not (np.isclose(outVals,refVals,rtol=rtol,atol=atol,equal_nan=True).all() and out[otherCols].equals(ref[otherCols])):
+				print(f'\t{path} differs from its reference')
+				matches = False
+	return matches,maxDev
+
+# copies the files matching patterns in outFolder to refFolder
+def saveAsReference(outFolder,refFolder,patterns):
+	for pattern in patterns:
+		for path in glob.glob(os.path.join(outFolder,pattern)):
+			refPath = os.path.join(refFolder,os.path.relpath(path,outFolder))
+			os.makedirs(os.path.dirname(refPath),exist_ok=True)
+			shutil.copyfile(path,refPath)
+
+if __name__ == '__main__':
+	os.environ['MPLBACKEND'] = 'Agg' # the stages' worker processes render figures without a display
+	spawn = multiprocessing.get_context('spawn') # so each stage starts from a fresh process, and its peak memory is its own
+
+	report = []
+	for nPlants in fleetSizes:
+		fleet = makeFleet(os.path.join(benchFolder,f'fleet_{nPlants}'),nPlants,years,seed)
+		outFolder = os.path.abspath(os.path.join(benchFolder,f'out_{nPlants}'))
+		os.makedirs(outFolder,exist_ok=True)
+		for stage in stages:
+			for script,argv,overrides,outputs in stageRuns(stage,fleet,outFolder):
+				name = ' '.join([stage,*argv])
+				print(f'{nPlants} plants: running {name}')
+				logFile = os.path.join(outFolder,f'{name}.log')
+				with ProcessPoolExecutor(max_workers=1,mp_context=spawn) as pool:
+					seconds,peakMB = pool.submit(runStage,script,overrides,argv,logFile).result()
+				row = {'Plants':nPlants,'Stage':name,'Seconds':seconds,'Peak Memory MB':peakMB,'Matches Reference':None,'Max Abs Deviation':None}
+				if referenceFolder is not None:
+					refFolder = os.path.join(referenceFolder,f'out_{nPlants}')
+					if saveReference:
+						saveAsReference(outFolder,refFolder,outputs)
+					else:
+						row['Matches Reference'],row['Max Abs Deviation'] = compareToReference(outFolder,refFolder,outputs)
+				print(f'\t{seconds:.1f} s, {peakMB:.0f} MB')
+				report.append(row)
+
+	report = pd.DataFrame(report)
+	report.to_csv(reportFile,index=False)
+	print(report.to_string(index=False))
@@ -0,0 +1,169 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Synthetic fleet generator for benchmarking the pipeline
+# Writes, for nPlants plants spread over the 7 ISOs, every input file the scripts in createWindProfiles/ and evaluateWindProfiles/ read, in the formats they expect:
+#	* hourly wind speeds (ERA5, MERRA2, and HRRR, with a few missing HRRR hours) and MERRA2 air density for each plant and year (8784 hours in leap years)
+#	* power curves for a range of specific powers
+#	* plant info (capacity, BA, COD, specific power, and repowering flags), which also serves as the specific power file
+#	* EIA 923-style monthly net generation, as .xlsx files with 5 header rows like the EIA's
+#	* reported hourly ISO-wide generation (with 2021 in its own file)
+#	* hourly curtailment adders and multipliers, monthly plant curtailment multipliers, and ERCOT HSL generation
+# The data are random (with diurnal and seasonal cycles), but are generated from a seed, so the same fleet is written every time.
+# Not run directly: used by runBenchmarks.py
+
+models = ['ERA5','MERRA2','HRRR']
+baToIso = {
+	'CISO':'CAISO',
+	'ERCO':'ERCOT',
+	'MISO':'MISO' ,
+	'PJM' :'PJM'  ,
+	'SWPP':'SPP'  ,
+	'ISNE':'ISONE',
+	'NYIS':'NYISO'
+}
+curtAdderIsos = ['CAISO','ERCOT','SPP']
+curtMultIsos = ['ISONE','MISO','NYISO','PJM']
+monthlyCurtMultIsos = ['CAISO','SPP','ISONE','MISO','PJM','NYISO']
+specificPowers = [200,250,300,350,400]
+months = ['January','February','March','April','May','June','July','August','September','October','November','December']
+hslCols = ['gmt','%Y-%m-%d %H:00:00+00:00','MW_gen_raw_not_curtailed'] # timestamp column, timestamp format, and generation column of the HSL files
+
+# the hours (UTC, hour beginning) from the start of firstYear to the end of lastYear
+def hoursOf(firstYear,lastYear=None):
+	return pd.date_range(f'{firstYear}-01-01',f'{lastYear or firstYear}-12-31 23:00',freq='h',tz='UTC')
+
+# a random series over hours with a diurnal and a seasonal cycle around 1, with the diurnal peak at peakHour (UTC)
+def cycles(hours,rng,peakHour):
+	diurnal = 0.15*np.cos(2*np.pi*(hours.hour.to_numpy()-peakHour)/24)
+	seasonal = 0.1*np.cos(2*np.pi*(hours.dayofyear.to_numpy()-30)/366)
+	return 1 + diurnal + seasonal + 0.05*rng.standard_normal(len(hours))
+
+# returns the paths of the synthetic fleet's files within folder
+def fleetPaths(folder):
+	return {
+		'windSpeeds':os.path.join(folder,'windSpeeds'),
+		'airDensity':os.path.join(folder,'airDensity','{YEAR}'), # one folder per year, as windSpeedsToCF_singleYr.py expects one air density file per plant
+		'powerCurves':os.path.join(folder,'powerCurves'),
+		'plantInfo':os.path.join(folder,'plantInfo.csv'),
+		'eia923':os.path.join(folder,'eia923_{YEAR}.xlsx'),
+		'reportedGen':os.path.join(folder,'reportedGen.csv'),
+		'reportedGen2021':os.path.join(folder,'reportedGen2021.csv'),
+		'curtailment':os.path.join(folder,'curtailment'),
+		'curtAdders':os.path.join(folder,'curtailment','hourlyCurtailmentAdders_{ISO}.csv'),
+		'curtMults':os.path.join(folder,'curtailment','hourlyCurtailmentMultipliers_{ISO}{YEAR}.csv'),
+		'monthlyCurtMults':os.path.join(folder,'curtailment','monthlyCurtailmentMultipliers_{ISO}{YEAR}.csv'),
+		'hsl':'hsl_{YEAR}.csv', # within the curtailment folder
+	}
+
+def makePlantInfo(nPlants,years,rng):
+	# the scripts expect every ISO to have plants, so the first plant of each ISO (if nPlants >= 7) is old enough to be in every year's analysis
+	codYears = rng.choice([2008,2012,2016,min(years)-1,min(years)],nPlants)
+	codYears[:len(baToIso)] = 2008
+	plantInfo = pd.DataFrame({
+		'EIA_ID':np.arange(50000,50000+nPlants),
+		'eia_ba':np.resize(list(baToIso),nPlants),
+		'USWTDB-MW':rng.uniform(20,300,nPlants).round(1),
+		'eia_COD_Year':codYears,
+		'eia_COD_Month':rng.integers(1,13,nPlants),
+		'USWTDB-SP':rng.uniform(180,420,nPlants).round(1),
+		'USWTDB-Retrofit':0,
+	})
+	for year in years:
+		plantInfo[f'USWTDB-Retrofit{year}'] = 0
+	return plantInfo
+
+def writeWindSpeedsAndDensity(plantInfo,years,paths,rng):
+	for year in years:
+		hours = hoursOf(year)
+		gmt = hours.strftime('%Y%m%d%H').astype(int)
+		for eiaId in plantInfo['EIA_ID']:
+			meanSpeed = rng.uniform(6.5,9)
+			speeds = pd.DataFrame({'gmt':gmt})
+			for model in models:
+				speeds[f'{model}_wind_speed_m_per_sec'] = (rng.weibull(2.2,len(hours))*meanSpeed*cycles(hours,rng,6)).clip(0,40).round(3)
+			# like the real HRRR data, a few hours are missing
+			missing = rng.integers(0,len(hours)-3,5)[:,None] + np.arange(3)
+			speeds.loc[missing.ravel(),'HRRR_wind_speed_m_per_sec'] = np.nan
+			speeds.to_csv(os.path.join(paths['windSpeeds'],f'{eiaId}_{year}_withHRRR.csv'),index=False)
+			density = rng.uniform(1.08,1.22) - 0.03*cycles(hours,rng,21)
+			pd.DataFrame({'gmt':gmt,'MERRA2 air density (kg/m^3)':density.round(4)}).to_csv(os.path.join(paths['airDensity'].format(YEAR=year),f'{eiaId}_{year}.csv'),index=False)
+
+def writePowerCurves(paths):
+	speeds = np.arange(0,25.01,0.25)
+	for sp in specificPowers:
+		rated = 7.5 + sp/50 # lower specific power turbines reach rated power at lower wind speeds
+		output = np.where(speeds < 3,0,np.where(speeds < rated,1500*np.clip((speeds-3)/(rated-3),0,None)**2.3,1500))
+		pd.DataFrame({'Wind Speed (m/s)':speeds,'Turbine Output':output.round(2)}).to_csv(os.path.join(paths['powerCurves'],f'{sp}.csv'),index=False)
+
+def writeEia923(plantInfo,years,paths,rng):
+	for year in years:
+		eia923 = pd.DataFrame({'Plant Id':plantInfo['EIA_ID'],'AER\nFuel Type Code':'WND'})
+		for month in months:
+			eia923[f'Netgen {month}'] = (plantInfo['USWTDB-MW'].to_numpy()*730*rng.uniform(0.25,0.45,len(plantInfo))).round(1)
+		# the EIA's files have 5 rows of notes above the header
+		eia923.to_excel(paths['eia923'].format(YEAR=year),startrow=5,index=False)
+
+# writes reported ISO-wide generation for all of years, and for 2021 even if it isn't in years (getHourlyGenByIso.py always reads the 2021 file)
+def writeReportedGen(plantInfo,years,paths,rng):
+	isoCaps = plantInfo.groupby(plantInfo['eia_ba'].map(baToIso))['USWTDB-MW'].sum().reindex(list(baToIso.values()),fill_value=100)
+	hours = hoursOf(min(years),max(max(years),2021))
+	repGen = pd.DataFrame({iso:cap*0.33*cycles(hours,rng,5) for iso,cap in isoCaps.items()},index=hours.rename('gmt')).round(2)
+	repGen[hours.year < 2021].to_csv(paths['reportedGen'])
+	repGen[hours.year == 2021].to_csv(paths['reportedGen2021'])
+
+def writeCurtailment(plantInfo,years,paths,rng):
+	isos = plantInfo['eia_ba'].map(baToIso)
+	hours = hoursOf(min(years),max(years)+1)
+	fmt = '%Y-%m-%d %H:%M:%S+00:00'
+	for iso in curtAdderIsos:
+		adders = np.where(rng.random(len(hours)) < 0.3,rng.uniform(0,200,len(hours)),np.nan).round(2)
+		pd.DataFrame({'GMT Datetime (Hour Beginning)':hours.strftime(fmt),'WindCurtailment-MWh':adders}).to_csv(paths['curtAdders'].format(ISO=iso),index=False)
+	for iso in curtMultIsos:
+		for year in years:
+			# like our multiplier files, each year's file also covers the first day of the next year
+			yearHours = hours[(hours.year == year) | ((hours.year == year+1) & (hours.dayofyear == 1))]
+			mults = np.where(rng.random(len(yearHours)) < 0.5,rng.uniform(1,2.5,len(yearHours)),np.nan).round(4)
+			pd.DataFrame({'eiaID':yearHours.strftime(fmt),'hourly-curInflator':mults}).to_csv(paths['curtMults'].format(ISO=iso,YEAR=year),index=False)
+	for iso in monthlyCurtMultIsos:
+		for year in years:
+			mults = pd.DataFrame({'eiaID':plantInfo.loc[isos == iso,'EIA_ID']})
+			for m in range(1,13):
+				mults[f'{m}-curInflator'] = rng.uniform(1,1.2,len(mults)).round(4)
+			mults.to_csv(paths['monthlyCurtMults'].format(ISO=iso,YEAR=year),index=False)
+	# ERCOT HSL generation, including a combination of plants (which the scripts exclude)
+	gmtCol,gmtFormat,genCol = hslCols
+	ercotIds = list(plantInfo.loc[isos == 'ERCOT','EIA_ID'].astype(str)) + ['56795_57095']
+	for year in years:
+		yearHours = hoursOf(year)
+		hsl = []
+		for eiaId in ercotIds:
+			gen = rng.uniform(0,100,len(yearHours)).round(2)
+			gen[rng.random(len(yearHours)) < 0.05] = np.nan
+			hsl.append(pd.DataFrame({'EIA_ID':eiaId,gmtCol:yearHours.strftime(gmtFormat),genCol:gen}))
+		pd.concat(hsl).to_csv(os.path.join(paths['curtailment'],paths['hsl'].format(YEAR=year)),index=False)
+
+# writes a synthetic fleet of nPlants plants for years to folder, unless it has already been written there
+# returns the paths of the fleet's files (see fleetPaths)
+def makeFleet(folder,nPlants,years,seed=0):
+	paths = fleetPaths(folder)
+	doneFile = os.path.join(folder,'done.txt')
+	if os.path.exists(doneFile):
+		return paths
+	print(f'Writing a synthetic fleet of {nPlants} plants for {years} to {folder}')
+	for key in ['windSpeeds','powerCurves','curtailment']:
+		os.makedirs(paths[key],exist_ok=True)
+	for year in years:
+		os.makedirs(paths['airDensity'].format(YEAR=year),exist_ok=True)
+	rng = np.random.default_rng(seed)
+	plantInfo = makePlantInfo(nPlants,years,rng)
+	plantInfo.to_csv(paths['plantInfo'],index=False)
+	writeWindSpeedsAndDensity(plantInfo,years,paths,rng)
+	writePowerCurves(paths)
+	writeEia923(plantInfo,years,paths,rng)
+	writeReportedGen(plantInfo,years,paths,rng)
+	writeCurtailment(plantInfo,years,paths,rng)
+	with open(doneFile,'w') as f:
+		f.write(f'{nPlants} plants, years {years}, seed {seed}\n')
+	return paths
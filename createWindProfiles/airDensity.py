@@ -0,0 +1,51 @@
+import os
+import json
+import numpy as np
+
+# Hub-height air density of the whole fleet from reanalysis surface pressure, temperature, and humidity
+# Reads the point series written by downloadWindspeeds/compact_point_series.py: each variable is interpolated to every plant (bilinearly, with the
+# weights in the point series' index) with one gather over (hours, cells), then brought from the surface to each plant's hub height, for all hours and plants at once:
+#	T(z)  = T - lapseRate*(z - temperatureHeight)         temperature at height z above ground (T is the temperature at temperatureHeight, e.g T2M)
+#	Tv(z) = T(z)*(1 + 0.608*q)                            virtual temperature, accounting for humidity (q is specific humidity)
+#	p(z)  = ps*(Tv(z)/Tv(0))^(g/(Rd*lapseRate))          hypsometric equation with a constant lapse rate (ps*exp(-g*z/(Rd*Tv(0))) if lapseRate is 0)
+#	rho   = p(z)/(Rd*Tv(z))
+# Used by windSpeedsToCF_singleYr.py and windSpeedsToCF_sweep.py (airDensitySource = 'reanalysis')
+
+gravity = 9.80665 # m/s^2
+gasConstantDryAir = 287.05 # J/(kg K)
+
+# the air density (kg/m^3) at hubHeight (m above ground) from the surface pressure (Pa), and the temperature (K) and specific humidity (kg/kg) at temperatureHeight
+# all arguments broadcast, e.g (plants, hours) arrays with hubHeight of shape (plants, 1)
+def hubHeightAirDensity(surfacePressure,temperature,specificHumidity,hubHeight,temperatureHeight=2,lapseRate=0.0065):
+	humidityFactor = 1 + 0.608*specificHumidity
+	surfaceTv = (temperature + lapseRate*temperatureHeight) * humidityFactor
+	hubTv = (temperature - lapseRate*(hubHeight - temperatureHeight)) * humidityFactor
+	if lapseRate == 0:
+		hubPressure = surfacePressure * np.exp(-gravity*hubHeight/(gasConstantDryAir*surfaceTv))
+	else:
+		hubPressure = surfacePressure * np.power(hubTv/surfaceTv,gravity/(gasConstantDryAir*lapseRate))
+	return hubPressure / (gasConstantDryAir*hubTv)
+
+# the index (cells, levels, and each plant's cells and weights) of model's point series for year in folder
+def loadPointSeriesIndex(folder,model,year):
+	with open(os.path.join(folder,f'{model}_points_{year}.json')) as f:
+		return json.load(f)
+
+# the hourly values of a point series variable (at one of its levels) at each of eiaIds, bilinearly interpolated from the cells around them
+# returns a (plants, hours) array; plants outside the point series are NaN
+def plantPointSeries(folder,model,year,variable,eiaIds,level=0,index=None):
+	index = loadPointSeriesIndex(folder,model,year) if index is None else index
+	series = np.load(os.path.join(folder,f'{model}_{variable}_{year}.npy'),mmap_mode='r') # (hours, cells, levels)
+	plants = [index['plants'].get(str(eiaId)) for eiaId in eiaIds]
+	cells = np.array([plant['cells'] if plant else [0]*4 for plant in plants]) # (plants, 4)
+	weights = np.array([plant['weights'] if plant else [np.nan]*4 for plant in plants]) # (plants, 4)
+	usedCells,cellPos = np.unique(cells,return_inverse=True)
+	values = np.asarray(series[:,usedCells,level],dtype=np.float64) # only the cells used are read
+	return np.einsum('hpc,pc->ph',values[:,cellPos.reshape(cells.shape)],weights)
+
+# hub-height air densities (kg/m^3) of each of eiaIds (at hubHeights, m) in every hour of year, as a (plants, hours) array
+# variables maps 'pressure', 'temperature', and 'humidity' (specific) to the names of the point series' variables, e.g {'pressure':'ps','temperature':'t2m','humidity':'qv2m'}
+def fleetAirDensity(folder,model,year,eiaIds,hubHeights,variables,lapseRate=0.0065,temperatureHeight=2):
+	index = loadPointSeriesIndex(folder,model,year)
+	pressure,temperature,humidity = (plantPointSeries(folder,model,year,variables[v],eiaIds,index=index) for v in ['pressure','temperature','humidity'])
+	return hubHeightAirDensity(pressure,temperature,humidity,np.asarray(hubHeights,dtype=np.float64)[:,None],temperatureHeight,lapseRate)
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+# Quantile-mapping bias correction of modelled CFs toward reported monthly generation
+# For each plant (or plant and quarter) and model, the quantiles of the modelled monthly CFs are mapped to the quantiles of the reported monthly CFs
+# (both over the months where both are present). The maps of the whole fleet are fit at once: the monthly CFs are laid out in a dense
+# (models, plants or plant-quarters, months) array, with NaN padding, and sorted along the months, so each quantile is a gather.
+# As the reported data is monthly, the maps correct monthly CFs: each hour's CF is scaled by the factor that maps its plant-month's mean modelled CF
+# onto the reported distribution (mapped monthly CF / modelled monthly CF), so the hourly shape within the month is kept.
+# Used by fitBiasCorrection.py (to fit the maps) and windSpeedsToCF_singleYr.py (to apply them)
+
+# the quantiles (at probabilities probs, interpolating linearly between samples as np.quantile does) of the last axis of values, ignoring NaNs
+# returns the quantiles, of shape values.shape[:-1] + (len(probs),), and the number of samples of each row (rows without any are NaN)
+def batchedQuantiles(values,probs):
+	values = np.sort(values,axis=-1) # NaNs are sorted to the end
+	n = np.sum(~np.isnan(values),axis=-1)
+	last = np.maximum(n-1,0)[...,None]
+	pos = np.asarray(probs) * last
+	lo = np.floor(pos).astype(np.int64)
+	hi = np.minimum(lo+1,last)
+	frac = pos - lo
+	quantiles = np.take_along_axis(values,lo,axis=-1)*(1-frac) + np.take_along_axis(values,hi,axis=-1)*frac
+	return np.where((n > 0)[...,None],quantiles,np.nan),n
+
+# fits quantile maps from modelled to reported values, over the samples (last axis) where both are present
+# returns the modelled and reported quantiles (the knots of each map), each of shape modelled.shape[:-1] + (nQuantiles,), and the number of samples of each map
+def fitQuantileMaps(modelled,reported,nQuantiles=11):
+	both = ~(np.isnan(modelled) | np.isnan(reported))
+	probs = np.linspace(0,1,nQuantiles)
+	modelKnots,n = batchedQuantiles(np.where(both,modelled,np.nan),probs)
+	reportedKnots,_ = batchedQuantiles(np.where(both,reported,np.nan),probs)
+	return modelKnots,reportedKnots,n
+
+# the correction factors (mapped value / value) of values (rows, ...) through the maps (modelKnots and reportedKnots, of shape (rows, knots)) of their rows
+# values between the knots are mapped by linear interpolation; values outside them get the factor of the nearest end knot
+# rows without a map (NaN knots) get a factor of 1
+def quantileMapFactors(modelKnots,reportedKnots,values):
+	extraDims = (1,)*(values.ndim-1)
+	nKnots = modelKnots.shape[1]
+	x = modelKnots.reshape(modelKnots.shape[:1]+extraDims+(nKnots,))
+	y = reportedKnots.reshape(x.shape)
+	hi = np.clip(np.sum(x <= values[...,None],axis=-1),1,nKnots-1)[...,None]
+	x0,x1 = np.take_along_axis(x,hi-1,axis=-1)[...,0],np.take_along_axis(x,hi,axis=-1)[...,0]
+	y0,y1 = np.take_along_axis(y,hi-1,axis=-1)[...,0],np.take_along_axis(y,hi,axis=-1)[...,0]
+	t = np.clip((values - x0) / np.where(x1 > x0,x1 - x0,1),0,1)
+	with np.errstate(divide='ignore',invalid='ignore'):
+		factors = (y0 + t*(y1 - y0)) / values
+		factors = np.where(values < x[...,0],y[...,0]/x[...,0],factors)   # below the lowest knot
+		factors = np.where(values > x[...,-1],y[...,-1]/x[...,-1],factors) # above the highest knot
+	return np.where(np.isfinite(factors),factors,1.0)
+
+# loads quantile maps written by fitBiasCorrection.py, indexed by ['EIA_ID','Quarter','Model'] (Quarter 0 maps apply to every month)
+# returns the maps and the variant of the CFs they were fit to (e.g 'density and loss adjusted')
+def loadQuantileMaps(mapsFile):
+	maps = pd.read_csv(mapsFile,index_col=['EIA_ID','Quarter','Model'])
+	return maps,maps['Variant'].iloc[0]
+
+# the knot columns of maps, (modelled, reported)
+def knotCols(maps):
+	return [c for c in maps.columns if c.startswith('model q')],[c for c in maps.columns if c.startswith('reported q')]
+
+# bias corrects hourly CFs (a Series indexed by EIA_ID and gmt, e.g a column of windSpeedsToCF_singleYr.py's windProfs) of model with maps (from loadQuantileMaps)
+# each hour is scaled by its plant-month's correction factor (see quantileMapFactors) and clipped to [0,1]; plants without a map are left as they are
+def biasCorrectCFs(cfs,maps,model):
+	eiaIds = cfs.index.get_level_values('EIA_ID')
+	months = cfs.index.get_level_values('gmt').month.to_numpy()
+	plantCodes,plants = pd.factorize(eiaIds)
+	rows = plantCodes*12 + months-1 # each hour's plant-month
+	values = cfs.to_numpy(dtype=np.float64)
+	valid = ~np.isnan(values)
+	count = np.bincount(rows,weights=valid,minlength=len(plants)*12)
+	monthlyMeans = np.bincount(rows,weights=np.where(valid,values,0),minlength=len(plants)*12) / np.where(count > 0,count,1)
+
+	seasonal = (maps.index.get_level_values('Quarter') > 0).any()
+	quarters = np.tile((np.arange(12)//3 + 1) if seasonal else np.zeros(12,dtype=int),len(plants))
+	keys = pd.MultiIndex.from_arrays([np.repeat(plants,12),quarters,[model]*len(quarters)],names=['EIA_ID','Quarter','Model'])
+	modelCols,reportedCols = knotCols(maps)
+	mapRows = maps.reindex(keys)
+	factors = quantileMapFactors(mapRows[modelCols].to_numpy(dtype=np.float64),mapRows[reportedCols].to_numpy(dtype=np.float64),monthlyMeans)
+	factors = np.where(count > 0,factors,1.0)
+	return pd.Series(np.clip(values*factors[rows],0,1),index=cfs.index)
@@ -0,0 +1,96 @@
+import functools
+import numpy as np
+import pandas as pd
+from timeCodec import hoursInYear,hourOffsets,calendarLookup,localCalendar
+
+# Calendar aggregation engine
+# Sums hourly (or monthly) data into monthly, quarterly, or annual totals with segment sums (np.add.reduceat)
+# instead of a MultiIndex groupby. The hour -> month/quarter/year lookups are computed once per year and time zone
+# (leap years and daylight savings are handled by pandas when the lookups are built) and cached,
+# so a rollup is a gather into the lookup table plus a single reduceat over all plants and columns.
+# The hour arithmetic and the lookups themselves are in timeCodec.py
+#
+# Example uses:
+#	monthlyModGen = rollup(modGen,'Month',['EIA_ID','Year'])                           # plant level hourly -> monthly (UTC)
+#	localQuarterly = rollup(genByIso,'Quarter',['ISO'],timeZone='US/Central')           # ISO-wide hourly -> quarterly (local time)
+#	annualByPlant = rollupLevels(monthlyGenByPlant,['EIA_ID','Year'])                    # monthly -> annual
+#	sums,labels = periodSums(denseGen,2020,'Month',axis=1)                               # (plant x hour x column) array -> (plant x month x column)
+
+# the calendar columns that can be rolled up to, and the columns that label each period
+periodCols = {
+	'Year':['Year'],
+	'Quarter':['Year','Quarter'],
+	'Month':['Year','Month'],
+}
+
+# returns the given calendar columns (any of 'Year', 'Quarter', 'Month', and 'Hour') for each time in gmt, as a DataFrame of integer arrays
+def calendarLabels(gmt,cols,timeZone='UTC'):
+	return localCalendar(hourOffsets(gmt),cols,timeZone)
+
+# returns the calendar columns (e.g ['Year','Month'] for freq = 'Month') for each time in gmt, as a DataFrame of integer arrays
+def periodLabels(gmt,freq,timeZone='UTC'):
+	return calendarLabels(gmt,periodCols[freq],timeZone)
+
+# returns the hour offsets (from the start of year, in UTC) where each period of the given freq starts
+# these are the boundaries to use with segmentSum along a contiguous hourly axis covering all of year
+@functools.lru_cache(maxsize=None)
+def periodStarts(year,freq,timeZone='UTC'):
+	lookup = calendarLookup(year,timeZone)
+	return segmentStarts([lookup[col].to_numpy() for col in periodCols[freq]])
+
+# returns the positions where any of the (equal length) key arrays changes value, i.e the start of each segment of constant keys
+def segmentStarts(keys):
+	changes = np.zeros(len(keys[0]),dtype=bool)
+	changes[0] = True
+	for key in keys:
+		key = np.asarray(key)
+		changes[1:] |= key[1:] != key[:-1]
+	return np.flatnonzero(changes)
+
+# sums values over the segments starting at starts (which must be strictly increasing and start with 0)
+def segmentSum(values,starts,axis=0):
+	return np.add.reduceat(values,starts,axis=axis)
+
+# sums a dense array whose axis is a contiguous hourly axis covering all of year (in UTC) into periods of freq
+# returns the sums and a DataFrame labelling each period
+def periodSums(values,year,freq,axis=0,timeZone='UTC'):
+	assert values.shape[axis] == hoursInYear(year), f'axis {axis} must have one entry per hour of {year}'
+	starts = periodStarts(year,freq,timeZone)
+	labels = calendarLookup(year,timeZone).loc[starts,periodCols[freq]].reset_index(drop=True)
+	return segmentSum(values,starts,axis=axis),labels
+
+# sums the rows of df that share keys into one row
+# keys is a list of equal length arrays; if equal keys aren't contiguous in df, the (much smaller) segment sums are combined with a groupby at the end
+def sumByKeys(df,keys,names):
+	values = df.to_numpy()
+	if values.dtype.kind == 'f' and np.isnan(values).any():
+		values = np.nan_to_num(values,nan=0) # NaNs count as 0, as in DataFrame.groupby(...).sum()
+	starts = segmentStarts(keys)
+	sums = segmentSum(values,starts)
+	idx = pd.MultiIndex.from_arrays([np.asarray(k)[starts] for k in keys],names=names)
+	summed = pd.DataFrame(sums,index=idx,columns=df.columns)
+	if idx.has_duplicates:
+		summed = summed.groupby(level=names).sum()
+	return summed
+
+# rolls up hourly data into totals by keyLevels and period
+# df must be indexed by keyLevels (and possibly other levels, e.g 'Year') and gmtLevel; all its columns must be numeric
+# freq is one of 'Year', 'Quarter', or 'Month'
+# timeZone is the time zone whose calendar is used to define the periods, e.g 'US/Pacific' for CAISO
+def rollup(df,freq,keyLevels,timeZone='UTC',gmtLevel='gmt'):
+	if not df.index.is_monotonic_increasing:
+		df = df.sort_index()
+	labels = periodLabels(df.index.get_level_values(gmtLevel),freq,timeZone)
+	# if a key level has the same name as a period column (e.g 'Year'), the key level is used
+	labels = labels[[c for c in labels.columns if c not in keyLevels]]
+	keys = [df.index.get_level_values(l).to_numpy() for l in keyLevels] + [labels[c].to_numpy() for c in labels.columns]
+	return sumByKeys(df,keys,list(keyLevels)+list(labels.columns))
+
+# rolls up data that is already at a calendar frequency (e.g monthly data indexed by ['EIA_ID','Year','Quarter','Month'])
+# into totals for each combination of levels (e.g ['EIA_ID','Year'] for annual totals or ['EIA_ID','Year','Quarter'] for quarterly totals)
+def rollupLevels(df,levels):
+	if not df.index.is_monotonic_increasing:
+		df = df.sort_index()
+	keys = [df.index.get_level_values(l).to_numpy() for l in levels]
+	summed = sumByKeys(df.to_frame() if isinstance(df,pd.Series) else df,keys,list(levels))
+	return summed.iloc[:,0] if isinstance(df,pd.Series) else summed
@@ -0,0 +1,48 @@
+import pandas as pd
+
+# Reports how far the final outputs of a compactDtypes = True run (float32) are from a float64 run
+# To use: run windSpeedsToCF_singleYr.py through the curtailment scripts twice, once with compactDtypes = False and once with compactDtypes = True
+# (writing to different output files), then point this script at both sets of outputs
+
+# ----- User Input -----
+isos = ['CAISO','ERCOT','MISO','PJM','SPP','ISONE','NYISO']
+
+refGenByIsoFileForm = 'path/to/hourlyGenByIso/hourlyGen_hrBegAvg_curtAdj_clip995_2018-2021_{ISO}-float64.csv' # outputs of curtAdjustHourlyGenByIso.py with compactDtypes = False
+compactGenByIsoFileForm = 'path/to/hourlyGenByIso/hourlyGen_hrBegAvg_curtAdj_clip995_2018-2021_{ISO}-float32.csv' # outputs of curtAdjustHourlyGenByIso.py with compactDtypes = True
+
+refGenByPlantFile = 'path/to/MonthlyGenByPlant/monthlyGenByPlant_hrBegAvg_curtAdj_2018-2021-float64.csv' # output of curtAdjustMonthlyGenByPlant.py with compactDtypes = False
+compactGenByPlantFile = 'path/to/MonthlyGenByPlant/monthlyGenByPlant_hrBegAvg_curtAdj_2018-2021-float32.csv' # output of curtAdjustMonthlyGenByPlant.py with compactDtypes = True
+
+outN = 'path/to/compactDtypesAccuracyReport.csv'
+# ----------------------
+
+# load in and concatenate the hourly ISO-wide generation files for all isos
+def loadGenByIso(fileForm):
+	gens = [pd.read_csv(fileForm.format(ISO=iso)) for iso in isos]
+	return pd.concat(gens).set_index(['ISO','gmt']).sort_index()
+
+# find, for each float column in both ref and compact, the maximum absolute and relative deviation of compact from ref
+# relative deviations are only taken where ref is non-zero
+def maxDeviations(ref,compact):
+	assert ref.index.equals(compact.index), 'the float64 and compact runs must cover the same rows'
+	cols = [c for c in ref.columns if c in compact.columns and ref[c].dtype.kind == 'f']
+	absDev = (compact[cols] - ref[cols]).abs()
+	relDev = absDev / ref[cols].abs().where(ref[cols] != 0)
+	return pd.DataFrame({
+		'Max Abs Deviation':absDev.max(),
+		'Max Rel Deviation':relDev.max(),
+		'Max Abs Reference':ref[cols].abs().max(),
+	}).rename_axis('Column')
+
+print('Comparing hourly ISO-wide generation')
+isoReport = maxDeviations(loadGenByIso(refGenByIsoFileForm),loadGenByIso(compactGenByIsoFileForm))
+
+print('Comparing monthly generation by plant')
+idxCols = ['EIA_ID','Year','Month']
+refByPlant = pd.read_csv(refGenByPlantFile,index_col=idxCols).sort_index()
+compactByPlant = pd.read_csv(compactGenByPlantFile,index_col=idxCols).sort_index()
+plantReport = maxDeviations(refByPlant,compactByPlant)
+
+report = pd.concat({'Hourly By ISO':isoReport,'Monthly By Plant':plantReport},names=['Output'])
+print(report.to_string())
+report.to_csv(outN)
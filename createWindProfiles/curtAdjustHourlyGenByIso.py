@@ -1,6 +1,10 @@
 import os
 import numpy as np
 import pandas as pd
+from curtailmentEngine import combineCurtailmentFiles,alignCurtailment,curtailmentVariants
+from timeCodec import parseTimes
+from floatDtypes import compactFloats
+from runReport import startRun,beginStage,addToStage,endRun
 
 # ----- User Input -----
 years = [2018, 2019, 2020, 2021]
@@ -12,68 +16,90 @@ curtMultFileForm = 'path/to/hourlyCurtailmentMultipliersBy{ISO}{YEAR}.csv' # fil
 curtMultIsos = ['ISONE','MISO','NYISO','PJM']
 
 genFileForm = 'path/to/hourlyGenByIso/hourlyGen_hrBegAvg_preCurtAdj_2018-2021_{ISO}-20230128.csv' # files with pre-curtailment-adjusted generation (i.e. the outputs of getHourlyGenByIso.py)
+genByIsoInMemory = None # if not None, a DataFrame of the pre-curtailment-adjusted generation of all ISOs (indexed by ISO and gmt, as computed by getHourlyGenByIso.py), used instead of the files in genFileForm (see pipeline.py)
 
-outN = 'path/to/hourlyGenByIso/hourlyGen_hrBegAvg_curtAdj_clip995_2018-2021_{ISO}-20230129.csv'
+outN = 'path/to/hourlyGenByIso/hourlyGen_hrBegAvg_curtAdj_clip995_2018-2021_{ISO}-20230129.csv' # if sweeping more than one curtMultCap or clipQuantile, include {CAP} and {QUANTILE} in outN, e.g '..._cap{CAP}_clip{QUANTILE}_{ISO}.csv'
+
+# curtailment multipliers are clipped to be no larger than each value in curtMultCaps,
+# and curtailment adjusted generation is clipped to each value in clipQuantiles of its ISO and year
+# every combination is computed in one run (without re-reading any files) and written to its own set of files
+curtMultCaps = [2]
+clipQuantiles = [0.95] # NOTE: the file and flag column ('curtAdjGenClippedAt99.5') names of earlier outputs say 99.5, but 0.95 is the quantile they were clipped at; the flag column keeps that name
+writeOutputs = True # if False, the outputs aren't written to outN (e.g when pipeline.py hands the first combination of curtMultCaps and clipQuantiles to the next stages in memory instead)
+
+compactDtypes = False # if True, generation and curtailment data are held as float32 (instead of float64) and ISO names as categoricals, roughly halving memory use
+runReportFile = None # if not None, a JSON file that the wall time, CPU time, peak memory, and rows processed of each stage of this run are written to (see runReport.py)
+profileFolder = None # if not None, each stage is profiled with cProfile and its profile is written to this folder
 # ----------------------
 
+floatDtype = np.float32 if compactDtypes else np.float64
+
+startRun(os.path.basename(__file__),runReportFile,profileFolder)
+beginStage('load')
+
 # Load in curtailment adders
 curtAdders = {}
 for iso in curtAdderIsos:
 	isoCurt = pd.read_csv(curtAdderFileForm.format(ISO=iso))
-	isoCurt['GMT Datetime (Hour Beginning)'] = pd.to_datetime(isoCurt['GMT Datetime (Hour Beginning)'],infer_datetime_format=True,utc=True)
+	isoCurt['GMT Datetime (Hour Beginning)'] = parseTimes(isoCurt['GMT Datetime (Hour Beginning)'])
 	isoCurt.set_index('GMT Datetime (Hour Beginning)',inplace=True)
-	curtAdders[iso] = isoCurt
+	curtAdders[iso] = compactFloats(isoCurt,floatDtype)
 
 curtAdders = pd.concat(curtAdders,names=['ISO','GMT Datetime (Hour Beginning)'])
 
 # Load in curtailment multipliers
+# all years of an ISO are concatenated at once; where files overlap, the first non-NaN value (in order of years) is kept
 curtMults = {}
 for iso in curtMultIsos:
-	isoCurt = pd.DataFrame()
 	for year in years:
 		curt = pd.read_csv(curtMultFileForm.format(ISO=iso,YEAR=year))
-		curt['GMT Datetime (Hour Beginning)'] = pd.to_datetime(curt['eiaID'],infer_datetime_format=True,utc=True)
-		isoCurt = isoCurt.combine_first(curt.set_index('GMT Datetime (Hour Beginning)'))
-		assert not isoCurt.index.duplicated().any()
-	curtMults[iso] = isoCurt
+		curt['GMT Datetime (Hour Beginning)'] = parseTimes(curt['eiaID'])
+		curtMults[(iso,year)] = compactFloats(curt.set_index('GMT Datetime (Hour Beginning)'),floatDtype)
 
-curtMults = pd.concat(curtMults,names=['ISO','GMT Datetime (Hour Beginning)'])
+curtMults = combineCurtailmentFiles(curtMults,'GMT Datetime (Hour Beginning)')
 
 # Load in hourly ISO-aggregated generation
 gens = []
 for iso in curtAdderIsos+curtMultIsos:
-	gen = pd.read_csv(genFileForm.format(ISO=iso))
-	gen['gmt'] = pd.to_datetime(gen['gmt'],infer_datetime_format=True,cache=True)
-	gens.append(gen)
-
-gens = pd.concat(gens).set_index(['ISO','gmt'])
+	if genByIsoInMemory is not None:
+		gen = genByIsoInMemory.xs(iso,level='ISO',drop_level=False).reset_index()
+		gen['ISO'] = gen['ISO'].astype(str) # as read from a file (getHourlyGenByIso.py holds ISOs as categoricals)
+	else:
+		gen = pd.read_csv(genFileForm.format(ISO=iso))
+		gen['gmt'] = parseTimes(gen['gmt'])
+	gens.append(compactFloats(gen,floatDtype))
+
+gens = pd.concat(gens)
+if compactDtypes:
+	gens['ISO'] = gens['ISO'].astype('category')
+gens.set_index(['ISO','gmt'],inplace=True)
+addToStage(gens)
 
 # Add curtailment info to the generation dataframe
-gens['curtAdder MWh'] = curtAdders['WindCurtailment-MWh']
-gens['curtMult'] = curtMults['hourly-curInflator']
+beginStage('curtailment')
+gens = alignCurtailment(gens,curtAdders['WindCurtailment-MWh'],curtMults['hourly-curInflator'])
 
 assert not (gens['curtAdder MWh'].notna() & gens['curtMult'].notna()).any() # ensure curtailment adders and multipliers are mutually exclusive: only one should be non-na and in use at a time
 
-# Clip hourly curtailment multipliers to be no larger than 2
-gens['curtMultClippedAt2'] = gens['curtMult'] > 2
-gens['curtMult'] = gens['curtMult'].clip(upper=2)
-
-# Adjust generation for curtailment
-gens['curtAdjustedGen MWh'] = gens['Reported Gen MWh']
-addRows = gens['curtAdder MWh'].notna()
-gens.loc[addRows,'curtAdjustedGen MWh'] += gens.loc[addRows,'curtAdder MWh']
-multRows = gens['curtMult'].notna()
-gens.loc[multRows,'curtAdjustedGen MWh'] *= gens.loc[multRows,'curtMult']
-
-# Limit curtailment adjusted generation to 99.5th percentile by year and ISO
-yrIdx = gens.index.get_level_values('gmt').year.rename('Year')
-top995 = lambda g: g.quantile(0.95)
-limits = gens['curtAdjustedGen MWh'].groupby(['ISO',yrIdx]).transform(top995)
-gens['curtAdjGenClippedAt99.5'] = gens['curtAdjustedGen MWh'] > limits
-gens['curtAdjustedGen MWh'] = gens['curtAdjustedGen MWh'].clip(upper=limits)
-# NOTE: the above line is equivalent to: gens['curtAdjustedGen MWh'] = gens['curtAdjustedGen MWh'].mask(gens['curtAdjGenClippedAt99.5'],limits)
-
-# Output to CSVs
-boolCols = gens.columns[gens.dtypes == 'bool']
-gens[boolCols] = gens[boolCols].astype(int)
-gens.groupby('ISO').apply(lambda g: g.to_csv(outN.format(ISO=g.name)))
+if len(curtMultCaps) * len(clipQuantiles) > 1:
+	assert '{CAP}' in outN and '{QUANTILE}' in outN, 'outN must contain {CAP} and {QUANTILE} when sweeping more than one curtMultCap or clipQuantile'
+
+# Adjust generation for curtailment, clipping multipliers at curtMultCap,
+# then limit curtailment adjusted generation to the clipQuantile by year and ISO
+# (the variants are computed as they are iterated over, so each iteration ends by beginning the 'curtailment' stage again)
+# the first variant is kept in curtAdjGens, for pipeline.py to hand to the next stages
+curtAdjGens = None
+for curtMultCap,clipQuantile,adjGens in curtailmentVariants(gens,curtMultCaps,clipQuantiles):
+	boolCols = adjGens.columns[adjGens.dtypes == 'bool']
+	adjGens[boolCols] = adjGens[boolCols].astype(int)
+	if curtAdjGens is None:
+		curtAdjGens = adjGens
+	if writeOutputs:
+		beginStage('write')
+		print(f'Outputting curtailment adjusted generation with multipliers clipped at {curtMultCap} and generation clipped at quantile {clipQuantile}')
+		# Output to CSVs
+		adjGens.groupby('ISO').apply(lambda g: g.to_csv(outN.format(ISO=g.name,CAP=f'{curtMultCap:g}',QUANTILE=f'{clipQuantile:g}')))
+		addToStage(adjGens)
+	beginStage('curtailment')
+
+endRun()
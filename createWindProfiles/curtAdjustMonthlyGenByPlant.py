@@ -1,6 +1,9 @@
 import os
 import numpy as np
 import pandas as pd
+from hslIngest import readMonthlyHSLCached
+from floatDtypes import compactFloats
+from runReport import startRun,beginStage,addToStage,endRun
 
 # ----- User Input -----
 years = [2018,2019,2020,2021]
@@ -27,17 +30,33 @@ ercHSLCols = {
 	2020:['Datetime GMT (Hour Beginning)','%Y-%m-%d %H:00:00+00:00','MW_gen_raw_not_curtailed'],
 	2021:['gmt','%Y-%m-%d %H:00:00+00:00','MW_gen_raw_not_curtailed'],
 }
+hslChunkSize = 1000000 # number of rows of an HSL file to read in at a time
+hslCacheFolder = None # if not None, the monthly HSL generation from each file is cached in this folder and re-used on later runs (as long as the HSL file and its ercHSLCols haven't changed); the folder is created if needed
 
 genFile = 'path/to/MonthlyGenByPlant/monthlyGenByPlant_hrBegAvg_preCurtAdj_2018-2021-20230129.csv' # files with pre-curtailment-adjusted generation (e.g. the outputs of getMonthlyGenByPlant.py)
+genByPlantInMemory = None # if not None, a DataFrame of the pre-curtailment-adjusted generation (indexed by EIA_ID, Year, and Month, as computed by getMonthlyGenByPlant.py), used instead of genFile (see pipeline.py)
 
 outN = 'path/to/MonthlyGenByPlant/monthlyGenByPlant_hrBegAvg_curtAdj_2018-2021-20230129.csv'
+writeOutputs = True # if False, the outputs aren't written to outN (e.g when pipeline.py hands them to the next stage in memory instead)
+
+compactDtypes = False # if True, generation and curtailment data are held as float32 (instead of float64) and BA names as categoricals, roughly halving memory use
+runReportFile = None # if not None, a JSON file that the wall time, CPU time, peak memory, and rows processed of each stage of this run are written to (see runReport.py)
+profileFolder = None # if not None, each stage is profiled with cProfile and its profile is written to this folder
 # ----------------------
 
+floatDtype = np.float32 if compactDtypes else np.float64
+
+startRun(os.path.basename(__file__),runReportFile,profileFolder)
+beginStage('load')
+
 # load in plant info
 plantInfo = pd.read_csv(plantInfoFile,index_col='EIA_ID')
 
 # load in raw (pre-curtailment-adjusted) monthly generation by plant
-gen = pd.read_csv(genFile,index_col=['EIA_ID','Year','Month'])
+if genByPlantInMemory is not None:
+	gen = compactFloats(genByPlantInMemory.copy(),floatDtype)
+else:
+	gen = compactFloats(pd.read_csv(genFile,index_col=['EIA_ID','Year','Month']),floatDtype)
 
 # load in monthly curtailment multipliers
 curtCols = [f'{m}-curInflator' for m in range(1,13)]
@@ -48,52 +67,48 @@ for iso in curtMultIsos:
 		df = pd.read_csv(curtMultFileForm.format(ISO=iso,YEAR=year),usecols=curtCols+['eiaID'])
 		df.set_index('eiaID',inplace=True)
 		df.columns = df.columns.map(monthExtractor).rename('Month')
-		curtMults[(iso,year)] = df.stack().to_frame('curInflator')
+		curtMults[(iso,year)] = df.stack().to_frame('curInflator').astype(floatDtype)
 
 curtMults = pd.concat(curtMults,names=['ISO','Year','EIA_ID','Month']).reset_index(level='ISO')
 curtMults = curtMults.reorder_levels(['EIA_ID','Year','Month'])
 
+addToStage(gen)
+
 # adjust generation for curtailment for plants we have curt multipliers for
+beginStage('curtailment')
 # (no ERCOT plants should be included here as we use HSL data to account for their curtailment)
-gen['curtAdjustedGen MWh'] = np.nan
+gen['curtAdjustedGen MWh'] = floatDtype(np.nan) # floatDtype(np.nan) so the column keeps floatDtype as it is filled in below
 idx = gen.index.intersection(curtMults.index)
 gen.loc[idx,'curtMult'] = curtMults.loc[idx,'curInflator']
 gen.loc[idx,'curtAdjustedGen MWh'] = gen.loc[idx,'Reported Gen MWh'] * curtMults.loc[idx,'curInflator']
 
 # use HSL data for curtailment-adjusted generation in ERCOT
-hslGen = {}
+beginStage('HSL ingest')
+# each year's HSL file is read in chunks, filtered to that year and to single plant EIA_IDs, and summed to plant x month as it is read
+# (a plant-month is NaN unless more than 90% of its hours have generation data)
+hslGenMonthly = {}
 for year in years:
 	gmtCol,gmtFormat,genCol = ercHSLCols[year]
 	fileName = ercHSLFileForm[year]
-	df = pd.read_csv(os.path.join(ercHSLPath,fileName),usecols=['EIA_ID',gmtCol,genCol])
-	df[gmtCol] = pd.to_datetime(df[gmtCol],format=gmtFormat,cache=True)
-	if year == 2018:
-		df = df[df[gmtCol].dt.year == 2018] # as 2018 HSL file contains many years of data
-	# the HSL data sometimes contains EIA_IDs that are combos of plants (e.g '56795_57095'). I exclude them from this dataset
-	print(f"EIA_IDs in {year} to be excluded from HSL data: {df.loc[~df['EIA_ID'].astype(str).str.isdigit(),'EIA_ID'].unique()}")
-	df = df[df['EIA_ID'].astype(str).str.isdigit()]
-	df['EIA_ID'] = df['EIA_ID'].astype(int)
-	# for consistent column names across the years
-	df.rename(columns={gmtCol:'GMT Datetime (Hour Beginning)',genCol:'HSL_gen'},inplace=True)
-	hslGen[year] = df.set_index(['EIA_ID','GMT Datetime (Hour Beginning)'])
-
-hslGen = pd.concat(hslGen,names=['Year','EIA_ID','GMT Datetime (Hour Beginning)'])
-
-# Sum a month of HSL generation data for a plant,
-# but return np.nan if >90% of the hours have missing generation data
-def sumMonthlyHSL(g):
-	eiaId,year,month = g.name
-	hoursInMonth = pd.Timestamp(year=year,month=month,day=1).days_in_month*24
-	return g.sum() if g.notna().sum() > hoursInMonth*0.9 else np.nan
-
-monthIdx = hslGen.index.get_level_values('GMT Datetime (Hour Beginning)').month.rename('Month')
-hslGenMonthly = hslGen['HSL_gen'].groupby(['EIA_ID','Year',monthIdx]).apply(sumMonthlyHSL)
+	hslGenMonthly[year] = readMonthlyHSLCached(os.path.join(ercHSLPath,fileName),year,gmtCol,gmtFormat,genCol,cacheFolder=hslCacheFolder,chunksize=hslChunkSize)
+
+hslGenMonthly = pd.concat(hslGenMonthly.values()).sort_index().astype(floatDtype)
+addToStage(nBytes=sum(os.path.getsize(os.path.join(ercHSLPath,ercHSLFileForm[year])) for year in years)) # bytes of the HSL files
+
+beginStage('curtailment')
 
 # Add HSL data to gen, leaving blank if no HSL data for a plant
 idx = hslGenMonthly.index.intersection(gen.index)
 gen['usesHSLGen'] = gen.index.isin(idx).astype(int)
 gen['eia_ba'] = plantInfo.loc[gen.index.get_level_values('EIA_ID'),'eia_ba'].to_numpy()
+if compactDtypes:
+	gen['eia_ba'] = gen['eia_ba'].astype('category')
 gen.loc[idx,'curtAdjustedGen MWh'] = hslGenMonthly.loc[idx]
 
 # write to CSV
-gen.to_csv(outN)
+if writeOutputs:
+	beginStage('write')
+	gen.to_csv(outN)
+	addToStage(gen)
+
+endRun()
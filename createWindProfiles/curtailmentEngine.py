@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+# Curtailment engine for hourly ISO-wide generation
+# Aligns curtailment adders and multipliers to the ISO-hour grid in one join, applies them in a single vectorized expression,
+# and clips the result at per-ISO-year quantiles found with one sort over all groups (instead of a groupby(...).transform(lambda g: g.quantile(...))).
+# Used by curtAdjustHourlyGenByIso.py
+
+# joins the curtailment adders and multipliers onto gens (indexed by ['ISO','gmt']) as the columns 'curtAdder MWh' and 'curtMult'
+# curtAdders and curtMults are Series indexed by ['ISO', <hour beginning GMT datetime>]
+def alignCurtailment(gens,curtAdders,curtMults):
+	curt = pd.concat([
+		curtAdders.rename('curtAdder MWh').rename_axis(['ISO','gmt']),
+		curtMults.rename('curtMult').rename_axis(['ISO','gmt']),
+	],axis=1)
+	return gens.join(curt)
+
+# adjusts reported generation for curtailment: (reported + adder) * min(multiplier, multCap)
+# adders and multipliers are NaN in hours where they don't apply, so they are treated as 0 and 1 respectively in those hours
+# returns the curtailment adjusted generation and a boolean array of where the multiplier was clipped at multCap
+def applyCurtailment(repGen,curtAdder,curtMult,multCap=2):
+	repGen,curtAdder,curtMult = (np.asarray(a) for a in (repGen,curtAdder,curtMult))
+	multClipped = curtMult > multCap
+	adjusted = (repGen + np.where(np.isnan(curtAdder),0,curtAdder)) * np.where(np.isnan(curtMult),1,np.minimum(curtMult,multCap))
+	return adjusted,multClipped
+
+# finds the given quantiles of values within each group, using linear interpolation (like pd.Series.quantile) and ignoring NaNs
+# codes are integer group codes (0 to nGroups-1), one per value
+# all groups and quantiles share a single sort, so this costs O(n log n) regardless of the number of groups or quantiles
+# returns an array of shape (nGroups, len(quantiles))
+def groupQuantiles(values,codes,quantiles):
+	values = np.asarray(values,dtype=np.float64)
+	codes = np.asarray(codes)
+	nGroups = codes.max() + 1
+	sortedVals = values[np.lexsort((values,codes))] # sorted by group, then by value within each group (NaNs last)
+	groupSizes = np.bincount(codes,minlength=nGroups)
+	groupStarts = np.concatenate([[0],np.cumsum(groupSizes)[:-1]])
+	nValid = np.bincount(codes,weights=~np.isnan(values),minlength=nGroups).astype(np.int64)
+	# position of each quantile within each group's sorted values
+	pos = (nValid[:,None] - 1) * np.asarray(quantiles,dtype=np.float64)[None,:]
+	lo = np.floor(pos).astype(np.int64)
+	hi = np.ceil(pos).astype(np.int64)
+	lastIdx = len(sortedVals) - 1
+	loVals = sortedVals[np.clip(groupStarts[:,None] + lo,0,lastIdx)]
+	hiVals = sortedVals[np.clip(groupStarts[:,None] + hi,0,lastIdx)]
+	result = loVals + (hiVals - loVals) * (pos - lo)
+	result[nValid == 0] = np.nan
+	return result
+
+# the name of the column flagging the hours whose generation was clipped at quantile q
+# clipping at 0.95 keeps the name of earlier outputs, 'curtAdjGenClippedAt99.5', so their schema doesn't change
+legacyClipFlagCols = {0.95:'curtAdjGenClippedAt99.5'}
+def clipFlagCol(q):
+	return legacyClipFlagCols.get(q,f'curtAdjGenClippedAt{q*100:g}')
+
+# combines curtailment data read from one file per ISO and year (curts, a dict of DataFrames indexed by hour, keyed by (ISO, year))
+# into one row per ISO and hour; where files overlap, the first non-NaN value (in order of curts) is kept
+# each file must have at most one row per hour
+def combineCurtailmentFiles(curts,hourName):
+	for (iso,year),curt in curts.items():
+		assert not curt.index.duplicated().any(), f'the {iso} {year} curtailment file has more than one row for some hours'
+	combined = pd.concat(curts,names=['ISO','Year',hourName]).droplevel('Year')
+	return combined.groupby(level=['ISO',hourName]).first()
+
+# returns integer codes for the (ISO, year) group of each row of an ['ISO','gmt'] indexed DataFrame, along with the unique groups
+def isoYearGroups(index):
+	groups = pd.MultiIndex.from_arrays([
+		index.get_level_values('ISO'),
+		index.get_level_values('gmt').year.rename('Year'),
+	])
+	return groups.factorize()
+
+# adjusts gens (indexed by ['ISO','gmt'], with 'Reported Gen MWh', 'curtAdder MWh', and 'curtMult' columns) for curtailment
+# once for every combination of multCaps and clipQuantiles
+# each multCap's adjusted generation is computed once, and all of clipQuantiles are found from a single sort of it
+# yields (multCap, clipQuantile, DataFrame) for each combination, where the DataFrame is gens with the curtailment adjusted columns added
+def curtailmentVariants(gens,multCaps,clipQuantiles):
+	codes,groups = isoYearGroups(gens.index)
+	for multCap in multCaps:
+		adjusted,multClipped = applyCurtailment(gens['Reported Gen MWh'],gens['curtAdder MWh'],gens['curtMult'],multCap)
+		limits = groupQuantiles(adjusted,codes,clipQuantiles)
+		for i,q in enumerate(clipQuantiles):
+			rowLimits = limits[codes,i]
+			variant = gens.copy()
+			variant['curtMult'] = np.minimum(gens['curtMult'].to_numpy(),multCap) # NaN stays NaN
+			variant[f'curtMultClippedAt{multCap:g}'] = multClipped
+			variant['curtAdjustedGen MWh'] = np.minimum(adjusted,rowLimits).astype(adjusted.dtype)
+			variant[clipFlagCol(q)] = adjusted > rowLimits
+			yield multCap,q,variant
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+from calendarAggregation import calendarLabels
+
+# Least squares ensembles of the models' hourly ISO-wide generation
+# One pass over the hourly data accumulates, for each (ISO, Year, Quarter, Local Hour, Variant), the normal equations of regressing
+# the reported generation (y) on the models' generation (x, plus a constant 'Intercept' regressor):
+#	n             - number of hours where the reported and all the models' generation are present
+#	Sxx {a} {b}   - sum of the products of regressors a and b (so 'Sxx Intercept {a}' is the sum of a, and 'Sxx Intercept Intercept' is n)
+#	Sxy {a}       - sum of the products of regressor a and the reported generation
+#	Syy           - sum of the squares of the reported generation
+# ('Year' and 'Quarter' are in UTC, as in summaryStatsOfWindModels.py, and 'Local Hour' is in the ISO's time zone)
+# The weights for any coarser grouping (e.g by ISO and Quarter, or by ISO alone) are then fit by summing the accumulators and solving
+# the (regressors x regressors) systems of all groups at once, without rescanning the hourly data.
+# Used by ensembleHourlyGenByIso.py
+
+keyCols = ['Year','Quarter','Local Hour']
+
+# the generation column of model and variant, e.g genCol('HRRR','raw') is 'HRRR Gen MWh (raw)'
+def genCol(model,variant):
+	return f'{model} Gen MWh ({variant})'
+
+# the calendar labels (keyCols) of each hour of an ISO's gmt times
+def hourLabels(gmt,timeZone):
+	utc = calendarLabels(gmt,['Year','Quarter'])
+	local = calendarLabels(gmt,['Hour'],timeZone)
+	return pd.DataFrame({'Year':utc['Year'],'Quarter':utc['Quarter'],'Local Hour':local['Hour']})
+
+# accumulates the normal equations of regressing repCol on the generation of models, for each variant (see genCol)
+# genByIso is indexed by ['ISO','gmt'] (tz-aware or UTC); isoToTimeZone maps each ISO to its time zone
+# returns a DataFrame indexed by ['ISO','Year','Quarter','Local Hour','Variant']
+def accumulateNormalEquations(genByIso,models,variants,isoToTimeZone,repCol='curtAdjustedGen MWh'):
+	regressors = list(models) + ['Intercept']
+	pairs = [(a,b) for i,a in enumerate(regressors) for b in regressors[i:]]
+	accs = {}
+	for iso,gen in genByIso.groupby(level='ISO',sort=True):
+		labels = hourLabels(gen.index.get_level_values('gmt'),isoToTimeZone[iso])
+		codes,groups = pd.MultiIndex.from_frame(labels).factorize()
+		sumByGroup = lambda v: np.bincount(codes,weights=v,minlength=len(groups))
+		y = gen[repCol].to_numpy(dtype=np.float64)
+		stats = {}
+		for variant in variants:
+			x = {model:gen[genCol(model,variant)].to_numpy(dtype=np.float64) for model in models}
+			valid = ~np.isnan(y) & ~np.any([np.isnan(v) for v in x.values()],axis=0)
+			x = {model:np.where(valid,v,0) for model,v in x.items()}
+			x['Intercept'] = valid.astype(np.float64)
+			yv = np.where(valid,y,0)
+			stats[variant] = pd.DataFrame({
+				'n':sumByGroup(valid),
+				**{f'Sxx {a} {b}':sumByGroup(x[a]*x[b]) for a,b in pairs},
+				**{f'Sxy {a}':sumByGroup(x[a]*yv) for a in regressors},
+				'Syy':sumByGroup(yv*yv),
+			},index=groups)
+		accs[iso] = pd.concat(stats,names=['Variant']+keyCols)
+	acc = pd.concat(accs,names=['ISO','Variant']+keyCols)
+	return acc.reorder_levels(['ISO']+keyCols+['Variant']).sort_index()
+
+# fits the least squares weights of models (and an intercept, if fitIntercept) for each group of levels (any of 'ISO' and keyCols) and variant
+# years (if not None) are the years whose hours the weights are fit to
+# returns a DataFrame indexed by levels + ['Variant'] with a column of weights for each model (and 'Intercept'), and the hours fit to ('n')
+# groups with fewer hours than regressors get NaN weights
+def fitWeights(acc,models,levels,fitIntercept=False,years=None):
+	if years is not None:
+		acc = acc[acc.index.get_level_values('Year').isin(years)]
+	s = acc.groupby(level=list(levels)+['Variant']).sum()
+	regressors = list(models) + (['Intercept'] if fitIntercept else [])
+	k = len(regressors)
+	pairCol = lambda a,b: f'Sxx {a} {b}' if f'Sxx {a} {b}' in s.columns else f'Sxx {b} {a}'
+	XtX = np.stack([np.stack([s[pairCol(a,b)].to_numpy() for b in regressors],axis=-1) for a in regressors],axis=-2) # (groups, k, k)
+	Xty = np.stack([s[f'Sxy {a}'].to_numpy() for a in regressors],axis=-1) # (groups, k)
+	weights = (np.linalg.pinv(XtX) @ Xty[...,None])[...,0] # pinv, so collinear models (e.g identical columns) still get weights
+	weights[s['n'].to_numpy() < k] = np.nan
+	weights = pd.DataFrame(weights,index=s.index,columns=regressors)
+	weights['n'] = s['n']
+	return weights
+
+# equal weights of models for each variant, in the format of fitWeights (with levels = [])
+def equalWeights(models,variants):
+	return pd.DataFrame({**{model:1/len(models) for model in models},'n':np.nan},index=pd.Index(variants,name='Variant'))
+
+# blends the models' generation in genByIso with weights (from fitWeights or equalWeights), for each variant
+# returns a DataFrame indexed like genByIso, with a column for each variant named like the models' (see genCol) with model = name
+# hours in groups without weights, or where any of the models is missing, are NaN
+def blendModels(genByIso,weights,models,variants,isoToTimeZone,name='Ensemble'):
+	levels = [level for level in weights.index.names if level != 'Variant']
+	blends = []
+	for iso,gen in genByIso.groupby(level='ISO',sort=False):
+		labels = hourLabels(gen.index.get_level_values('gmt'),isoToTimeZone[iso])
+		labels['ISO'] = iso
+		blend = pd.DataFrame(index=gen.index)
+		for variant in variants:
+			keys = pd.MultiIndex.from_frame(labels[levels].assign(Variant=variant)) if levels else pd.Index([variant]*len(gen),name='Variant')
+			w = weights.reindex(keys)
+			blended = w['Intercept'].to_numpy() if 'Intercept' in w.columns else np.zeros(len(gen))
+			for model in models:
+				blended = blended + w[model].to_numpy() * gen[genCol(model,variant)].to_numpy(dtype=np.float64)
+			blend[genCol(name,variant)] = blended
+		blends.append(blend)
+	return pd.concat(blends).reindex(genByIso.index)
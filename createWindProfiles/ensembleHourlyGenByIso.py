@@ -0,0 +1,89 @@
+import os
+import pandas as pd
+from ensembleEngine import accumulateNormalEquations,fitWeights,equalWeights,blendModels,genCol
+from timeCodec import parseTimes
+from runReport import startRun,beginStage,addToStage,endRun
+
+# run after curtAdjustHourlyGenByIso.py. Adds ensembles of the models' hourly generation to its outputs
+# each ensemble is a weighted blend of the models, with least squares weights fit to 'curtAdjustedGen MWh' by the groups in ensembles (see ensembleEngine.py)
+# all ensembles are fit from the same accumulators, built in a single pass over the hourly data, so adding more blending schemes costs almost nothing
+
+# ----- User Input -----
+isos = ['CAISO','ERCOT','MISO','PJM','SPP','ISONE','NYISO']
+
+models = ['ERA5','MERRA2','HRRR'] # the models blended in the ensembles
+variants = ['raw','density adjusted','density and loss adjusted'] # each variant of the models' generation is blended separately, e.g 'HRRR Gen MWh (raw)' into 'Ensemble Gen MWh (raw)'
+
+# the ensembles to add, by name: the groups their weights are fit by (any of 'ISO', 'Year', 'Quarter', and 'Local Hour'; 'Year' and 'Quarter' are in UTC),
+# [] for a single set of weights for all ISOs and hours, or None for the equal-weight mean of the models
+# each ensemble's columns are named like the models', e.g 'Ensemble Gen MWh (density and loss adjusted)', so it can be added to modelsByYear (and lineColors) in plotDiurnalFigures_allUS.py
+# (ensembles are ISO-wide, so summaryStatsOfWindModels.py, which also needs plant level generation, can't compare them)
+ensembles = {
+	'Ensemble':['ISO','Quarter'],
+}
+fitIntercept = False # if True, the ensembles also have a fitted constant term (in MWh), otherwise they are purely weighted sums of the models
+fitYears = None # if not None, the years whose hours the weights are fit to (e.g to hold out later years for evaluation); otherwise all years are used
+
+genFileForm = 'path/to/hourlyGenByIso/hourlyGen_hrBegAvg_curtAdj_clip995_2018-2021_{ISO}-20230129.csv' # files with curtailment adjusted generation (i.e the outputs of curtAdjustHourlyGenByIso.py)
+genByIsoInMemory = None # if not None, a DataFrame of the curtailment adjusted generation of all ISOs (indexed by ISO and gmt, as computed by curtAdjustHourlyGenByIso.py), used instead of the files in genFileForm (see pipeline.py)
+
+outN = 'path/to/hourlyGenByIso/hourlyGen_hrBegAvg_curtAdj_clip995_ensemble_2018-2021_{ISO}-20230129.csv' # the files in genFileForm, with the ensembles' columns added
+weightsOutN = 'path/to/hourlyGenByIso/ensembleWeights_{ENSEMBLE}-20230129.csv' # the fitted weights of each ensemble (and the hours they were fit to)
+writeOutputs = True # if False, the outputs aren't written to outN (e.g when pipeline.py hands them to the next stages in memory instead)
+
+runReportFile = None # if not None, a JSON file that the wall time, CPU time, peak memory, and rows processed of each stage of this run are written to (see runReport.py)
+profileFolder = None # if not None, each stage is profiled with cProfile and its profile is written to this folder
+# ----------------------
+
+# crosswalk between ISO names and time zomes
+isoToTimeZone = {
+	'CAISO':'US/Pacific',
+	'ERCOT':'US/Central',
+	'MISO' :'US/Central',
+	'PJM'  :'US/Eastern',
+	'SPP'  :'US/Central',
+	'ISONE':'US/Eastern',
+	'NYISO':'US/Eastern'
+}
+
+startRun(os.path.basename(__file__),runReportFile,profileFolder)
+beginStage('load')
+
+# load in the curtailment adjusted generation
+if genByIsoInMemory is not None:
+	genByIso = genByIsoInMemory
+else:
+	genByIso = []
+	for iso in isos:
+		gen = pd.read_csv(genFileForm.format(ISO=iso))
+		gen['gmt'] = parseTimes(gen['gmt'])
+		genByIso.append(gen)
+	genByIso = pd.concat(genByIso).set_index(['ISO','gmt'])
+addToStage(genByIso)
+
+# accumulate the normal equations in one pass, then fit each ensemble's weights from them
+beginStage('fit')
+print('Accumulating normal equations')
+normalEqs = accumulateNormalEquations(genByIso,models,variants,isoToTimeZone)
+
+weights = {}
+for name,levels in ensembles.items():
+	print(f'Fitting {name} weights by {levels}')
+	weights[name] = equalWeights(models,variants) if levels is None else fitWeights(normalEqs,models,levels,fitIntercept,fitYears)
+
+# blend the models with each ensemble's weights, adding the ensembles' columns after the models'
+beginStage('blend')
+genByIso = genByIso.drop(columns=[genCol(name,variant) for name in ensembles for variant in variants],errors='ignore') # e.g if genFileForm is a previous run's outN
+ensembleGens = [blendModels(genByIso,weights[name],models,variants,isoToTimeZone,name) for name in ensembles]
+insertAt = max(genByIso.columns.get_loc(genCol(model,variant)) for model in models for variant in variants) + 1
+genByIso = pd.concat([genByIso.iloc[:,:insertAt]] + ensembleGens + [genByIso.iloc[:,insertAt:]],axis=1)
+addToStage(genByIso)
+
+if writeOutputs:
+	beginStage('write')
+	print('Outputting generation with ensembles and ensemble weights')
+	for name in ensembles:
+		weights[name].to_csv(weightsOutN.format(ENSEMBLE=name))
+	genByIso.groupby('ISO').apply(lambda g: g.to_csv(outN.format(ISO=g.name)))
+
+endRun()
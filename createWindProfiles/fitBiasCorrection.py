@@ -0,0 +1,104 @@
+import os
+import numpy as np
+import pandas as pd
+from biasCorrection import fitQuantileMaps
+from runReport import startRun,beginStage,addToStage,endRun
+
+# run after curtAdjustMonthlyGenByPlant.py. Fits quantile maps from each plant's modelled monthly CFs to its reported (curtailment adjusted) monthly CFs,
+# for each model, which windSpeedsToCF_singleYr.py applies (see biasCorrectionFile there) to add bias corrected CF columns to its outputs
+# the maps of all plants and models are fit at once (see biasCorrection.py)
+
+# ----- User Input -----
+models = ['ERA5','MERRA2','HRRR']
+variant = 'density and loss adjusted' # the variant of the models' generation the maps are fit to (and, in windSpeedsToCF_singleYr.py, applied to)
+
+plantInfoFile = 'path/to/fileWithPlantSpecifics.csv' # file containing, for each plant (indexed by EIA_ID): capacity (MW) and COD year and month
+
+genByPlantFile = 'path/to/MonthlyGenByPlant/monthlyGenByPlant_hrBegAvg_curtAdj_2018-2021-20230129.csv' # monthly modelled and reported generation by plant (i.e the output of curtAdjustMonthlyGenByPlant.py)
+genByPlantInMemory = None # if not None, a DataFrame of the monthly generation by plant (indexed by EIA_ID, Year, and Month, as computed by curtAdjustMonthlyGenByPlant.py), used instead of genByPlantFile
+
+bySeason = True # if True, each plant has a map for each quarter (UTC), otherwise a single map for all months
+nQuantiles = 11 # number of quantiles (knots) of each map, evenly spaced from the minimum (0) to the maximum (1)
+minMonths = 8 # maps fit to fewer months than this aren't used: a plant's quarterly maps fall back to its all-year map, and plants without enough months for that aren't corrected
+excludeFirstYear = True # if True, each plant's first 12 months of operation are left out of the fit, as in summaryStatsOfWindModels.py
+
+mapsOutN = 'path/to/biasCorrection/quantileMaps_2018-2021-20230129.csv' # the fitted maps, indexed by EIA_ID, Quarter (0 for all-year maps), and Model
+
+runReportFile = None # if not None, a JSON file that the wall time, CPU time, peak memory, and rows processed of each stage of this run are written to (see runReport.py)
+profileFolder = None # if not None, each stage is profiled with cProfile and its profile is written to this folder
+# ----------------------
+
+repCol = 'curtAdjustedGen MWh'
+modCols = [f'{model} Gen MWh ({variant})' for model in models]
+
+startRun(os.path.basename(__file__),runReportFile,profileFolder)
+beginStage('load')
+
+plantInfo = pd.read_csv(plantInfoFile,index_col='EIA_ID')
+if genByPlantInMemory is not None:
+	genByPlant = genByPlantInMemory.reset_index()
+else:
+	genByPlant = pd.read_csv(genByPlantFile)
+genByPlant = genByPlant[genByPlant['EIA_ID'].isin(plantInfo.index[plantInfo['USWTDB-MW'].notna()])]
+
+# exclude the first 12 months of operation for each plant, and months where reported generation is 0, negative, or missing
+monthStart = pd.to_datetime(genByPlant[['Year','Month']].assign(day=1))
+if excludeFirstYear:
+	cods = pd.to_datetime(plantInfo.loc[genByPlant['EIA_ID'],['eia_COD_Year','eia_COD_Month']].rename(columns={'eia_COD_Year':'year','eia_COD_Month':'month'}).assign(day=1)).to_numpy()
+	genByPlant = genByPlant[monthStart.to_numpy() >= cods + np.timedelta64(366,'D')]
+	monthStart = monthStart.loc[genByPlant.index]
+genByPlant = genByPlant[genByPlant[repCol] > 0]
+monthStart = monthStart.loc[genByPlant.index]
+addToStage(genByPlant)
+
+# monthly CFs: monthly generation / (capacity x hours in the month)
+beginStage('fit')
+hoursInMonth = (monthStart.dt.days_in_month * 24).to_numpy()
+capacity = plantInfo.loc[genByPlant['EIA_ID'],'USWTDB-MW'].to_numpy()
+modelCFs = genByPlant[modCols].to_numpy(dtype=np.float64) / (capacity*hoursInMonth)[:,None]
+reportedCFs = genByPlant[repCol].to_numpy(dtype=np.float64) / (capacity*hoursInMonth)
+
+# lays the months of each group (plant, or plant and quarter) out in a dense (models, groups, months) array, padded with NaN
+def denseByGroup(groupKeys):
+	codes,groups = pd.MultiIndex.from_arrays(groupKeys).factorize()
+	slot = pd.Series(codes).groupby(codes).cumcount().to_numpy() # position of each month within its group
+	modelled = np.full((len(models),len(groups),slot.max()+1),np.nan)
+	reported = np.full((len(groups),slot.max()+1),np.nan)
+	modelled[:,codes,slot] = modelCFs.T
+	reported[codes,slot] = reportedCFs
+	return groups,modelled,reported
+
+# fits the maps of every model and group at once, returning them as a DataFrame indexed by EIA_ID, Quarter, and Model
+def fitMaps(groups,modelled,reported,quarters):
+	modelKnots,reportedKnots,n = fitQuantileMaps(modelled,np.broadcast_to(reported,modelled.shape),nQuantiles)
+	index = pd.MultiIndex.from_arrays([
+		np.tile(groups.get_level_values(0),len(models)),
+		np.tile(quarters,len(models)),
+		np.repeat(models,len(groups)),
+	],names=['EIA_ID','Quarter','Model'])
+	maps = pd.DataFrame(np.hstack([modelKnots.reshape(-1,nQuantiles),reportedKnots.reshape(-1,nQuantiles)]),index=index,
+		columns=[f'model q{i}' for i in range(nQuantiles)] + [f'reported q{i}' for i in range(nQuantiles)])
+	maps.insert(0,'n',n.ravel())
+	return maps
+
+eiaIds = genByPlant['EIA_ID'].to_numpy()
+groups,modelled,reported = denseByGroup([eiaIds])
+print(f'Fitting all-year quantile maps of {len(groups)} plants x {len(models)} models')
+maps = fitMaps(groups,modelled,reported,np.zeros(len(groups),dtype=int))
+maps = maps[maps['n'] >= minMonths]
+
+if bySeason:
+	groups,modelled,reported = denseByGroup([eiaIds,monthStart.dt.quarter.to_numpy()])
+	print(f'Fitting quarterly quantile maps of {len(groups)} plant-quarters x {len(models)} models')
+	quarterlyMaps = fitMaps(groups,modelled,reported,groups.get_level_values(1))
+	quarterlyMaps = quarterlyMaps[quarterlyMaps['n'] >= minMonths]
+	# quarters without enough months use the plant's all-year map
+	allQuarters = pd.MultiIndex.from_tuples([(eiaId,quarter,model) for eiaId,_,model in maps.index for quarter in range(1,5)],names=maps.index.names)
+	fallback = maps.reset_index('Quarter',drop=True).reindex(allQuarters.droplevel('Quarter')).set_axis(allQuarters)
+	maps = quarterlyMaps.combine_first(fallback).dropna(how='all')
+maps['Variant'] = variant
+addToStage(maps)
+
+beginStage('write')
+maps.sort_index().to_csv(mapsOutN)
+endRun()
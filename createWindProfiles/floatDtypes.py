@@ -0,0 +1,9 @@
+import numpy as np
+
+# Float dtype helpers shared by the scripts with a compactDtypes option (see compactDtypesAccuracyReport.py)
+
+# casts a DataFrame's float64 columns to floatDtype (e.g np.float32), in place, and returns it
+def compactFloats(df,floatDtype):
+	floatCols = df.columns[df.dtypes == np.float64]
+	df[floatCols] = df[floatCols].astype(floatDtype)
+	return df
@@ -1,6 +1,10 @@
 import os
+import sys
 import numpy as np
 import pandas as pd
+from calendarAggregation import segmentStarts
+from timeCodec import parseTimes,hourOffsets,civilHours,toTimestamps
+from runReport import startRun,beginStage,addToStage,endRun
 
 # ----- User Input -----
 years = [2018,2019,2020,2021]
@@ -13,7 +17,9 @@ modelsByYear = ['MERRA2','ERA5','HRRR']
 hourBegAvg = True # True if the models in instantModels should have their generation hour-beginning averaged, False otherwise
 instantModels = ['ERA5','HRRR'] # only populate if hourBegAvg is True. Otherwise, this variable is not used
 
+plantIds = None # if not None, a list of the EIA_IDs to include (e.g a shard's plants, see shardedRun.py); the other plants are left out as if they didn't pass the filters below
 plantInfoFile = 'path/to/fileWithPlantSpecifics.csv' # file containing, for each plant (indexed by EIA_ID): capacity (MW), the ISO it is in, the COD year and month, and whether the plant was retrofitted in a given year or not
+capacityCol = 'USWTDB-MW' # column of plantInfoFile with each plant's capacity (MW). Capacities only weight the plants' CFs in the ISO-hourly sums, so they can be corrected without regenerating the profiles
 
 reportedGenFile = 'path/to/fileWithReportedISOWideHourlyGeneration.csv' # file with hourly ISO-wide generation from 2012-2020
 
@@ -25,10 +31,23 @@ eia923FileFormat = 'path/to/EIAForm923FilesByYear/formatted_EIA923_Schedules_2_3
 reportedGen2021File = 'path/to/fileWithReportedISOWideHourlyGeneration2021.csv' # file with hourly ISO-wide generation in 2021
 gen2021Folder = 'path/to/modelledGenProfiles2021/ERA5_MERRA2_HRRR_windSpeedAndCF_2021' # folder with the modelled generation profiles for each plant, 2021
 gen2021ProfFormat = '{EIA_ID}_{YEAR}.csv'
+genProfsInMemory = None # if not None, a dict mapping each year to a dict mapping each EIA_ID to its modelled CFs (indexed by gmt, as computed by windSpeedsToCF_singleYr.py), used instead of the files in genProfFolder and gen2021Folder (see pipeline.py)
 
 outN = './../out/HourlyGenByIso/hourlyGen_hrBegAvg_preCurtAdj_2018-2021_{ISO}-20230129.csv'
+writeOutputs = True # if False, the outputs aren't written to outN (e.g when pipeline.py hands them to the next stage in memory instead)
+
+# if None, all plants' modelled generation is loaded in at once (uses the most memory)
+# if an int, plants are loaded in, processed, and summed into ISO-hourly totals that many plants at a time, and their plant level data is discarded after each batch
+# so peak memory scales with the number of ISOs x hours instead of the number of plants
+streamBatchSize = None
+
+compactDtypes = False # if True, modelled and reported generation are held as float32 instead of float64, roughly halving memory use
+runReportFile = None # if not None, a JSON file that the wall time, CPU time, peak memory, and rows processed of each stage of this run are written to (see runReport.py)
+profileFolder = None # if not None, each stage is profiled with cProfile and its profile is written to this folder
 # ----------------------
 
+floatDtype = np.float32 if compactDtypes else np.float64
+
 # crosswalk between BA names of ISOs and the ISO names
 baToIso = {
 	'CISO':'CAISO',
@@ -57,19 +76,24 @@ if not isinstance(modelsByYear,dict):
 
 ### Part 1: Load in, filter, and format data ###
 
+startRun(os.path.basename(__file__),runReportFile,profileFolder)
+beginStage('load')
+
 # load in plant info
 plantInfo = pd.read_csv(plantInfoFile,index_col='EIA_ID')
 
 # load in reported ISO-wide generation
 print('Loading in reported ISO-wide generation')
 
-repGen = pd.read_csv(reportedGenFile,index_col=0,parse_dates=True,infer_datetime_format=True) # for 2018-2020
+repGen = pd.read_csv(reportedGenFile,index_col=0) # for 2018-2020
+repGen.index = parseTimes(repGen.index)
 repGen.index.rename('gmt',inplace=True)
 repGen.columns.rename('ISO',inplace=True)
 
 # the 2021 reported gen is separate from the other reported gen
 ### So I load it in separately and concatenate it with the rest of the reported gen
-repGen2021 = pd.read_csv(reportedGen2021File,index_col=0,parse_dates=True,infer_datetime_format=True)
+repGen2021 = pd.read_csv(reportedGen2021File,index_col=0)
+repGen2021.index = parseTimes(repGen2021.index)
 repGen2021.index.rename('gmt',inplace=True)
 repGen2021.columns.rename('ISO',inplace=True)
 
@@ -79,7 +103,8 @@ repGen = repGen.combine_first(repGen2021)
 # in our specific situation, this is the desired behavior as in the overlapping hours,
 # repGen is not NaN if and only if repGen2021 is NaN
 
-repGen = repGen[repGen.index.year.isin(years)]
+repGen = repGen[repGen.index.year.isin(years)].astype(floatDtype)
+addToStage(repGen)
 
 # load in EIA 923 data
 print('Loading in EIA 923 data')
@@ -98,7 +123,7 @@ eia923 = pd.concat(eia923,names=['Year'])
 """
 Filter the plant list: for each year, choose only plants that
 	* are in CAISO (CISO), ERCOT (ERCO), MISO, SPP (SWPP), PJM, ISONE (ISNE), or NYISO (NYIS)
-	* we have MW capacity for (used to turn modelled CFs into generation)
+	* we have MW capacity for (used to weight modelled CFs into generation)
 	* we have a COD for
 	* have a CF between 20% and 70% (inclusive) according to EIA 923 data
 	* aren't repowered in the year of interest (but are included in later years) 
@@ -108,12 +133,14 @@ Filter the plant list: for each year, choose only plants that
 We also drop all hours of modelled generation that are before a plant's COD
 """
 
+beginStage('screening')
+
 # calculates the CF of a plant in a given year according to that year's EIA 923 data
 def CF(eiaId,yr):
 	if (yr,eiaId) not in eia923.index or eiaId not in plantInfo.index:
 		return np.nan
 	hoursIY = 8784 if yr % 4 == 0 and not (yr % 100 == 0 and yr % 400 != 0) else 8760
-	return eia923.loc[(yr,eiaId),eiaGenCols].sum() / (hoursIY * plantInfo.loc[eiaId,'USWTDB-MW'])
+	return eia923.loc[(yr,eiaId),eiaGenCols].sum() / (hoursIY * plantInfo.loc[eiaId,capacityCol])
 
 eia923CF = np.vectorize(CF,excluded = ['yr']) # excluded = ['yr'] means only the eiaId parameter will be vectorized
 
@@ -124,7 +151,7 @@ def filterPlantList(year):
 	# choose plants that are in CAISO (CISO), ERCOT (ERCO), MISO, SPP (SWPP), PJM, ISONE (ISNE), or NYISO (NYIS)
 	inAnIso = plantInfo['eia_ba'].isin(baToIso.keys()).values
 	# choose plants we have MW capacity for
-	haveCapacity = plantInfo['USWTDB-MW'].notna().values
+	haveCapacity = plantInfo[capacityCol].notna().values
 	# choose plants we have a COD for
 	haveCODYear = plantInfo['eia_COD_Year'].notna().values
 	haveCODMonth = plantInfo['eia_COD_Month'].notna().values
@@ -147,72 +174,8 @@ def filterPlantList(year):
 print('Filtering plant lists')
 
 plantLists = {yr:filterPlantList(yr) for yr in years}
-
-# load in modelled generations for all plants in plantList
-print('Loading in modelled generation')
-
-def columnsToLoadIn(year):
-	modCFCols = ([f'{model} CF (raw)' for model in modelsByYear[year]]
-		     + [f'{model} CF (density adjusted)' for model in modelsByYear[year]]
-		     + [f'{model} CF (density and loss adjusted)' for model in modelsByYear[year]])
-	return modCFCols+['gmt']
-
-modGen = {}
-for year in years:
-	if year == 2021:
-		# 2021's modelled generation is in a different format from the other years
-		# so I handle it in a separate part of the code below
-		continue
-	cols = columnsToLoadIn(year)
-	for i,eiaId in enumerate(plantLists[year]):
-		fName = genProfFormat.format(EIA_ID=eiaId,YEAR=year)
-		if not os.path.exists(os.path.join(genProfFolder,fName)):
-			continue
-		if i % 100 == 0: print(f'{i}/{len(plantLists[year])} generation profiles done for {year}')
-		genProf = pd.read_csv(os.path.join(genProfFolder,fName),usecols=cols)
-		genProf['gmt'] = pd.to_datetime(genProf['gmt'],format='%Y%m%d%H',utc=True)
-		modGen[(year,eiaId)] = genProf.set_index('gmt')
-
-
-# Now I load in 2021's modelled generation
-cols2021 = columnsToLoadIn(2021)
-for i,eiaId in enumerate(plantLists[2021]):
-	fName = gen2021ProfFormat.format(EIA_ID=eiaId,YEAR=2021)
-	if not os.path.exists(os.path.join(gen2021Folder,fName)):
-		continue
-	if i % 100 == 0: print(f'{i}/{len(plantLists[2021])} generation profiles done for year 2021')
-	genProf = pd.read_csv(os.path.join(gen2021Folder,fName),usecols=cols2021)
-	genProf['gmt'] = pd.to_datetime(genProf['gmt'],format='%Y%m%d%H',utc=True)
-	modGen[(2021,eiaId)] = genProf.set_index('gmt')
-
-
-modGen = pd.concat(modGen,names=['Year','EIA_ID'])
-modGen.sort_index(inplace=True) # improves performance later
-
-# drop hours of modelled generation before a plant's COD
-
-# first we create a Series with all of the CODs
-modPlants = modGen.index.get_level_values('EIA_ID')
-cods = plantInfo.loc[modPlants,['eia_COD_Year','eia_COD_Month']]
-cods.rename(columns={'eia_COD_Year':'year','eia_COD_Month':'month'},inplace=True) # required for pd.to_datetime to work nicely
-cods['day'] = 1
-cods = pd.to_datetime(cods,utc=True)
-# now we only choose hours after a plant's COD
-modGen = modGen[modGen.index.get_level_values('gmt') >= cods]
-
-# update plantLists to reflect which plants we can't use because we don't have modelled generation data for them
-for year in years:
-	plantLists[year] = modGen.loc[year].index.unique(level='EIA_ID')
-
-# modGen currently only has CF data, not generation data
-# turn modGen's CF data into generation data
-# do this inplace because otherwise modGen uses too much memory
-caps = plantInfo.loc[modGen.index.get_level_values('EIA_ID'),'USWTDB-MW']
-for cfCol in modGen.columns:
-	modGen[cfCol] = modGen[cfCol].mul(caps.to_numpy(),axis=0)
-
-modGenCols = [c.replace('CF','Gen MWh') for c in modGen.columns]
-modGen.rename(columns=dict(zip(modGen.columns,modGenCols)),inplace=True)
+if plantIds is not None:
+	plantLists = {yr:pl[pl.isin(plantIds)] for yr,pl in plantLists.items()}
 
 # turn the reported generation's 0s into NaNs so that they will be interpolated over
 # this is because, as of 2022-08-31, there are anomalous zeros in the reported generation where some hours are 0 despite the surrounding hours being nowhere close to zero
@@ -220,63 +183,234 @@ modGen.rename(columns=dict(zip(modGen.columns,modGenCols)),inplace=True)
 
 repGen.replace(0,np.nan,inplace=True)
 
-# NOTE Start of quick Spot Checking
-# count longest run of NaNs per EIA_ID
-print('counting length of NaN runs to ensure interpolation is the right nan-filling method')
+# count longest run of NaNs in a Series
 def longestNaN(g):
 	isna = g.isna()
 	runs = isna*(g.groupby((isna != isna.shift()).cumsum()).cumcount()+1)
 	return runs.max()
 
-rawNanRuns = modGen['HRRR Gen MWh (raw)'].groupby('EIA_ID').apply(longestNaN)
-daNanRuns = modGen['HRRR Gen MWh (density adjusted)'].groupby('EIA_ID').apply(longestNaN)
-dlaNanRuns = modGen['HRRR Gen MWh (density and loss adjusted)'].groupby('EIA_ID').apply(longestNaN)
-
-print('max length of run of consecutive NaNs in HRRR raw:',rawNanRuns.max())
-print('max length of run of consecutive NaNs in HRRR da:',daNanRuns.max())
-print('max length of run of consecutive NaNs in HRRR dla:',dlaNanRuns.max())
+# NOTE quick Spot Check: make sure interpolation is the right nan-filling method for the reported gen
 print('max length of run of consecutive NaNs in reported gen:',repGen.apply(longestNaN,axis=0).max())
+assert (repGen.index.shift(1,freq='h')-repGen.index == pd.Timedelta(hours=1)).all()
+
+if repGen.isna().any().any():
+	print('Reported Gen has missing values, so interpolating them')
+	repGen = repGen.interpolate(method='time')
+
+### Part 2: Load in, process, and aggregate modelled generation ###
+
+# load in modelled generations for all plants in plantLists
+# returns None if none of the plants have a modelled generation profile
+def columnsToLoadIn(year):
+	modCFCols = ([f'{model} CF (raw)' for model in modelsByYear[year]]
+		     + [f'{model} CF (density adjusted)' for model in modelsByYear[year]]
+		     + [f'{model} CF (density and loss adjusted)' for model in modelsByYear[year]])
+	return modCFCols+['gmt']
+
+# loads in the modelled CFs (cols, plus 'gmt') of a plant in a year, from genProfsInMemory if given and otherwise from its file in folder
+# returns None if the plant has no modelled generation profile
+def loadGenProf(year,eiaId,cols,folder,fileFormat):
+	if genProfsInMemory is not None:
+		genProf = genProfsInMemory.get(year,{}).get(eiaId)
+		if genProf is None:
+			return None
+		genProf = genProf[[c for c in genProf.columns if c in cols]].astype(floatDtype) # in the same column order as reading the file with usecols
+		genProf.index = genProf.index.tz_localize('UTC')
+		return genProf
+	fName = fileFormat.format(EIA_ID=eiaId,YEAR=year)
+	if not os.path.exists(os.path.join(folder,fName)):
+		return None
+	genProf = pd.read_csv(os.path.join(folder,fName),usecols=cols,dtype=dict.fromkeys(cols[:-1],floatDtype))
+	genProf['gmt'] = parseTimes(genProf['gmt'])
+	return genProf.set_index('gmt')
+
+def loadModGen(plantLists):
+	modGen = {}
+	for year in years:
+		if year == 2021:
+			# 2021's modelled generation is in a different format from the other years
+			# so I handle it in a separate part of the code below
+			continue
+		cols = columnsToLoadIn(year)
+		for i,eiaId in enumerate(plantLists[year]):
+			genProf = loadGenProf(year,eiaId,cols,genProfFolder,genProfFormat)
+			if genProf is None:
+				continue
+			if i % 100 == 0: print(f'{i}/{len(plantLists[year])} generation profiles done for {year}')
+			modGen[(year,eiaId)] = genProf
+
+	# Now I load in 2021's modelled generation
+	if 2021 in years:
+		cols2021 = columnsToLoadIn(2021)
+		for i,eiaId in enumerate(plantLists[2021]):
+			genProf = loadGenProf(2021,eiaId,cols2021,gen2021Folder,gen2021ProfFormat)
+			if genProf is None:
+				continue
+			if i % 100 == 0: print(f'{i}/{len(plantLists[2021])} generation profiles done for year 2021')
+			modGen[(2021,eiaId)] = genProf
+
+	if len(modGen) == 0:
+		return None
+
+	modGen = pd.concat(modGen,names=['Year','EIA_ID'])
+	modGen.sort_index(inplace=True) # improves performance later
+
+	# drop hours of modelled generation before a plant's COD
+
+	# first we find the hour (since the epoch, see timeCodec.py) each plant's COD month starts, once per plant
+	modPlants = modGen.index.get_level_values('EIA_ID')
+	plants,plantPos = np.unique(modPlants,return_inverse=True)
+	cods = civilHours(plantInfo.loc[plants,'eia_COD_Year'].to_numpy(dtype=np.int64),plantInfo.loc[plants,'eia_COD_Month'].to_numpy(dtype=np.int64))
+	# now we only choose hours after a plant's COD
+	return modGen[hourOffsets(modGen.index.get_level_values('gmt')) >= cods[plantPos]]
+
+# NOTE Start of quick Spot Checking
+# count longest run of NaNs per EIA_ID, to ensure interpolation is the right nan-filling method
+# returns the longest run for each of the HRRR columns, so the runs of several plant batches can be combined
+spotCheckCols = ['HRRR CF (raw)','HRRR CF (density adjusted)','HRRR CF (density and loss adjusted)']
+def longestNaNRuns(modGen):
+	return pd.Series({col:modGen[col].groupby('EIA_ID').apply(longestNaN).max() for col in spotCheckCols if col in modGen.columns})
+
+def printLongestNaNRuns(nanRuns):
+	for col,gtype in zip(spotCheckCols,['raw','da','dla']):
+		if col in nanRuns.index:
+			print(f'max length of run of consecutive NaNs in HRRR {gtype}:',nanRuns[col])
 
 # guarantee the index for each plant goes up by 1 hour each loc
 oneHour = pd.Timedelta(hours=1)
 def idxBy1hour(g):
 	g2 = g.reset_index(['Year','EIA_ID'],drop=True)
-	return ((g2.index.shift(1,freq='H') - g2.index) == oneHour).all()
-
-assert modGen.groupby('EIA_ID').apply(idxBy1hour).all()
-
-assert (repGen.index.shift(1,freq='H')-repGen.index == pd.Timedelta(hours=1)).all()
+	return ((g2.index.shift(1,freq='h') - g2.index) == oneHour).all()
 # NOTE End of quick Spot Checking
 
-# interpolate missing values
-print('Interpolating missing values')
-colsWithNaNs = [c for c in modGen.columns if modGen[c].hasnans]
-print(f'{colsWithNaNs} have missing values, so interpolating them')
-modGen[colsWithNaNs] = modGen[colsWithNaNs].groupby('EIA_ID').transform(lambda g: g.reset_index(['Year','EIA_ID'],drop=True).interpolate(method='time'))
+# interpolate missing values and, if hourBegAvg, hour-beginning average the instantaneous models
+# both are done per plant, so a batch of plants can be processed independently of the other plants
+# both are linear, so doing them on the CFs gives the same generation as doing them on generation
+def interpolateAndAverage(modGen):
+	colsWithNaNs = [c for c in modGen.columns if modGen[c].hasnans]
+	if colsWithNaNs:
+		print(f'{colsWithNaNs} have missing values, so interpolating them')
+		modGen[colsWithNaNs] = modGen[colsWithNaNs].groupby('EIA_ID').transform(lambda g: g.reset_index(['Year','EIA_ID'],drop=True).interpolate(method='time')).astype(floatDtype)
+
+	if hourBegAvg:
+		# find hour-beginning average gen for specified models
+		def hourBeginningAvg(g):
+			return (g + g.shift(-1,fill_value=g.iloc[-1]))/2
+
+		# hourBeginningAvg(g) could also be implemented as:
+		# def hourBeginningAvg(g):
+		# 	return g.rolling(2).mean().shift(-1).fillna(g.iloc[-1])
+
+		for model in instantModels:
+			cols = [f'{model} CF (raw)',f'{model} CF (density adjusted)',f'{model} CF (density and loss adjusted)']
+			for col in cols:
+				if col in modGen.columns:
+					modGen[col] = modGen[col].groupby('EIA_ID').transform(hourBeginningAvg)
+	return modGen
+
+# aggregate modelled plant level CFs into hourly ISO-wide generation totals (MWh)
+# each plant's capacity weights its CFs inside the sums (sum of capacity x CF), so modGen is never scaled into generation itself:
+# capacities and ISOs are looked up once per plant and repeated over its rows, and each column is summed into (ISO, hour) bins with np.bincount
+# missing values count as 0, and only the (ISO, hour)s with modelled rows are returned, as in a groupby(['ISO','gmt'],observed=True).sum()
+def aggregateByIso(modGen):
+	plants = modGen.index.get_level_values('EIA_ID').to_numpy()
+	starts = segmentStarts([modGen.index.get_level_values('Year').to_numpy(),plants]) # rows of each plant-year
+	lengths = np.diff(np.append(starts,len(modGen)))
+	isoCodes = pd.Categorical(plantInfo.loc[plants[starts],'eia_ba'].replace(baToIso),categories=list(isoToTimeZone)).codes
+	assert (isoCodes >= 0).all()
+	caps = np.repeat(plantInfo.loc[plants[starts],capacityCol].to_numpy(dtype=np.float64),lengths)
+
+	hours = hourOffsets(modGen.index.get_level_values('gmt'))
+	firstHour = hours.min()
+	nHours = hours.max() - firstHour + 1
+	bins = np.repeat(isoCodes.astype(np.int64),lengths)*nHours + (hours - firstHour)
+	observed = np.flatnonzero(np.bincount(bins,minlength=len(isoToTimeZone)*nHours))
+
+	genByIso = {}
+	for cfCol in modGen.columns:
+		cfs = modGen[cfCol].to_numpy()
+		sums = np.bincount(bins,weights=np.where(np.isnan(cfs),0,cfs)*caps,minlength=len(isoToTimeZone)*nHours)
+		genByIso[cfCol.replace('CF','Gen MWh')] = sums[observed].astype(floatDtype)
+	idx = pd.MultiIndex.from_arrays([
+		pd.CategoricalIndex(pd.Categorical.from_codes(observed // nHours,categories=list(isoToTimeZone))),
+		toTimestamps(firstHour + observed % nHours),
+	],names=['ISO','gmt'])
+	return pd.DataFrame(genByIso,index=idx)
+
+if streamBatchSize is None:
+	beginStage('load')
+	print('Loading in modelled generation')
+	modGen = loadModGen(plantLists)
+	if modGen is None:
+		# none of the plants have a modelled generation profile (e.g a shard none of whose plants pass the filters), so stop without any output
+		print('None of the plants have a modelled generation profile')
+		genByIso = None
+		endRun()
+		sys.exit()
+	addToStage(modGen)
+
+	# update plantLists to reflect which plants we can't use because we don't have modelled generation data for them
+	for year in years:
+		plantLists[year] = modGen.index.get_level_values('EIA_ID')[modGen.index.get_level_values('Year') == year].unique() # (empty if none of the plants have a profile in year, e.g in a shard)
+
+	beginStage('screening')
+	printLongestNaNRuns(longestNaNRuns(modGen))
+	assert modGen.groupby('EIA_ID').apply(idxBy1hour).all()
+
+	beginStage('interpolation')
+	print('Interpolating missing values')
+	if hourBegAvg: print('Hour-beginning Averaging generation for:',instantModels)
+	modGen = interpolateAndAverage(modGen)
+	addToStage(modGen)
+
+	beginStage('aggregation')
+	genByIso = aggregateByIso(modGen)
+else:
+	# Streaming mode: load in, process, and aggregate streamBatchSize plants at a time
+	# each batch holds all years for its plants, so the per-plant interpolation and hour-beginning averaging
+	# see the same data as when all plants are loaded at once (including across year boundaries)
+	# only the ISO-hourly partial sums are kept between batches, so peak memory scales with #ISOs x #hours (plus one batch)
+	allPlants = pd.Index(sorted(set().union(*plantLists.values())))
+	nBatches = -(-len(allPlants) // streamBatchSize) # ceiling division
+	modelledPlants = {year:[] for year in years}
+	nanRuns = pd.Series(dtype=float)
+	genByIso = None
+	for b in range(nBatches):
+		batch = allPlants[b*streamBatchSize:(b+1)*streamBatchSize]
+		print(f'Loading in, processing, and aggregating modelled generation for plant batch {b+1}/{nBatches}')
+		batchPlantLists = {yr:pl[pl.isin(batch)] for yr,pl in plantLists.items()}
+		beginStage('load')
+		modGen = loadModGen(batchPlantLists)
+		if modGen is None or len(modGen) == 0:
+			continue
+		addToStage(modGen)
 
-if repGen.isna().any().any():
-	print('Reported Gen has missing values, so interpolating them')
-	repGen = repGen.interpolate(method='time')
+		for year in modGen.index.unique(level='Year'):
+			modelledPlants[year].extend(modGen.loc[year].index.unique(level='EIA_ID'))
 
-if hourBegAvg:
-	print('Hour-beginning Averaging generation for:',instantModels)
-	# find hour-beginning average gen for specified models
-	def hourBeginningAvg(g):
-		return (g + g.shift(-1,fill_value=g.iloc[-1]))/2
+		beginStage('screening')
+		nanRuns = nanRuns.combine(longestNaNRuns(modGen),max,fill_value=0)
+		assert modGen.groupby('EIA_ID').apply(idxBy1hour).all()
 
-	# hourBeginningAvg(g) could also be implemented as:
-	# def hourBeginningAvg(g):
-	# 	return g.rolling(2).mean().shift(-1).fillna(g.iloc[-1])
+		beginStage('interpolation')
+		modGen = interpolateAndAverage(modGen)
+		addToStage(modGen)
 
-	for model in instantModels:
-		cols = [f'{model} Gen MWh (raw)',f'{model} Gen MWh (density adjusted)',f'{model} Gen MWh (density and loss adjusted)']
-		for col in cols:
-			modGen[col] = modGen[col].groupby('EIA_ID').transform(hourBeginningAvg)
+		beginStage('aggregation')
+		partialGenByIso = aggregateByIso(modGen)
+		genByIso = partialGenByIso if genByIso is None else genByIso.add(partialGenByIso,fill_value=0)
+		del modGen,partialGenByIso # discard the plant level data before loading in the next batch
 
-# aggregate modelled plant level generation into hourly ISO-wide totals
-modGen['ISO'] = plantInfo.loc[modGen.index.get_level_values('EIA_ID'),'eia_ba'].replace(baToIso).values
-modGen['ISO'] = modGen['ISO'].astype('category') # to reduce memory load
-genByIso = modGen.groupby(['ISO','gmt'])[modGenCols].sum()
+	# update plantLists to reflect which plants we can't use because we don't have modelled generation data for them
+	plantLists = {yr:pd.Index(pl,name='EIA_ID') for yr,pl in modelledPlants.items()}
+	if genByIso is None:
+		# none of the plants have a modelled generation profile (e.g a shard none of whose plants pass the filters), so stop without any output
+		print('None of the plants have a modelled generation profile')
+		endRun()
+		sys.exit()
+	printLongestNaNRuns(nanRuns)
+
+modGenCols = list(genByIso.columns)
 
 # add reported gen as a column to genByIso so that all generation data is in a single DataFrame
 repGen = repGen.stack().reorder_levels(['ISO','gmt']).sort_index()
@@ -287,4 +421,9 @@ assert genByIso.notna().all().all()
 #genByIso.dropna(inplace=True)
 
 # Split genByIso by ISO and output to CSVs
-genByIso.groupby('ISO').apply(lambda g: g.to_csv(outN.format(ISO=g.name)))
+if writeOutputs:
+	beginStage('write')
+	genByIso.groupby('ISO',observed=True).apply(lambda g: g.to_csv(outN.format(ISO=g.name)))
+	addToStage(genByIso)
+
+endRun()
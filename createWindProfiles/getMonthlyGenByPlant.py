@@ -1,6 +1,10 @@
 import os
+import sys
 import numpy as np
 import pandas as pd
+from calendarAggregation import rollup
+from timeCodec import parseTimes,hourOffsets,civilHours
+from runReport import startRun,beginStage,addToStage,endRun
 
 # ----- User Input -----
 years = [2018,2019,2020,2021]
@@ -13,7 +17,9 @@ modelsByYear = ['ERA5','MERRA2','HRRR']
 hourBegAvg = True # True if the models in instantModels should have their generation hour-beginning averaged, False otherwise
 instantModels = ['ERA5','HRRR'] # only populate if hourBegAvg is True. Otherwise, this variable is not used
 
+plantIds = None # if not None, a list of the EIA_IDs to include (e.g a shard's plants, see shardedRun.py); the other plants are left out as if they didn't pass the filters below
 plantInfoFile = 'path/to/fileWithPlantSpecifics.csv' # file containing, for each plant (indexed by EIA_ID): capacity (MW), the ISO it is in, the COD year and month, and whether the plant was retrofitted in a given year or not
+capacityCol = 'USWTDB-MW' # column of plantInfoFile with each plant's capacity (MW). Capacities are only applied to the plants' monthly CF sums, so they can be corrected without regenerating the profiles
 
 genProfFolder = 'path/to/modelledGenProfiles/ERA5_MERRA2_HRRR_windSpeedAndCF_2018-2020' # folder with the modelled generation profiles for each plant, 2018-2020
 genProfFormat = '{EIA_ID}_{YEAR}.csv' # file name format for each modelled generation profile
@@ -22,10 +28,18 @@ eia923FileFormat = 'path/to/EIAForm923FilesByYear/formatted_EIA923_Schedules_2_3
 
 gen2021Folder = 'path/to/modelledGenProfiles2021/ERA5_MERRA2_HRRR_windSpeedAndCF_2021' # folder with the modelled generation profiles for each plant, 2021
 gen2021ProfFormat = '{EIA_ID}_{YEAR}.csv'
+genProfsInMemory = None # if not None, a dict mapping each year to a dict mapping each EIA_ID to its modelled CFs (indexed by gmt, as computed by windSpeedsToCF_singleYr.py), used instead of the files in genProfFolder and gen2021Folder (see pipeline.py)
 
 outN = './../out/MonthlyGenByPlant/monthlyGenByPlant_hrBegAvg_preCurtAdj_2018-2021-20230129.csv'
+writeOutputs = True # if False, the outputs aren't written to outN (e.g when pipeline.py hands them to the next stage in memory instead)
+
+compactDtypes = False # if True, modelled generation is held as float32 instead of float64, roughly halving memory use
+runReportFile = None # if not None, a JSON file that the wall time, CPU time, peak memory, and rows processed of each stage of this run are written to (see runReport.py)
+profileFolder = None # if not None, each stage is profiled with cProfile and its profile is written to this folder
 # ----------------------
 
+floatDtype = np.float32 if compactDtypes else np.float64
+
 # crosswalk between BA names of ISOs and the ISO names
 baToIso = {
 	'CISO':'CAISO',
@@ -54,6 +68,9 @@ if not isinstance(modelsByYear,dict):
 
 ### Part 1: Load in, filter, and format data ###
 
+startRun(os.path.basename(__file__),runReportFile,profileFolder)
+beginStage('load')
+
 # load in plant info
 plantInfo = pd.read_csv(plantInfoFile,index_col='EIA_ID')
 
@@ -74,7 +91,7 @@ eia923 = pd.concat(eia923,names=['Year'])
 """
 Filter the plant list: for each year, choose only plants that
 	* are in CAISO (CISO), ERCOT (ERCO), MISO, SPP (SWPP), PJM, ISONE (ISNE), or NYISO (NYIS)
-	* we have MW capacity for (used to turn modelled CFs into generation)
+	* we have MW capacity for (used to weight modelled CFs into generation)
 	* we have a COD for
 	* have a CF (according to EIA923 data) between 20% and 70% inclusive
 	* aren't repowered in any year **** NOTE: This is different from getHourlyGenByIso.py! ****
@@ -83,12 +100,14 @@ Filter the plant list: for each year, choose only plants that
 We also drop all hours of modelled generation that are before a plant's COD
 """
 
+beginStage('screening')
+
 # calculates the CF of a plant in a given year according to that year's EIA 923 data
 def CF(eiaId,yr):
 	if (yr,eiaId) not in eia923.index or eiaId not in plantInfo.index:
 		return np.nan
 	hoursIY = 8784 if yr % 4 == 0 and not (yr % 100 == 0 and yr % 400 != 0) else 8760
-	return eia923.loc[(yr,eiaId),eiaGenCols].sum() / (hoursIY * plantInfo.loc[eiaId,'USWTDB-MW'])
+	return eia923.loc[(yr,eiaId),eiaGenCols].sum() / (hoursIY * plantInfo.loc[eiaId,capacityCol])
 
 eia923CF = np.vectorize(CF,excluded = ['yr']) # excluded = ['yr'] means only the eiaId parameter will be vectorized
 
@@ -99,7 +118,7 @@ def filterPlantList(year):
 	# choose plants that are in CAISO (CISO), ERCOT (ERCO), MISO, SPP (SWPP), PJM, ISONE (ISNE), or NYISO (NYIS)
 	inAnIso = plantInfo['eia_ba'].isin(baToIso.keys()).values
 	# choose plants we have MW capacity for
-	haveCapacity = plantInfo['USWTDB-MW'].notna().values
+	haveCapacity = plantInfo[capacityCol].notna().values
 	# choose plants we have a COD for
 	haveCODYear = plantInfo['eia_COD_Year'].notna().values
 	haveCODMonth = plantInfo['eia_COD_Month'].notna().values
@@ -118,8 +137,11 @@ def filterPlantList(year):
 print('Filtering plant lists')
 
 plantLists = {yr:filterPlantList(yr) for yr in years}
+if plantIds is not None:
+	plantLists = {yr:pl[pl.isin(plantIds)] for yr,pl in plantLists.items()}
 
 # load in modelled generations for all plants in plantList
+beginStage('load')
 print('Loading in modelled generation')
 
 def columnsToLoadIn(year):
@@ -128,6 +150,23 @@ def columnsToLoadIn(year):
 		     + [f'{model} CF (density and loss adjusted)' for model in modelsByYear[year]])
 	return modCFCols+['gmt']
 
+# loads in the modelled CFs (cols, plus 'gmt') of a plant in a year, from genProfsInMemory if given and otherwise from its file in folder
+# returns None if the plant has no modelled generation profile
+def loadGenProf(year,eiaId,cols,folder,fileFormat):
+	if genProfsInMemory is not None:
+		genProf = genProfsInMemory.get(year,{}).get(eiaId)
+		if genProf is None:
+			return None
+		genProf = genProf[[c for c in genProf.columns if c in cols]].astype(floatDtype) # in the same column order as reading the file with usecols
+		genProf.index = genProf.index.tz_localize('UTC')
+		return genProf
+	fName = fileFormat.format(EIA_ID=eiaId,YEAR=year)
+	if not os.path.exists(os.path.join(folder,fName)):
+		return None
+	genProf = pd.read_csv(os.path.join(folder,fName),usecols=cols,dtype=dict.fromkeys(cols[:-1],floatDtype))
+	genProf['gmt'] = parseTimes(genProf['gmt'])
+	return genProf.set_index('gmt')
+
 modGen = {}
 for year in years:
 	if year == 2021:
@@ -136,57 +175,53 @@ for year in years:
 		continue
 	cols = columnsToLoadIn(year)
 	for i,eiaId in enumerate(plantLists[year]):
-		fName = genProfFormat.format(EIA_ID=eiaId,YEAR=year)
-		if not os.path.exists(os.path.join(genProfFolder,fName)):
+		genProf = loadGenProf(year,eiaId,cols,genProfFolder,genProfFormat)
+		if genProf is None:
 			continue
 		if i % 100 == 0: print(f'{i}/{len(plantLists[year])} generation profiles done for {year}')
-		genProf = pd.read_csv(os.path.join(genProfFolder,fName),usecols=cols)
-		genProf['gmt'] = pd.to_datetime(genProf['gmt'],format='%Y%m%d%H',utc=True)
-		modGen[(year,eiaId)] = genProf.set_index('gmt')
+		modGen[(year,eiaId)] = genProf
 
 
 # Now I load in 2021's modelled generation
-cols2021 = columnsToLoadIn(2021)
-for i,eiaId in enumerate(plantLists[2021]):
-	fName = gen2021ProfFormat.format(EIA_ID=eiaId,YEAR=2021)
-	if not os.path.exists(os.path.join(gen2021Folder,fName)):
-		continue
-	if i % 100 == 0: print(f'{i}/{len(plantLists[2021])} generation profiles done for year 2021')
-	genProf = pd.read_csv(os.path.join(gen2021Folder,fName),usecols=cols2021)
-	genProf['gmt'] = pd.to_datetime(genProf['gmt'],format='%Y%m%d%H',utc=True)
-	modGen[(2021,eiaId)] = genProf.set_index('gmt')
+if 2021 in years:
+	cols2021 = columnsToLoadIn(2021)
+	for i,eiaId in enumerate(plantLists[2021]):
+		genProf = loadGenProf(2021,eiaId,cols2021,gen2021Folder,gen2021ProfFormat)
+		if genProf is None:
+			continue
+		if i % 100 == 0: print(f'{i}/{len(plantLists[2021])} generation profiles done for year 2021')
+		modGen[(2021,eiaId)] = genProf
+
 
+if len(modGen) == 0:
+	# none of the plants have a modelled generation profile (e.g a shard none of whose plants pass the filters), so stop without any output
+	print('None of the plants have a modelled generation profile')
+	monthlyModGen = None
+	endRun()
+	sys.exit()
 
 modGen = pd.concat(modGen,names=['Year','EIA_ID'])
 modGen.sort_index(inplace=True) # improves performance later
 
 # drop hours of modelled generation before a plant's COD
 
-# first we create a Series with all of the CODs
+# first we find the hour (since the epoch, see timeCodec.py) each plant's COD month starts, once per plant
 modPlants = modGen.index.get_level_values('EIA_ID')
-cods = plantInfo.loc[modPlants,['eia_COD_Year','eia_COD_Month']]
-cods.rename(columns={'eia_COD_Year':'year','eia_COD_Month':'month'},inplace=True) # required for pd.to_datetime to work nicely
-cods['day'] = 1
-cods = pd.to_datetime(cods,utc=True)
+plants,plantPos = np.unique(modPlants,return_inverse=True)
+cods = civilHours(plantInfo.loc[plants,'eia_COD_Year'].to_numpy(dtype=np.int64),plantInfo.loc[plants,'eia_COD_Month'].to_numpy(dtype=np.int64))
 # now we only choose hours after a plant's COD
-modGen = modGen[modGen.index.get_level_values('gmt') >= cods]
+modGen = modGen[hourOffsets(modGen.index.get_level_values('gmt')) >= cods[plantPos]]
 
 # update plantLists to reflect which plants we can't use because we don't have modelled generation data for them
 for year in years:
-	plantLists[year] = modGen.loc[year].index.unique(level='EIA_ID')
-
-# modGen currently only has CF data, not generation data
-# turn modGen's CF data into generation data
-# do this inplace because otherwise modGen uses too much memory
-caps = plantInfo.loc[modGen.index.get_level_values('EIA_ID'),'USWTDB-MW']
-for cfCol in modGen.columns:
-	modGen[cfCol] = modGen[cfCol].mul(caps.to_numpy(),axis=0)
+	plantLists[year] = modGen.index.get_level_values('EIA_ID')[modGen.index.get_level_values('Year') == year].unique() # (empty if none of the plants have a profile in year, e.g in a shard)
 
-modGenCols = [c.replace('CF','Gen MWh') for c in modGen.columns]
-modGen.rename(columns=dict(zip(modGen.columns,modGenCols)),inplace=True)
+# modGen is kept as CFs: each plant's capacity is only applied to its monthly sums (see the aggregation below)
+addToStage(modGen)
 
 
 # NOTE Start of quick Spot Checking
+beginStage('screening')
 # count longest run of NaNs per EIA_ID
 print('counting length of NaN runs to ensure interpolation is the right nan-filling method')
 def longestNaN(g):
@@ -194,9 +229,9 @@ def longestNaN(g):
 	runs = isna*(g.groupby((isna != isna.shift()).cumsum()).cumcount()+1)
 	return runs.max()
 
-rawNanRuns = modGen['HRRR Gen MWh (raw)'].groupby('EIA_ID').apply(longestNaN)
-daNanRuns = modGen['HRRR Gen MWh (density adjusted)'].groupby('EIA_ID').apply(longestNaN)
-dlaNanRuns = modGen['HRRR Gen MWh (density and loss adjusted)'].groupby('EIA_ID').apply(longestNaN)
+rawNanRuns = modGen['HRRR CF (raw)'].groupby('EIA_ID').apply(longestNaN)
+daNanRuns = modGen['HRRR CF (density adjusted)'].groupby('EIA_ID').apply(longestNaN)
+dlaNanRuns = modGen['HRRR CF (density and loss adjusted)'].groupby('EIA_ID').apply(longestNaN)
 
 print('max length of run of consecutive NaNs in HRRR raw:',rawNanRuns.max())
 print('max length of run of consecutive NaNs in HRRR da:',daNanRuns.max())
@@ -206,16 +241,17 @@ print('max length of run of consecutive NaNs in HRRR dla:',dlaNanRuns.max())
 oneHour = pd.Timedelta(hours=1)
 def idxBy1hour(g):
 	g2 = g.reset_index(['Year','EIA_ID'],drop=True)
-	return ((g2.index.shift(1,freq='H') - g2.index) == oneHour).all()
+	return ((g2.index.shift(1,freq='h') - g2.index) == oneHour).all()
 
 assert modGen.groupby('EIA_ID').apply(idxBy1hour).all()
 # NOTE End of quick Spot Checking
 
 # interpolate missing values
+beginStage('interpolation')
 print('Interpolating missing values')
 colsWithNaNs = [c for c in modGen.columns if modGen[c].hasnans]
 print(f'{colsWithNaNs} have missing values, so interpolating them')
-modGen[colsWithNaNs] = modGen[colsWithNaNs].groupby('EIA_ID').transform(lambda g: g.reset_index(['Year','EIA_ID'],drop=True).interpolate(method='time'))
+modGen[colsWithNaNs] = modGen[colsWithNaNs].groupby('EIA_ID').transform(lambda g: g.reset_index(['Year','EIA_ID'],drop=True).interpolate(method='time')).astype(floatDtype)
 
 if hourBegAvg:
 	print('Hour-beginning Averaging generation for:',instantModels)
@@ -228,13 +264,18 @@ if hourBegAvg:
 	# 	return g.rolling(2).mean().shift(-1).fillna(g.iloc[-1])
 
 	for model in instantModels:
-		cols = [f'{model} Gen MWh (raw)',f'{model} Gen MWh (density adjusted)',f'{model} Gen MWh (density and loss adjusted)']
+		cols = [f'{model} CF (raw)',f'{model} CF (density adjusted)',f'{model} CF (density and loss adjusted)']
 		for col in cols:
 			modGen[col] = modGen[col].groupby('EIA_ID').transform(hourBeginningAvg)
 
-# aggregate modelled plant level generation to monthly totals
-months = modGen.index.get_level_values('gmt').month.rename('Month')
-monthlyModGen = modGen.groupby(['EIA_ID','Year',months]).sum()
+addToStage(modGen)
+
+# aggregate modelled plant level CFs to monthly sums, then weight each plant's sums by its capacity into monthly generation (MWh)
+# capacity is constant within a plant, so this equals summing hourly generation, without scaling every hour of modGen
+beginStage('aggregation')
+monthlyModGen = rollup(modGen,'Month',['EIA_ID','Year']).sort_index()
+monthlyModGen = monthlyModGen.mul(plantInfo.loc[monthlyModGen.index.get_level_values('EIA_ID'),capacityCol].to_numpy(dtype=floatDtype),axis=0)
+monthlyModGen.columns = [c.replace('CF','Gen MWh') for c in monthlyModGen.columns]
 
 monthOrder = {'January':1,'February':2,'March':3,'April':4,'May':5,'June':6,'July':7,'August':8,'September':9,'October':10,'November':11,'December':12}
 renamer = lambda c: monthOrder[c.replace('Netgen ','')]
@@ -256,4 +297,10 @@ for yr,pl in plantLists.items():
 monthlyModGen['Reported Gen MWh'] = eia923
 
 monthlyModGen.dropna(inplace=True)
-monthlyModGen.to_csv(outN)
+
+if writeOutputs:
+	beginStage('write')
+	monthlyModGen.to_csv(outN)
+	addToStage(monthlyModGen)
+
+endRun()
@@ -0,0 +1,66 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+from timeCodec import decodeTimes,localCalendar
+
+# Chunked ingestion of ERCOT High Speed Limit (HSL) generation files
+# The HSL files are read in chunks; each chunk is filtered to valid (single plant) EIA_IDs and to the year of interest,
+# then immediately summed into plant x month totals, so only the monthly sums are ever held in memory.
+# The per-year differences in column names and timestamp formats are normalized here (see ercHSLCols in curtAdjustMonthlyGenByPlant.py)
+# and the monthly result for each year's file can be cached, so the HSL files only need to be parsed once.
+# Used by curtAdjustMonthlyGenByPlant.py
+
+# returns the (UTC) year and month of each timestamp in times, which are formatted according to gmtFormat (see timeCodec.decodeTimes)
+def yearAndMonth(times,gmtFormat):
+	calendar = localCalendar(decodeTimes(times,gmtFormat),['Year','Month'])
+	return calendar['Year'].to_numpy(dtype=np.int64),calendar['Month'].to_numpy(dtype=np.int64)
+
+# reads the HSL file at path in chunks of chunksize rows and returns the monthly HSL generation of each plant in year,
+# as a Series indexed by ['EIA_ID','Year','Month']
+# a plant-month's generation is NaN if no more than minFracHours of its hours have generation data
+# gmtCol, gmtFormat, and genCol are the names of the file's timestamp column, the timestamps' format, and the name of its generation column
+def readMonthlyHSL(path,year,gmtCol,gmtFormat,genCol,chunksize=1000000,minFracHours=0.9):
+	partialSums = []
+	excludedIds = set()
+	chunks = pd.read_csv(path,usecols=['EIA_ID',gmtCol,genCol],dtype={'EIA_ID':str},chunksize=chunksize)
+	for chunk in chunks:
+		# the HSL data sometimes contains EIA_IDs that are combos of plants (e.g '56795_57095'). I exclude them from this dataset
+		# rows with a blank EIA_ID are dropped too
+		validId = chunk['EIA_ID'].str.fullmatch(r'\d+',na=False).to_numpy()
+		excludedIds.update(chunk.loc[~validId,'EIA_ID'].dropna().unique())
+		chunk = chunk[validId]
+		years,months = yearAndMonth(chunk[gmtCol],gmtFormat)
+		inYear = years == year # e.g the 2018 HSL file contains many years of data
+		chunk = pd.DataFrame({
+			'EIA_ID':chunk['EIA_ID'].to_numpy()[inYear].astype(int),
+			'Month':months[inYear],
+			'HSL_gen':chunk[genCol].to_numpy()[inYear],
+		})
+		partialSums.append(chunk.groupby(['EIA_ID','Month'])['HSL_gen'].agg(['sum','count']))
+
+	print(f"EIA_IDs in {year} to be excluded from HSL data: {sorted(excludedIds)}")
+
+	# a plant-month can be split across chunks, so combine the chunks' partial sums and counts
+	monthly = pd.concat(partialSums).groupby(level=['EIA_ID','Month']).sum()
+	hoursInMonth = pd.to_datetime(pd.DataFrame({'year':year,'month':monthly.index.get_level_values('Month'),'day':1})).dt.days_in_month.to_numpy()*24
+	hslGen = monthly['sum'].where(monthly['count'].to_numpy() > hoursInMonth*minFracHours)
+	hslGen = pd.concat({year:hslGen},names=['Year']).reorder_levels(['EIA_ID','Year','Month'])
+	return hslGen.rename('HSL_gen')
+
+# readMonthlyHSL, but if cacheFolder isn't None, the result is cached there and re-used as long as the HSL file
+# and the arguments that change the result (gmtCol, gmtFormat, genCol, and minFracHours) haven't changed
+def readMonthlyHSLCached(path,year,gmtCol,gmtFormat,genCol,cacheFolder=None,chunksize=1000000,minFracHours=0.9):
+	if cacheFolder is None:
+		return readMonthlyHSL(path,year,gmtCol,gmtFormat,genCol,chunksize,minFracHours)
+	stats = os.stat(path)
+	argsHash = hashlib.md5(repr((gmtCol,gmtFormat,genCol,minFracHours)).encode()).hexdigest()[:8]
+	cacheKey = f'{os.path.splitext(os.path.basename(path))[0]}_{year}_{stats.st_size}_{int(stats.st_mtime)}_{argsHash}'
+	cacheFile = os.path.join(cacheFolder,f'hslMonthly_{cacheKey}.csv')
+	if os.path.exists(cacheFile):
+		print(f'Using cached monthly HSL generation for {year}: {cacheFile}')
+		return pd.read_csv(cacheFile,index_col=['EIA_ID','Year','Month'])['HSL_gen']
+	hslGen = readMonthlyHSL(path,year,gmtCol,gmtFormat,genCol,chunksize,minFracHours)
+	os.makedirs(cacheFolder,exist_ok=True)
+	hslGen.to_csv(cacheFile)
+	return hslGen
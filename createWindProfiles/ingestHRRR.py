@@ -0,0 +1,261 @@
+import os
+import re
+import json
+import time
+import numpy as np
+import pandas as pd
+from powerCurves import loadPowerCurves,bracketPowerCurves,evalPowerCurves,airDensityCorrection,wakeLossCorrection
+from profileStore import createStore,updateStore,indexFileName
+from timeCodec import hoursInYear,yearStartHour,decodeTimes,parseTimes
+from runReport import startRun,beginStage,addToStage,endRun
+
+# Incremental ingest of HRRR hours as download_HRRR.py drops them into its PATH_OUT, for near-real-time monitoring of the fleet
+# Watches watchFolder for new HRRR GRIB files and, for only the new hours:
+#	* extracts the 80 m wind speeds at every plant (from the grid point nearest each plant)
+#	* runs them through the power curves with the air density and wake loss corrections of windSpeedsToCF_singleYr.py (nearest power curve by specific power)
+#	* writes the wind speeds and CFs into the profile store in storeFolder (see profileStore.py), in place
+#	* updates the ISO-hourly generation in isoHourlyOutN, in place
+# U and V can be in the same GRIB file (e.g download_HRRR.py with VAR = ":[UV]GRD:80 m") or in separate files; an hour is ingested once both have arrived.
+# The files ingested are recorded in stateFile, so the script can be stopped (Ctrl-C) and restarted without ingesting them again.
+# Requires xarray and cfgrib (installed along with herbie, which download_HRRR.py uses) to read the GRIB files (but not the cropped .npz files).
+#
+# Notes:
+#	* the ISO-hourly generation is instantaneous, i.e not hour-beginning averaged like getHourlyGenByIso.py's, since the next hour hasn't arrived yet
+#	* hours without air density data (e.g MERRA2 isn't available yet) use the plant's mean air density over the hours of the year that have it,
+#	  or airDensityReference (i.e no density correction) for plants without an air density file for the year
+
+# ----- User Input -----
+watchFolder = './' # folder download_HRRR.py downloads to (its PATH_OUT); searched recursively, as herbie saves files in subfolders by model and date
+gribFileFormat = '.*hrrr\.t\d{2}z\.wrfsfcf00\.(grib2|npz)$' # file name format of the HRRR GRIB files, or the .npz files download_HRRR.py writes when it crops them (as a python regular expression)
+pollSeconds = 60 # how often watchFolder is checked for new files
+settleSeconds = 10 # files modified less than this many seconds ago are left for the next check, as they may still be downloading
+runOnce = False # if True, the new files are ingested once and the script exits, instead of watching watchFolder
+stateFile = './hrrrIngestState.json' # file recording the files already ingested (and the grid point of each plant)
+
+plantLocationsFile = 'path/to/fileWithPlantLocations.csv' # file with the latitude and longitude of each plant (columns EIA_ID, latitude, longitude)
+plantInfoFile = 'path/to/fileWithPlantSpecifics.csv' # file containing, for each plant (indexed by EIA_ID): capacity (MW), the BA it is in, the COD year and month, and specific power
+plantIds = None # if not None, a list of the EIA_IDs to include; otherwise all plants in an ISO with a location, capacity, COD, and specific power are included
+
+airDensityFolder = 'path/to/folderWithAirDensityFiles' # folder with air density files
+airDensityFileFormat = '(?P<EIA_ID>\d+)_(?P<YEAR>\d+).csv' # file name format of air density files
+airDensityColName = 'MERRA2 air density (kg/m^3)' # Name of column in air density files with the air density data
+airDensityReference = 1.225 # air density at sea level in kg/m^3
+
+powerCurvesFolder = 'path/to/folderWithPowerCurveFiles' # folder of power curves
+powerCurveFileFormat = '(?P<SPECIFIC_POWER>\d+).csv$' # file name format of the power curves (as a python regular expression)
+maxTurbineOutput = 1500 # the maximum 'Turbine Output' of the power curves, which normalizes them into CFs
+
+# wake losses (see powerCurves.wakeLoss)
+maxWakeLoss = 0.07
+wakeRampBelowRated = 0.5
+wakeRampAboveRated = 2.0
+
+storeFolder = './path/to/profileStore' # profile store the new hours are written into (created, with the plants above, if it doesn't exist yet)
+isoHourlyOutN = './path/to/outputFolder/realtimeGenByIso/hourlyGen_HRRR_{ISO}_{YEAR}.csv' # ISO-hourly HRRR generation, updated in place
+
+runReportFile = None # if not None, a JSON file that the wall time, CPU time, peak memory, and rows processed of each stage of this run are written to (see runReport.py)
+profileFolder = None # if not None, each stage is profiled with cProfile and its profile is written to this folder
+# ----------------------
+
+# crosswalk between BA names of ISOs and the ISO names
+baToIso = {
+	'CISO':'CAISO',
+	'ERCO':'ERCOT',
+	'MISO':'MISO' ,
+	'PJM' :'PJM'  ,
+	'SWPP':'SPP'  ,
+	'ISNE':'ISONE',
+	'NYIS':'NYISO'
+}
+
+storeCols = ['HRRR wind speed (m/s)','HRRR density-corrected wind speed (m/s)','HRRR CF (raw)','HRRR CF (density adjusted)','HRRR CF (density and loss adjusted)']
+cfCols = ['HRRR CF (raw)','HRRR CF (density adjusted)','HRRR CF (density and loss adjusted)']
+genCols = [col.replace('CF','Gen MWh') for col in cfCols]
+
+startRun(os.path.basename(__file__),runReportFile,profileFolder)
+beginStage('setup')
+
+# load in the plants, their locations, and their power curves
+plantInfo = pd.read_csv(plantInfoFile,index_col='EIA_ID')
+plantInfo = plantInfo.join(pd.read_csv(plantLocationsFile,index_col='EIA_ID')[['latitude','longitude']],how='inner')
+plantInfo = plantInfo[plantInfo['eia_ba'].isin(baToIso.keys()) & plantInfo[['USWTDB-MW','USWTDB-SP','eia_COD_Year','eia_COD_Month','latitude','longitude']].notna().all(axis=1)]
+if plantIds is not None:
+	plantInfo = plantInfo[plantInfo.index.isin(plantIds)]
+plantInfo = plantInfo.sort_index()
+plants = plantInfo.index
+isos = [iso for iso in baToIso.values() if iso in set(plantInfo['eia_ba'].map(baToIso))]
+plantIsos = plantInfo['eia_ba'].map(baToIso).map({iso:i for i,iso in enumerate(isos)}).to_numpy()
+isoMatrix = (plantIsos[None,:] == np.arange(len(isos))[:,None]).astype(float) # (ISOs, plants), sums plants into their ISO
+caps = plantInfo['USWTDB-MW'].to_numpy()[:,None]
+cods = pd.to_datetime(plantInfo[['eia_COD_Year','eia_COD_Month']].rename(columns={'eia_COD_Year':'year','eia_COD_Month':'month'}).assign(day=1)).to_numpy()
+print(f'{len(plants)} plants in {len(isos)} ISOs')
+
+# each plant's power curve (nearest by specific power), shaped to broadcast against (plants, hours)
+powerCurves = loadPowerCurves(powerCurvesFolder,powerCurveFileFormat,maxTurbineOutput)
+plantCurves,_,_ = bracketPowerCurves(powerCurves.index,plantInfo['USWTDB-SP'])
+curves = powerCurves.iloc[plantCurves]
+cutIn,cutOut,rated = (curves[c].to_numpy(dtype=float)[:,None] for c in ['cutIn','cutOut','rated'])
+coeffs = np.stack(curves['coeffs'].to_numpy())[:,None,:]
+
+if not os.path.exists(os.path.join(storeFolder,indexFileName)):
+	createStore(storeFolder,plants,storeCols)
+
+state = {'files':{},'gridShape':None,'gridPoints':{}}
+if os.path.exists(stateFile):
+	with open(stateFile) as f:
+		state = json.load(f)
+
+def saveState():
+	with open(stateFile,'w') as f:
+		json.dump(state,f)
+
+# reads the 80 m U and/or V winds (whichever are in the file) from an HRRR GRIB file, or a cropped .npz file from download_HRRR.py
+# returns the hour they are valid at (gmt), a dict of the components found ('u' and/or 'v', each an array over the grid, or over the grid points kept when cropped),
+# and the grid's latitudes and longitudes
+def readGribWinds(path):
+	if path.endswith('.npz'):
+		with np.load(path) as cropped:
+			return pd.Timestamp(cropped['valid_time'][()]),{c:cropped[c].astype(float) for c in ['u','v'] if c in cropped.files},cropped['latitude'],cropped['longitude']
+	import xarray as xr # only needed here, and installed along with herbie
+	ds = xr.open_dataset(path,engine='cfgrib',backend_kwargs={'filter_by_keys':{'typeOfLevel':'heightAboveGround','level':80},'indexpath':''})
+	validTime = pd.Timestamp(np.ravel(ds['valid_time'].values)[0])
+	components = {c:ds[c].values.astype(float) for c in ['u','v'] if c in ds.data_vars}
+	lats,lons = ds['latitude'].values,ds['longitude'].values
+	ds.close()
+	return validTime,components,lats,lons
+
+# the position (in the flattened grid) of the grid point nearest each plant, by great circle distance
+# (a plant at a time, so only one plant's distances to the grid are held at once)
+def nearestGridPoints(lats,lons,plantLats,plantLons):
+	toXYZ = lambda lat,lon: np.stack([np.cos(np.radians(lat))*np.cos(np.radians(lon)),np.cos(np.radians(lat))*np.sin(np.radians(lon)),np.sin(np.radians(lat))],axis=-1)
+	grid = toXYZ(lats.ravel(),lons.ravel()) # longitudes can be 0-360 or -180-180, the xyz coordinates are the same
+	return np.array([int(np.argmax(grid @ xyz)) for xyz in toXYZ(np.asarray(plantLats),np.asarray(plantLons))],dtype=np.int64)
+
+# the grid point of each plant, found once (from the first file's grid) and kept in stateFile
+def plantGridPoints(lats,lons):
+	if state['gridShape'] != list(lats.shape) or any(str(eiaId) not in state['gridPoints'] for eiaId in plants):
+		print('Finding the HRRR grid point nearest each plant')
+		points = nearestGridPoints(lats,lons,plantInfo['latitude'],plantInfo['longitude'])
+		state['gridShape'] = list(lats.shape)
+		state['gridPoints'] = {str(eiaId):int(p) for eiaId,p in zip(plants,points)}
+		saveState()
+	return np.array([state['gridPoints'][str(eiaId)] for eiaId in plants],dtype=np.int64)
+
+# air densities of each plant in each hour of year, from the air density files (see the note at the top for hours and plants without air density data)
+# cached, so each year's files are only read once
+airDensityCache = {}
+def airDensitiesForYear(year):
+	if year in airDensityCache:
+		return airDensityCache[year]
+	densities = np.full((len(plants),hoursInYear(year)),np.nan)
+	plantPos = {eiaId:i for i,eiaId in enumerate(plants)}
+	for fName in os.listdir(airDensityFolder) if os.path.isdir(airDensityFolder) else []:
+		match = re.match(airDensityFileFormat,fName)
+		if match is None or int(match.group('YEAR')) != year or int(match.group('EIA_ID')) not in plantPos: continue
+		airDensityData = pd.read_csv(os.path.join(airDensityFolder,fName),usecols=['gmt',airDensityColName])
+		hours = decodeTimes(airDensityData['gmt']) - yearStartHour(year)
+		inYear = (hours >= 0) & (hours < densities.shape[1])
+		densities[plantPos[int(match.group('EIA_ID'))],hours[inYear]] = airDensityData[airDensityColName].to_numpy()[inYear]
+	plantMeans = np.nanmean(np.where(np.isnan(densities).all(axis=1,keepdims=True),airDensityReference,densities),axis=1,keepdims=True)
+	airDensityCache[year] = np.where(np.isnan(densities),plantMeans,densities)
+	return airDensityCache[year]
+
+# runs wind speeds (plants, hours) through the power curves with the air density and wake loss corrections, as windSpeedsToCF_singleYr.py does
+# returns the values of storeCols, of shape (plants, columns, hours)
+def windSpeedsToCFs(windSpeeds,hours):
+	airDensities = np.concatenate([airDensitiesForYear(year)[:,((hours[hours.year == year] - pd.Timestamp(year=year,month=1,day=1)) / pd.Timedelta(hours=1)).to_numpy().astype(np.int64)] for year in np.unique(hours.year)],axis=1)
+	wsCorr = airDensityCorrection(windSpeeds,airDensities,airDensityReference)
+	cfRaw = evalPowerCurves(windSpeeds,cutIn,cutOut,rated,coeffs)
+	cfDensity = evalPowerCurves(wsCorr,cutIn,cutOut,rated,coeffs)
+	cfLoss = wakeLossCorrection(wsCorr,rated,cfDensity,maxWakeLoss,wakeRampBelowRated,wakeRampAboveRated)
+	values = np.stack([windSpeeds,wsCorr,cfRaw,cfDensity,cfLoss],axis=1)
+	return np.where(np.isnan(windSpeeds)[:,None,:],np.nan,values)
+
+# sums the plants' CFs (plants, CF columns, hours) into ISO-hourly generation of plants past their COD, and writes the hours into each ISO's file for the year, in place
+def updateIsoHourly(cfs,hours):
+	operating = hours.to_numpy()[None,:] >= cods[:,None]
+	gen = np.nan_to_num(cfs * caps[:,:,None] * operating[:,None,:]) # (plants, CF columns, hours)
+	isoGen = np.einsum('ip,pch->ich',isoMatrix,gen)
+	for year in np.unique(hours.year):
+		inYear = np.asarray(hours.year == year)
+		for i,iso in enumerate(isos):
+			fName = isoHourlyOutN.format(ISO=iso,YEAR=year)
+			if os.path.exists(fName):
+				isoHourly = pd.read_csv(fName,index_col='gmt')
+				isoHourly.index = parseTimes(isoHourly.index,utc=False)
+			else:
+				os.makedirs(os.path.dirname(fName) or '.',exist_ok=True)
+				isoHourly = pd.DataFrame(np.nan,index=pd.date_range(f'{year}-01-01',periods=hoursInYear(year),freq='h',name='gmt'),columns=genCols)
+			isoHourly.loc[hours[inYear],genCols] = isoGen[i][:,inYear].T
+			isoHourly.to_csv(fName,index_label='gmt',date_format='%Y%m%d%H')
+
+# U and V components read so far of the hours not yet ingested, by hour, and the files they were read from
+pending = {}
+pendingFiles = set()
+
+# ingests the files in watchFolder that haven't been ingested yet, returning the number of hours ingested
+def ingestNewFiles():
+	beginStage('scan')
+	newFiles = []
+	for folder,_,fNames in os.walk(watchFolder):
+		for fName in fNames:
+			path = os.path.join(folder,fName)
+			if not re.match(gribFileFormat,fName) or path in pendingFiles or state['files'].get(path) == os.path.getmtime(path): continue # already ingested (or unreadable, and unchanged since)
+			if time.time() - os.path.getmtime(path) < settleSeconds: continue # may still be downloading
+			newFiles.append(path)
+	if not newFiles:
+		return 0
+
+	beginStage('extract')
+	print(f'Reading {len(newFiles)} new HRRR files')
+	gridPoints = None
+	for path in sorted(newFiles):
+		try:
+			validTime,components,lats,lons = readGribWinds(path)
+		except Exception as err: # e.g a corrupt or partial file; it is tried again on the next check if it changes
+			print(f'Could not read {path}: {err}')
+			state['files'][path] = os.path.getmtime(path)
+			continue
+		if gridPoints is None:
+			gridPoints = plantGridPoints(lats,lons)
+		hour = pending.setdefault(validTime,{'files':[]})
+		hour.update({c:component.ravel()[gridPoints] for c,component in components.items()})
+		hour['files'].append(path)
+		pendingFiles.add(path)
+
+	readyHours = sorted(t for t,hour in pending.items() if 'u' in hour and 'v' in hour)
+	if not readyHours:
+		saveState()
+		return 0
+	hours = pd.DatetimeIndex(readyHours)
+	windSpeeds = np.stack([np.hypot(pending[t]['u'],pending[t]['v']) for t in readyHours],axis=1) # (plants, hours)
+	addToStage(rows=windSpeeds.size)
+
+	beginStage('power curve')
+	values = windSpeedsToCFs(windSpeeds,hours)
+
+	beginStage('write')
+	skipped = updateStore(storeFolder,plants,storeCols,hours,values)
+	if skipped:
+		print(f'{skipped} plants are not in the profile store in {storeFolder} and were skipped (pack the store again to add them)')
+	updateIsoHourly(values[:,[storeCols.index(col) for col in cfCols]],hours)
+
+	for t in readyHours:
+		for path in pending[t]['files']:
+			state['files'][path] = os.path.getmtime(path)
+			pendingFiles.discard(path)
+		del pending[t]
+	saveState()
+	print(f'Ingested {len(readyHours)} hours: {hours.min()} to {hours.max()}')
+	return len(readyHours)
+
+ingestNewFiles()
+try:
+	while not runOnce:
+		beginStage('wait')
+		time.sleep(pollSeconds)
+		ingestNewFiles()
+except KeyboardInterrupt:
+	print('Stopped watching',watchFolder)
+
+endRun()
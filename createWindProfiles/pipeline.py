@@ -0,0 +1,168 @@
+import os
+import re
+import sys
+import json
+import argparse
+
+# Runs the stages of the pipeline in one process, handing the DataFrames each stage computes to the stages after it in memory
+# instead of writing them to CSVs and parsing them again:
+#	windSpeedsToCF_singleYr.py (once per year) -> getHourlyGenByIso.py and getMonthlyGenByPlant.py -> curtAdjustHourlyGenByIso.py and curtAdjustMonthlyGenByPlant.py
+#	-> (optionally ensembleHourlyGenByIso.py) -> summaryStatsOfWindModels.py and plotDiurnalFigures_allUS.py
+# (windSpeedsToCF_sweep.py can also be run, once per year, but hands nothing on)
+# Each stage's script is run as is, with the variables in its User Input section overridden by a single config (see loadConfig),
+# and gets the outputs of the stages before it through its *InMemory User Input variables.
+# Writing each stage's outputs to disk is optional: set writeOutputs to false for the stages whose outputs you don't want written.
+# Stages left out of a run read their inputs from disk, as when the scripts are run on their own.
+#
+# Can be imported (runPipeline, runStage, runScript) or run from the command line:
+#	python pipeline.py config.json [--stages getHourlyGenByIso curtAdjustHourlyGenByIso ...]
+# To split the plant level stages across worker processes or machines, see shardedRun.py
+
+repoFolder = os.path.join(os.path.dirname(os.path.abspath(__file__)),'..')
+userInputEnd = re.compile(r'^# -{22}[ \t]*\r?$',re.MULTILINE) # the line ending each script's User Input section
+
+# the stages in the order they are run, and their scripts
+stageScripts = {
+	'windSpeedsToCF_singleYr':os.path.join(repoFolder,'createWindProfiles','windSpeedsToCF_singleYr.py'),
+	'windSpeedsToCF_sweep':os.path.join(repoFolder,'createWindProfiles','windSpeedsToCF_sweep.py'),
+	'getHourlyGenByIso':os.path.join(repoFolder,'createWindProfiles','getHourlyGenByIso.py'),
+	'getMonthlyGenByPlant':os.path.join(repoFolder,'createWindProfiles','getMonthlyGenByPlant.py'),
+	'curtAdjustHourlyGenByIso':os.path.join(repoFolder,'createWindProfiles','curtAdjustHourlyGenByIso.py'),
+	'curtAdjustMonthlyGenByPlant':os.path.join(repoFolder,'createWindProfiles','curtAdjustMonthlyGenByPlant.py'),
+	'ensembleHourlyGenByIso':os.path.join(repoFolder,'createWindProfiles','ensembleHourlyGenByIso.py'),
+	'summaryStatsOfWindModels':os.path.join(repoFolder,'evaluateWindProfiles','summaryStatsOfWindModels.py'),
+	'plotDiurnalFigures_allUS':os.path.join(repoFolder,'evaluateWindProfiles','plotDiurnalFigures_allUS.py'),
+}
+
+# stages that are only run when asked for (in the config's "stages" or with --stages)
+optionalStages = ['windSpeedsToCF_sweep','ensembleHourlyGenByIso']
+
+# stages run once per year (with the year as their command line argument)
+perYearStages = ['windSpeedsToCF_singleYr','windSpeedsToCF_sweep']
+
+# the stages that use each stage's output, and the User Input variable they take it as
+handoffs = {
+	'windSpeedsToCF_singleYr':[('getHourlyGenByIso','genProfsInMemory'),('getMonthlyGenByPlant','genProfsInMemory')],
+	'getHourlyGenByIso':[('curtAdjustHourlyGenByIso','genByIsoInMemory')],
+	'getMonthlyGenByPlant':[('curtAdjustMonthlyGenByPlant','genByPlantInMemory')],
+	'curtAdjustHourlyGenByIso':[('ensembleHourlyGenByIso','genByIsoInMemory'),('summaryStatsOfWindModels','genByIsoInMemory'),('plotDiurnalFigures_allUS','genByIsoInMemory')],
+	'ensembleHourlyGenByIso':[('summaryStatsOfWindModels','genByIsoInMemory'),('plotDiurnalFigures_allUS','genByIsoInMemory')], # replaces curtAdjustHourlyGenByIso's output, when both are run
+	'curtAdjustMonthlyGenByPlant':[('summaryStatsOfWindModels','genByPlantInMemory')],
+}
+
+# the variable holding each stage's output once its script has run
+outputVariables = {
+	'getHourlyGenByIso':'genByIso',
+	'getMonthlyGenByPlant':'monthlyModGen',
+	'curtAdjustHourlyGenByIso':'curtAdjGens', # the first combination of curtMultCaps and clipQuantiles
+	'curtAdjustMonthlyGenByPlant':'gen',
+	'ensembleHourlyGenByIso':'genByIso',
+}
+
+# returns the source of the script at path split into its User Input section and the rest of the script (starting with the end of the line ending the User Input section)
+def splitScript(path):
+	with open(path) as f:
+		src = f.read()
+	ends = list(userInputEnd.finditer(src))
+	if len(ends) != 1:
+		raise ValueError(f'{os.path.basename(path)} must have exactly one line ending its User Input section ("# ----------------------"), but has {len(ends)}')
+	return src[:ends[0].start()],src[ends[0].end():]
+
+# runs the script at path with the variables in overrides replacing those set in its User Input section, and with argv as its command line arguments
+# the variables in shared replace those of the same name in the User Input section, and are ignored if the script doesn't have them
+# sys.argv and sys.path are restored once the script has run (or has stopped early with sys.exit(), see below)
+# returns the script's variables once it has run
+def runScript(path,overrides,argv=(),shared=None):
+	userInput,rest = splitScript(path)
+	argvBefore,pathBefore = sys.argv,list(sys.path)
+	sys.path.insert(0,os.path.dirname(path)) # so the script can import the helper modules next to it
+	sys.argv = [path,*argv]
+	try:
+		scope = {'__name__':'__main__','__file__':path}
+		exec(compile(userInput,path,'exec'),scope)
+		unknown = set(overrides) - set(scope)
+		if unknown:
+			raise KeyError(f'{os.path.basename(path)} has no User Input variables called {sorted(unknown)}')
+		scope.update({k:v for k,v in (shared or {}).items() if k in scope})
+		scope.update(overrides)
+		try:
+			exec(compile('\n'*userInput.count('\n')+rest,path,'exec'),scope) # pad with newlines so tracebacks have the right line numbers
+		except SystemExit as e: # a script with nothing to do (e.g a shard none of whose plants pass its filters) stops early with sys.exit(), leaving its output as None
+			if e.code not in (None,0):
+				raise
+	finally:
+		sys.argv = argvBefore
+		sys.path[:] = pathBefore
+	return scope
+
+# loads a pipeline config from a JSON file. The config has:
+#	"common": User Input variables shared by all stages (e.g years, plantInfoFile, compactDtypes), each set only in the stages that have it
+#	"<stage name>": User Input variables of that stage (e.g {"outN":"...", "writeOutputs":false})
+#		windSpeedsToCF_singleYr and windSpeedsToCF_sweep are run once per year (of their own "years", or else the common ones), and can also have "byYear": {"<year>": {User Input variables of that year's run}}
+#		e.g {"byYear": {"2020": {"airDensityFolder":"..."}, "2021": {"airDensityFolder":"..."}}}
+#	"stages" (optional): the stages to run (by default, all of stageScripts but optionalStages). They are always run in the order of stageScripts
+#	"inMemory" (optional, default true): whether to hand each stage's outputs to the stages after it in memory
+#	"sharding" (optional): only used by shardedRun.py
+# JSON object keys are always strings, so keys that are years (e.g of modelsByYear or ercHSLFileForm) are turned back into ints
+def loadConfig(configFile):
+	with open(configFile) as f:
+		config = json.load(f,object_hook=lambda d: {int(k) if k.isdigit() else k:v for k,v in d.items()})
+	unknown = set(config) - set(stageScripts) - {'common','stages','inMemory','sharding'}
+	if unknown:
+		raise KeyError(f'Unknown keys in {configFile}: {sorted(unknown)}')
+	return config
+
+# runs a stage with the User Input variables in config (see loadConfig) and in inputs (its in-memory inputs)
+# returns the stage's output (see outputVariables) if keepOutput, otherwise None
+def runStage(stage,config,inputs=None,keepOutput=True):
+	script = stageScripts[stage]
+	overrides = dict(config.get(stage,{}),**(inputs or {}))
+	common = config.get('common',{})
+	if stage in perYearStages:
+		# run once per year, keeping each plant's wind speeds and CFs (as written to its file) by year and EIA_ID
+		genProfs = {}
+		byYear = overrides.pop('byYear',{})
+		for year in overrides.pop('years',common.get('years')):
+			print(f'Running {stage} for {year}')
+			scope = runScript(script,dict(overrides,**byYear.get(year,{})),[str(year)],common)
+			if keepOutput and stage == 'windSpeedsToCF_singleYr' and scope['windProfs'] is not None: # None if there were no wind profiles for year
+				windProfs = scope['windProfs'][scope['outputCols']]
+				genProfs[year] = {eiaId:prof.droplevel('EIA_ID') for eiaId,prof in windProfs.groupby(level='EIA_ID')}
+				del windProfs
+			del scope
+		return genProfs if keepOutput and stage == 'windSpeedsToCF_singleYr' else None
+	print(f'Running {stage}')
+	scope = runScript(script,overrides,(),common)
+	return scope.get(outputVariables.get(stage)) if keepOutput else None
+
+# runs the stages in config (see loadConfig), or the given stages instead if not None
+# inputs (if not None) are in-memory inputs of the stages, e.g {'curtAdjustHourlyGenByIso':{'genByIsoInMemory':genByIso}} (as shardedRun.py hands on its reduced outputs)
+# returns a dict of the outputs (see outputVariables) of the stages run whose outputs aren't used by any of the other stages run
+def runPipeline(config,stages=None,inputs=None):
+	stages = stages or config.get('stages',[s for s in stageScripts if s not in optionalStages])
+	unknown = set(stages) - set(stageScripts)
+	if unknown:
+		raise KeyError(f'Unknown stages: {sorted(unknown)}')
+	stages = [s for s in stageScripts if s in stages] # each stage is run after the stages it uses the outputs of
+	inMemory = config.get('inMemory',True)
+
+	inputs = {stage:dict((inputs or {}).get(stage,{})) for stage in stages}
+	results = {}
+	for i,stage in enumerate(stages):
+		consumers = [(consumer,variable) for consumer,variable in handoffs.get(stage,[]) if consumer in stages[i+1:]]
+		if not consumers:
+			results[stage] = runStage(stage,config,inputs.pop(stage))
+			continue
+		output = runStage(stage,config,inputs.pop(stage),keepOutput=inMemory)
+		if inMemory:
+			for consumer,variable in consumers:
+				inputs[consumer][variable] = output
+		del output # each output is only kept until the last stage that uses it has run
+	return {stage:output for stage,output in results.items() if output is not None}
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Runs the stages of the pipeline in one process, handing their outputs to each other in memory')
+	parser.add_argument('config',help='JSON config file (see loadConfig in pipeline.py)')
+	parser.add_argument('--stages',nargs='+',choices=list(stageScripts),help='the stages to run (by default, those in the config, or else all but the optional ones)')
+	args = parser.parse_args()
+	runPipeline(loadConfig(args.config),args.stages)
@@ -0,0 +1,158 @@
+import os
+import re
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Power curve, air density, and wake loss helpers
+# The power curves are fit as a 10th degree polynomial between their cut-in and rated speeds.
+# The assumptions (the air density the curves are valid at, the maximum turbine output the curves are normalized by, and the wake losses)
+# are arguments rather than constants, and evalPowerCurves and wakeLoss broadcast, so several sets of assumptions can be evaluated at once
+# Plants are matched to curves for all plants at once with a sorted search (bracketPowerCurves), either to the nearest curve or to a blend of the two
+# curves bracketing their specific power, and the curves can be precomputed into per-plant lookup tables so evaluating them is a gather (lookupPowerCurves)
+# The tables can also be smoothed into multi-turbine plant power curves (smoothedPowerCurveTables), which costs nothing extra per hour since it is done when the tables are built
+# Used by windSpeedsToCF_singleYr.py and windSpeedsToCF_sweep.py
+
+# finds cut-in speed, rated-speed,cut-out speed, and the coefficients of a 10th degree polynomial to model the curved part of the power curve
+# pwrCrv is a DataFrame of power curve data, with an index of wind speeds and a generation column (e.g 'CF' or 'Turbine Output')
+def fitPowerCurve(pwrCrv,genCol='CF'):
+	cutIn  = pwrCrv.index[pwrCrv[genCol] != 0].min()
+	cutOut = pwrCrv.index[pwrCrv[genCol] != 0].max()
+	rated  = pwrCrv.index[pwrCrv[genCol] == pwrCrv[genCol].max()].min()
+	polySpeeds = pwrCrv.index[(pwrCrv.index >= cutIn) & (pwrCrv.index <= rated)]
+	polyCoeffs = np.polyfit(polySpeeds,pwrCrv.loc[polySpeeds,genCol],10)
+	return (cutIn,cutOut,rated,polyCoeffs)
+
+# loads in and fits the power curves in powerCurvesFolder whose file names match powerCurveFileFormat (a regular expression with a SPECIFIC_POWER group)
+# each curve's 'Turbine Output' is divided by maxTurbineOutput to turn it into CFs
+# returns a DataFrame indexed by specific power with the columns 'cutIn', 'cutOut', 'rated', and 'coeffs'
+def loadPowerCurves(powerCurvesFolder,powerCurveFileFormat,maxTurbineOutput=1500):
+	powerCurves = {}
+	for fName in os.listdir(powerCurvesFolder):
+		match = re.match(powerCurveFileFormat,fName)
+		if match is None: continue # if file name doesn't match the format of a power curve file, skip it
+		specificPower = int(match.group('SPECIFIC_POWER'))
+		powerCurve = pd.read_csv(os.path.join(powerCurvesFolder,fName),index_col='Wind Speed (m/s)')
+		powerCurve['CF'] = powerCurve['Turbine Output'] / maxTurbineOutput # NOTE: If reusing this script, check that maxTurbineOutput (1500 for our curves) is still the maximum output!
+		powerCurves[specificPower] = fitPowerCurve(powerCurve) # store the cut-in speed, rated speed, etc in powerCurves
+
+	powerCurves = pd.DataFrame.from_dict(powerCurves,orient='index',columns=['cutIn','cutOut','rated','coeffs'])
+	powerCurves.sort_index(inplace=True) # improves performance later
+	powerCurves.index.rename('Specific Power',inplace=True) # just for clarity, it isn't important otherwise
+	return powerCurves
+
+# finds the power curves (by position in curveSPs, which must be sorted, e.g powerCurves.index) for the specific powers of all plants at once (plantSPs)
+# with interpolate=False, each plant gets the curve with the closest specific power (the lower one on ties): lo = hi and weight = 0
+# with interpolate=True, each plant gets the two curves whose specific powers bracket its own (lo and hi), with hi given the weight (plantSp - loSp)/(hiSp - loSp)
+# (plants outside the range of curveSPs get the nearest curve)
+# returns (lo, hi, weight) arrays; plants with a NaN specific power get lo = hi = -1 and a NaN weight
+def bracketPowerCurves(curveSPs,plantSPs,interpolate=False):
+	curveSPs = np.asarray(curveSPs,dtype=float)
+	plantSPs = np.asarray(plantSPs,dtype=float)
+	k = np.searchsorted(curveSPs,plantSPs)
+	lo = np.clip(k-1,0,len(curveSPs)-1)
+	hi = np.clip(k,0,len(curveSPs)-1)
+	loSp,hiSp = curveSPs[lo],curveSPs[hi]
+	if interpolate:
+		weight = np.where(hi > lo,(plantSPs - loSp)/np.where(hi > lo,hiSp - loSp,1),0.0)
+	else:
+		lo = hi = np.where(plantSPs - loSp <= hiSp - plantSPs,lo,hi)
+		weight = np.zeros(len(plantSPs))
+	missing = np.isnan(plantSPs)
+	lo,hi = np.where(missing,-1,lo),np.where(missing,-1,hi)
+	return lo,hi,np.where(missing,np.nan,weight)
+
+# blends values of each power curve (e.g the rated speeds, or the lookup tables of powerCurveTables) for each plant, given its curves and weight from bracketPowerCurves
+# values' first axis is the curves; plants with a NaN specific power get NaN
+def blendCurveValues(values,lo,hi,weight):
+	values = np.asarray(values,dtype=float)
+	extraDims = (1,)*(values.ndim-1)
+	weight = weight.reshape(weight.shape+extraDims)
+	return np.where((lo >= 0).reshape(lo.shape+extraDims),(1-weight)*values[lo] + weight*values[hi],np.nan)
+
+# Apply air density correction to the wind speeds, according to:
+# WS_corrected = WS * (rho/rho_0)^(1/3)
+# where rho is air density, rho_0 is air density where the power curves are valid for, e.g sea level
+# WS is raw wind speed, and WS_corrected is the density corrected wind speed
+def airDensityCorrection(windSpeeds,airDensities,airDensityReference):
+	return windSpeeds * np.power(airDensities/airDensityReference,1/3)
+
+# runs windSpeeds through fitted power curves (see fitPowerCurve), returning CFs
+# cutIn, cutOut, rated, and polyCoeffs (whose last axis is the polynomial's coefficients, highest degree first) broadcast against windSpeeds,
+# e.g windSpeeds of shape (plants, hours) with cutIn of shape (plants, 1) and polyCoeffs of shape (plants, 1, 11)
+def evalPowerCurves(windSpeeds,cutIn,cutOut,rated,polyCoeffs):
+	gen = np.zeros(np.broadcast_shapes(np.shape(windSpeeds),np.shape(polyCoeffs)[:-1]))
+	for c in np.moveaxis(polyCoeffs,-1,0): # Horner's method, as in np.polyval
+		gen = gen * windSpeeds + c
+	gen = np.where((windSpeeds < cutIn) | (windSpeeds > cutOut),0,gen)
+	gen = np.where((windSpeeds >= rated) & (windSpeeds <= cutOut),1,gen)
+	return gen.clip(0,1) # just in case the polynomial portion of the power curve does something weird and outputs a value outside of [0,1]
+
+# Wake losses of generation, according to:
+# When: WS < (RS - rampBelowRated): loss = maxLoss (e.g 7%, i.e., multiply power curve output by 93%)
+# When: WS >= (RS - rampBelowRated) and WS <= (RS + rampAboveRated): loss = maxLoss - (maxLoss)(WS - RS*)/(rampBelowRated + rampAboveRated), where RS* = RS - rampBelowRated
+# When: WS > RS + rampAboveRated: loss = 0%
+# where, WS = wind speed in meters per second and
+# RS = Rated speed of the turbine power curve (i.e., the first WS at which output equals its peak value)
+# returns the losses (as fractions of generation); all arguments broadcast against each other
+def wakeLoss(ws,rs,maxLoss=0.07,rampBelowRated=0.5,rampAboveRated=2.0):
+	ramp = maxLoss - maxLoss * (ws - rs + rampBelowRated)/(rampBelowRated + rampAboveRated)
+	return np.where(ws < rs - rampBelowRated,maxLoss,np.where(ws <= rs + rampAboveRated,ramp,0))
+
+def wakeLossCorrection(ws,rs,generation,maxLoss=0.07,rampBelowRated=0.5,rampAboveRated=2.0):
+	return generation * (1 - wakeLoss(ws,rs,maxLoss,rampBelowRated,rampAboveRated))
+
+# precomputes the fitted power curves into lookup tables of CFs at wind speeds 0, speedStep, 2*speedStep, ... up to past the highest cut-out speed (or maxSpeed, if higher)
+# returns the wind speeds and a table of shape (curves, wind speeds)
+def powerCurveTables(powerCurves,speedStep=0.01,maxSpeed=None):
+	maxSpeed = max(powerCurves['cutOut'].max(),maxSpeed or 0)
+	speeds = np.arange(int(np.ceil(maxSpeed/speedStep))+2) * speedStep
+	cutIn,cutOut,rated = (powerCurves[c].to_numpy(dtype=float)[:,None] for c in ['cutIn','cutOut','rated'])
+	coeffs = np.stack(powerCurves['coeffs'].to_numpy())[:,None,:]
+	return speeds,evalPowerCurves(speeds[None,:],cutIn,cutOut,rated,coeffs)
+
+# looks up the CFs of windSpeeds in lookup tables (e.g one per plant, from powerCurveTables and blendCurveValues), with linear interpolation between table entries
+# tables has shape (tables, wind speeds) with entries speedStep apart starting at 0; tableIdx (which broadcasts against windSpeeds) is the table each wind speed is looked up in
+# (speeds past the end of the tables get the last entry, and NaN speeds are NaN)
+def lookupPowerCurves(tables,tableIdx,windSpeeds,speedStep=0.01):
+	nSpeeds = tables.shape[1]
+	missing = np.isnan(windSpeeds)
+	x = np.where(missing,0,windSpeeds) / speedStep
+	i = np.clip(np.floor(x),0,nSpeeds-2).astype(np.int64)
+	frac = np.clip(x - i,0,1)
+	flat = tables.ravel()
+	start = np.asarray(tableIdx,dtype=np.int64) * nSpeeds + i
+	cf = flat[start]*(1-frac) + flat[start+1]*frac
+	return np.where(missing,np.nan,cf)
+
+# smooths lookup tables (of shape (curves, wind speeds), from powerCurveTables) into multi-turbine plant power curves, according to:
+# CF_plant(WS) = sum over WS' of CF(WS') * N(WS' - WS; 0, width)
+# i.e the expected CF when the speeds seen by a plant's turbines (across the plant and within the hour) are normally distributed around its hourly mean speed WS,
+# with a standard deviation of width (m/s). Speeds below 0 have a CF of 0, and the tables should extend at least 4 widths past the highest cut-out speed
+def smoothPowerCurveTables(tables,width,speedStep=0.01):
+	if width <= 0:
+		return tables
+	offsets = np.arange(-int(np.ceil(4*width/speedStep)),int(np.ceil(4*width/speedStep))+1) * speedStep
+	kernel = np.exp(-0.5*(offsets/width)**2)
+	kernel /= kernel.sum()
+	return np.stack([np.convolve(table,kernel,mode='same') for table in tables])
+
+# lookup tables of the power curves smoothed with each of widths (see smoothPowerCurveTables), with widths rounded to speedStep
+# if cacheFolder isn't None, each width's tables are cached there and re-used as long as the power curves, speedStep, and width are the same
+# returns the wind speeds, the (rounded) unique widths, and tables of shape (widths, curves, wind speeds)
+def smoothedPowerCurveTables(powerCurves,widths,speedStep=0.01,cacheFolder=None):
+	widths = np.unique(np.round(np.asarray(widths,dtype=float)/speedStep) * speedStep)
+	speeds,tables = powerCurveTables(powerCurves,speedStep,powerCurves['cutOut'].max() + 4*widths.max())
+	curveKey = hashlib.md5(np.concatenate([powerCurves.index.to_numpy(dtype=float),powerCurves[['cutIn','cutOut','rated']].to_numpy(dtype=float).ravel(),
+		np.concatenate(powerCurves['coeffs'].to_numpy()),[speedStep,len(speeds)]]).tobytes()).hexdigest()[:16]
+	smoothed = []
+	for width in widths:
+		cacheFile = None if cacheFolder is None else os.path.join(cacheFolder,f'powerCurveTables_{curveKey}_{width:g}.npy')
+		if cacheFile is not None and os.path.exists(cacheFile):
+			smoothed.append(np.load(cacheFile))
+			continue
+		smoothed.append(smoothPowerCurveTables(tables,width,speedStep))
+		if cacheFile is not None:
+			os.makedirs(cacheFolder,exist_ok=True)
+			np.save(cacheFile,smoothed[-1])
+	return speeds,widths,np.stack(smoothed)
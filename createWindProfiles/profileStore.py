@@ -0,0 +1,251 @@
+import os
+import re
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from urllib.parse import urlparse,parse_qs
+from http.server import ThreadingHTTPServer,BaseHTTPRequestHandler
+from timeCodec import decodeTimes,hourOffsets
+
+# Read-only store of the per-plant hourly profiles written by windSpeedsToCF_singleYr.py ({EIA_ID}_{YEAR}.csv), for fast slicing by plant, column, and time
+# packProfiles parses the CSVs once into a folder with one binary array per year, of shape (plants, columns, hours of the year), and an index (index.json)
+# of the plants, the columns (each a model, e.g 'HRRR', and a variant, e.g 'CF (density and loss adjusted)'), and the first hour of each year.
+# openStore memory-maps the arrays, so queries only read the hours asked for: each plant and column's hours are contiguous,
+# and sliceStore returns views into the memory-mapped arrays (no copies) when the plants and columns asked for are contiguous.
+# queryStore returns the slices as a DataFrame like the CSVs (indexed by EIA_ID and gmt), and serveStore puts queryStore behind a local HTTP server.
+# updateStore writes new hours (e.g from ingestHRRR.py) into a store in place.
+#
+# Can be imported or run from the command line:
+#	python profileStore.py pack 'path/to/ERA5_MERRA2_HRRR_windSpeedAndCF_{YEAR}/{EIA_ID}_{YEAR}.csv' path/to/store --years 2020 2021 [--dtype float32]
+#	python profileStore.py serve path/to/store [--port 8050]
+# and then e.g http://127.0.0.1:8050/query?plants=56789,56790&models=HRRR&variants=CF%20(density%20and%20loss%20adjusted)&start=2020-06-01&end=2020-08-31%2023:00
+
+indexFileName = 'index.json'
+modelNames = ['ERA5','MERRA2','HRRR']
+
+# splits an output column of windSpeedsToCF_singleYr.py into its model and variant, e.g 'HRRR CF (raw)' -> ('HRRR', 'CF (raw)')
+# columns not starting with a model name (e.g 'MERRA2 air density (kg/m^3)' does, 'gmt' doesn't) have a model of None
+def splitColumn(col):
+	for model in modelNames:
+		if col.startswith(model + ' '):
+			return model,col[len(model)+1:]
+	return None,col
+
+# packs the profiles in files named like fileFormat (with {EIA_ID} and {YEAR} fields, e.g windSpeedsToCF_singleYr.py's fOutName) for years into storeFolder
+# columns are the columns to pack (by default, all of those in the first file), and dtype the dtype they are stored as
+# hours missing from a plant's file, and plants without a file for a year, are NaN
+def packProfiles(fileFormat,storeFolder,years,columns=None,dtype='float64'):
+	namePattern = os.path.basename(fileFormat)
+	namePattern = re.escape(namePattern).replace(re.escape('{EIA_ID}'),'(?P<EIA_ID>\\d+)').replace(re.escape('{YEAR}'),'(?P<YEAR>\\d{4})') + '$'
+	files = {} # {year: {EIA_ID: path}}
+	for yearFolder in sorted({os.path.dirname(fileFormat.format(EIA_ID=0,YEAR=year)) for year in years}):
+		for fName in os.listdir(yearFolder):
+			match = re.match(namePattern,fName)
+			if match is None or int(match.group('YEAR')) not in years: continue
+			files.setdefault(int(match.group('YEAR')),{})[int(match.group('EIA_ID'))] = os.path.join(yearFolder,fName)
+	plants = sorted({eiaId for yearFiles in files.values() for eiaId in yearFiles})
+	if columns is None:
+		firstFile = next(iter(files[min(files)].values()))
+		columns = [col for col in pd.read_csv(firstFile,nrows=0).columns if col != 'gmt']
+
+	os.makedirs(storeFolder,exist_ok=True)
+	index = {'plants':plants,'columns':columns,'dtype':np.dtype(dtype).name,'years':{}}
+	plantPos = {eiaId:i for i,eiaId in enumerate(plants)}
+	for year in sorted(files):
+		arr = _createYear(storeFolder,index,year)
+		start = pd.Timestamp(index['years'][str(year)]['start'])
+		nHours = arr.shape[2]
+		print(f'Packing {len(files[year])} plants for {year}')
+		for eiaId,path in files[year].items():
+			prof = pd.read_csv(path,usecols=['gmt'] + columns)
+			hours = decodeTimes(prof['gmt']) - hourOffsets([start])[0]
+			inYear = (hours >= 0) & (hours < nHours)
+			arr[plantPos[eiaId]][:,hours[inYear]] = prof.loc[inYear,columns].to_numpy(dtype=dtype).T
+		arr.flush()
+		del arr
+
+	_writeIndex(storeFolder,index)
+	return openStore(storeFolder)
+
+def _writeIndex(storeFolder,index):
+	with open(os.path.join(storeFolder,indexFileName),'w') as f:
+		json.dump(index,f,indent=1)
+
+# creates the (all NaN) array of year in storeFolder and adds it to index, returning the array (memory-mapped for writing)
+def _createYear(storeFolder,index,year):
+	start = pd.Timestamp(year=year,month=1,day=1)
+	nHours = int((pd.Timestamp(year=year+1,month=1,day=1) - start) / pd.Timedelta(hours=1))
+	arrFile = f'profiles_{year}.npy'
+	arr = np.lib.format.open_memmap(os.path.join(storeFolder,arrFile),mode='w+',dtype=index['dtype'],shape=(len(index['plants']),len(index['columns']),nHours))
+	arr[:] = np.nan
+	index['years'][str(year)] = {'file':arrFile,'start':start.isoformat(),'hours':nHours}
+	return arr
+
+# creates an empty store (with no years yet) of plants and columns in storeFolder, e.g for updateStore to fill in as new hours arrive
+def createStore(storeFolder,plants,columns,dtype='float64'):
+	os.makedirs(storeFolder,exist_ok=True)
+	_writeIndex(storeFolder,{'plants':sorted(int(eiaId) for eiaId in plants),'columns':list(columns),'dtype':np.dtype(dtype).name,'years':{}})
+	return openStore(storeFolder)
+
+# writes values (of shape (plants, columns, hours)) of plants (EIA_IDs), columns, and hours (timestamps in gmt) into the store in storeFolder, in place
+# years not yet in the store are added, and plants and columns not in the store are skipped (the store has to be packed again to add them)
+# stores already opened with openStore see the new values (but not new years, until they are opened again)
+# returns the number of plants skipped
+def updateStore(storeFolder,plants,columns,hours,values):
+	with open(os.path.join(storeFolder,indexFileName)) as f:
+		index = json.load(f)
+	plantPos = {eiaId:i for i,eiaId in enumerate(index['plants'])}
+	columnPos = {col:i for i,col in enumerate(index['columns'])}
+	plantsIn = np.array([eiaId in plantPos for eiaId in plants],dtype=bool)
+	colsIn = np.array([col in columnPos for col in columns],dtype=bool)
+	values = np.asarray(values)[plantsIn][:,colsIn]
+	plantIdx = np.array([plantPos[eiaId] for eiaId in np.asarray(plants)[plantsIn]],dtype=np.int64)
+	colIdx = np.array([columnPos[col] for col in np.asarray(columns)[colsIn]],dtype=np.int64)
+	hours = pd.DatetimeIndex(hours)
+	newYear = False
+	for year in np.unique(hours.year):
+		inYear = np.asarray(hours.year == year)
+		if str(year) in index['years']:
+			arr = np.load(os.path.join(storeFolder,index['years'][str(year)]['file']),mmap_mode='r+')
+		else:
+			arr = _createYear(storeFolder,index,int(year))
+			newYear = True
+		hourIdx = ((hours[inYear] - pd.Timestamp(index['years'][str(year)]['start'])) / pd.Timedelta(hours=1)).to_numpy().astype(np.int64)
+		arr[np.ix_(plantIdx,colIdx,hourIdx)] = values[:,:,inYear]
+		arr.flush()
+		del arr
+	if newYear:
+		_writeIndex(storeFolder,index)
+	return (~plantsIn).sum()
+
+# opens a store written by packProfiles, memory-mapping its arrays (read only)
+# returns a dict of the index (see packProfiles), each year's array, and the positions of the plants and columns in the arrays
+def openStore(storeFolder):
+	with open(os.path.join(storeFolder,indexFileName)) as f:
+		index = json.load(f)
+	return {
+		'index':index,
+		'arrays':{int(year):np.load(os.path.join(storeFolder,info['file']),mmap_mode='r') for year,info in index['years'].items()},
+		'starts':{int(year):pd.Timestamp(info['start']) for year,info in index['years'].items()},
+		'plantPos':{eiaId:i for i,eiaId in enumerate(index['plants'])},
+		'columnPos':{col:i for i,col in enumerate(index['columns'])},
+	}
+
+# the columns of store matching the given columns (names), or else the given models and variants (each None for all of them), in the store's order
+def selectColumns(store,columns=None,models=None,variants=None):
+	if columns is not None:
+		unknown = [col for col in columns if col not in store['columnPos']]
+		if unknown:
+			raise KeyError(f'Columns not in store: {unknown}')
+		return list(columns)
+	selected = []
+	for col in store['index']['columns']:
+		model,variant = splitColumn(col)
+		if (models is None or model in models) and (variants is None or variant in variants):
+			selected.append(col)
+	return selected
+
+# turns positions into a slice if they are contiguous and increasing (so indexing with them gives a view), or else an array of them
+def _asSlice(positions):
+	positions = np.asarray(positions,dtype=np.int64)
+	if len(positions) > 0 and np.array_equal(positions,np.arange(positions[0],positions[0]+len(positions))):
+		return slice(int(positions[0]),int(positions[0])+len(positions))
+	return positions
+
+# returns the values of plants (EIA_IDs) and columns from start to end (inclusive, as timestamps in gmt) in year, as an array of shape (plants, columns, hours)
+# and the hour (gmt) of each value. The array is a view into the memory-mapped array if the plants and columns are contiguous in the store (e.g a single plant and column)
+def sliceStore(store,year,plants,columns,start=None,end=None):
+	yearStart = store['starts'][year]
+	arr = store['arrays'][year]
+	first = 0 if start is None else max(0,int(np.ceil((pd.Timestamp(start) - yearStart) / pd.Timedelta(hours=1))))
+	last = arr.shape[2] if end is None else min(arr.shape[2],int(np.floor((pd.Timestamp(end) - yearStart) / pd.Timedelta(hours=1)))+1)
+	last = max(first,last)
+	missing = [eiaId for eiaId in plants if eiaId not in store['plantPos']]
+	if missing:
+		raise KeyError(f'Plants not in store: {missing}')
+	plantIdx = _asSlice([store['plantPos'][eiaId] for eiaId in plants])
+	colIdx = _asSlice([store['columnPos'][col] for col in columns])
+	if isinstance(plantIdx,slice) and isinstance(colIdx,slice):
+		values = arr[plantIdx,colIdx,first:last]
+	else: # gathers only the plants, columns, and hours asked for
+		values = arr[:,:,first:last][np.arange(arr.shape[0])[plantIdx][:,None],np.arange(arr.shape[1])[colIdx][None,:]]
+	return values,pd.date_range(yearStart + pd.Timedelta(hours=first),periods=last-first,freq='h')
+
+# returns the values of plants (EIA_IDs, by default all of them) and columns (see selectColumns) from start to end (inclusive, as timestamps in gmt, by default all years)
+# as a DataFrame indexed by EIA_ID and gmt, with a column for each of columns (as in the CSVs written by windSpeedsToCF_singleYr.py)
+def queryStore(store,plants=None,columns=None,models=None,variants=None,start=None,end=None):
+	plants = store['index']['plants'] if plants is None else [int(eiaId) for eiaId in plants]
+	columns = selectColumns(store,columns,models,variants)
+	frames = []
+	for year in sorted(store['arrays']):
+		if start is not None and pd.Timestamp(start).year > year: continue
+		if end is not None and pd.Timestamp(end).year < year: continue
+		values,hours = sliceStore(store,year,plants,columns,start,end)
+		if len(hours) == 0: continue
+		index = pd.MultiIndex.from_product([plants,hours],names=['EIA_ID','gmt'])
+		frames.append(pd.DataFrame(np.asarray(values).transpose(0,2,1).reshape(-1,len(columns)),index=index,columns=columns))
+	if not frames:
+		return pd.DataFrame(columns=columns,index=pd.MultiIndex.from_arrays([[],pd.DatetimeIndex([])],names=['EIA_ID','gmt']))
+	return pd.concat(frames).sort_index(level='EIA_ID',sort_remaining=True)
+
+# serves queryStore over HTTP at host:port (local only by default) until interrupted:
+#	GET /index -> the store's index as JSON
+#	GET /query?plants=1,2&columns=...|models=...&variants=...&start=...&end=...&format=csv|json -> the result of queryStore (lists are comma separated)
+def serveStore(store,host='127.0.0.1',port=8050):
+	class Handler(BaseHTTPRequestHandler):
+		def do_GET(self):
+			url = urlparse(self.path)
+			args = {k:v[-1] for k,v in parse_qs(url.query).items()}
+			listArg = lambda name: None if name not in args else [v for v in args[name].split(',') if v]
+			try:
+				if url.path == '/index':
+					self.respond(200,'application/json',json.dumps(store['index']))
+				elif url.path == '/query':
+					result = queryStore(store,listArg('plants'),listArg('columns'),listArg('models'),listArg('variants'),args.get('start'),args.get('end'))
+					if args.get('format','csv') == 'json':
+						result = result.reset_index()
+						result['gmt'] = result['gmt'].dt.strftime('%Y%m%d%H')
+						self.respond(200,'application/json',result.to_json(orient='records'))
+					else:
+						self.respond(200,'text/csv',result.to_csv(date_format='%Y%m%d%H'))
+				else:
+					self.respond(404,'text/plain','Unknown path, use /index or /query')
+			except (KeyError,ValueError) as err:
+				self.respond(400,'text/plain',str(err))
+
+		def respond(self,status,contentType,body):
+			body = body.encode()
+			self.send_response(status)
+			self.send_header('Content-Type',contentType)
+			self.send_header('Content-Length',str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+	server = ThreadingHTTPServer((host,port),Handler)
+	print(f'Serving profiles at http://{host}:{server.server_address[1]}/query')
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Packs the per-plant profiles of windSpeedsToCF_singleYr.py into a memory-mapped store, or serves queries of a store over HTTP')
+	commands = parser.add_subparsers(dest='command',required=True)
+	pack = commands.add_parser('pack',help='pack profile CSVs into a store')
+	pack.add_argument('fileFormat',help='file name format of the profiles, with {EIA_ID} and {YEAR} fields (as fOutName in windSpeedsToCF_singleYr.py)')
+	pack.add_argument('storeFolder',help='folder to write the store to')
+	pack.add_argument('--years',type=int,nargs='+',required=True)
+	pack.add_argument('--columns',nargs='+',help='the columns to pack (by default, all of them)')
+	pack.add_argument('--dtype',default='float64',help='dtype the values are stored as (e.g float32 to halve the size of the store)')
+	serve = commands.add_parser('serve',help='serve queries of a store over HTTP')
+	serve.add_argument('storeFolder')
+	serve.add_argument('--host',default='127.0.0.1')
+	serve.add_argument('--port',type=int,default=8050)
+	args = parser.parse_args()
+	if args.command == 'pack':
+		packProfiles(args.fileFormat,args.storeFolder,args.years,args.columns,args.dtype)
+	else:
+		serveStore(openStore(args.storeFolder),args.host,args.port)
@@ -0,0 +1,116 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import datetime
+import numpy as np
+try:
+	import resource # only available on Unix-like systems
+except ImportError:
+	resource = None
+
+# Stage-level instrumentation of the scripts
+# A script calls startRun once, then beginStage(name) at the start of each stage (e.g 'load', 'density', 'power curve', 'losses', 'write'),
+# which also ends the previous stage, and endRun at the end.
+# For each stage, the wall time, CPU time (of this process, not of any worker processes), peak memory (max resident set size), and rows and bytes
+# processed (as reported with addToStage) are recorded. Stages that are begun more than once (e.g once per batch of plants) are summed.
+# endRun prints a summary of the stages and, if a report file was given to startRun, writes it as JSON.
+# If a profile folder was given, each stage is also run under cProfile and its profile is dumped to {script}_{stage}.prof (readable with pstats or snakeviz)
+# Used by the scripts in createWindProfiles/ and evaluateWindProfiles/
+
+_run = None
+
+# returns the peak memory use (max resident set size) of this process so far in MB, or NaN if it can't be measured
+def peakRssMB():
+	if resource is None:
+		return np.nan
+	maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return maxRss / 2**20 if sys.platform == 'darwin' else maxRss / 2**10 # bytes on macOS, KB on Linux
+
+# starts recording a run of scriptName
+# reportFile (if not None) is the JSON file the run report is written to; profileFolder (if not None) is the folder the stages' profiles are dumped to
+def startRun(scriptName,reportFile=None,profileFolder=None):
+	global _run
+	_run = {
+		'script':scriptName,
+		'args':sys.argv[1:],
+		'started':datetime.datetime.now().isoformat(timespec='seconds'),
+		'reportFile':reportFile,
+		'profileFolder':profileFolder,
+		'wall':time.perf_counter(),
+		'cpu':time.process_time(),
+		'stages':{},
+		'current':None,
+	}
+
+# ends the current stage (if any) and begins the stage called name
+def beginStage(name):
+	if _run is None: return
+	endStage()
+	stage = _run['stages'].setdefault(name,{
+		'stage':name,'calls':0,'wallSeconds':0.0,'cpuSeconds':0.0,'peakRssMB':np.nan,'rssGrowthMB':0.0,'rows':0,'bytes':0,
+		'profile':cProfile.Profile() if _run['profileFolder'] is not None else None,
+	})
+	stage['calls'] += 1
+	stage['start'] = (time.perf_counter(),time.process_time(),peakRssMB())
+	if stage['profile'] is not None:
+		stage['profile'].enable()
+	_run['current'] = stage
+
+# adds to the rows and bytes processed in the current stage
+# data (if not None) is a DataFrame or Series whose rows and in-memory size are added
+def addToStage(data=None,rows=0,nBytes=0):
+	if _run is None or _run['current'] is None: return
+	if data is not None:
+		rows += len(data)
+		nBytes += int(np.sum(data.memory_usage(index=True)))
+	_run['current']['rows'] += rows
+	_run['current']['bytes'] += nBytes
+
+# ends the current stage (if any)
+def endStage():
+	if _run is None or _run['current'] is None: return
+	stage = _run['current']
+	if stage['profile'] is not None:
+		stage['profile'].disable()
+	wall,cpu,rss = stage.pop('start')
+	peak = peakRssMB()
+	stage['wallSeconds'] += time.perf_counter() - wall
+	stage['cpuSeconds'] += time.process_time() - cpu
+	stage['rssGrowthMB'] += peak - rss # how much this stage raised the peak memory use
+	stage['peakRssMB'] = np.fmax(stage['peakRssMB'],peak)
+	_run['current'] = None
+
+# ends the run: ends the current stage, prints a summary, and writes the report and profiles (if requested in startRun)
+# returns the report as a dict
+def endRun():
+	global _run
+	if _run is None: return None
+	endStage()
+	stages = list(_run['stages'].values())
+	report = {
+		'script':_run['script'],
+		'args':_run['args'],
+		'started':_run['started'],
+		'wallSeconds':time.perf_counter() - _run['wall'],
+		'cpuSeconds':time.process_time() - _run['cpu'],
+		'peakRssMB':peakRssMB(),
+		'stages':[{k:v for k,v in stage.items() if k != 'profile'} for stage in stages],
+	}
+
+	print(f"{report['script']} finished in {report['wallSeconds']:.1f} s (peak memory {report['peakRssMB']:.0f} MB)")
+	for stage in report['stages']:
+		print(f"\t{stage['stage']:<20} {stage['wallSeconds']:9.1f} s wall {stage['cpuSeconds']:9.1f} s CPU {stage['peakRssMB']:8.0f} MB peak {stage['rows']:>12,} rows")
+
+	if _run['reportFile'] is not None:
+		with open(_run['reportFile'],'w') as f:
+			json.dump(report,f,indent=1,default=float)
+	if _run['profileFolder'] is not None:
+		os.makedirs(_run['profileFolder'],exist_ok=True)
+		scriptName = os.path.splitext(_run['script'])[0]
+		for stage in stages:
+			stage['profile'].dump_stats(os.path.join(_run['profileFolder'],f"{scriptName}_{stage['stage'].replace(' ','_')}.prof"))
+
+	_run = None
+	return report
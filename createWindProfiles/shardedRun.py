@@ -0,0 +1,325 @@
+import os
+import re
+import sys
+import copy
+import json
+import time
+import shutil
+import socket
+import hashlib
+import argparse
+import traceback
+import subprocess
+import pandas as pd
+from pipeline import stageScripts,optionalStages,handoffs,perYearStages,splitScript,loadConfig,runPipeline
+
+# Sharded execution of the pipeline's plant level stages, split by plant across worker processes on one machine or several, coordinated only through a shared folder
+# The coordinator splits the plants into shards and writes a task file for each shard (and year, when only per-year stages are sharded) to <shardFolder>/tasks.
+# Workers claim tasks by moving their files to <shardFolder>/running (an atomic rename, so any number of workers, on any machines that share the folder, can
+# pull from the same queue), run the task's stages with pipeline.py for the shard's plants only (see plantIds in the scripts), and write their partial results
+# to <shardFolder>/partials/<task>. Once every task is done, the coordinator reduces the partial results:
+#	getHourlyGenByIso       - the ISO-hourly partial sums are added up
+#	getMonthlyGenByPlant    - the plant-monthly partials are concatenated
+#	windSpeedsToCF_sweep    - each year and variant's ISO-hourly partials are added up and its plant-monthly partials concatenated
+#	windSpeedsToCF_singleYr - nothing to reduce: each plant's profiles are written (if writeOutputs) by the task that ran it
+# writes them where the stages would have, and runs the config's remaining stages (e.g the curtailment adjustment and summary statistics) in one process,
+# handing them the reduced outputs in memory (see pipeline.py).
+# Each plant's years are all run by the same task when getHourlyGenByIso or getMonthlyGenByPlant are sharded, as their interpolation and hour-beginning
+# averaging of each plant run across year boundaries; so the reduced outputs are the same as an unsharded run's.
+#
+# The config is a pipeline.py config (see pipeline.loadConfig) with a "sharding" section:
+#	"shardFolder": the shared folder the tasks and partial results are kept in
+#	"plantsPerShard" (optional, default 100): the number of plants in each shard
+#	"plantInfoFile" (optional): file listing the plants to shard (by EIA_ID); by default the common plantInfoFile
+#	"plantIds" (optional): the EIA_IDs to shard, instead of those in plantInfoFile
+# Tasks already done (with the same config) are kept, so a coordinator that was stopped can be rerun to finish only the remaining tasks.
+#
+# Usage:
+#	python shardedRun.py run config.json [--workers 4] [--stages ...]   # the coordinator, with 4 local workers
+#	python shardedRun.py worker <shardFolder>                           # an extra worker, e.g on another machine with access to shardFolder
+
+# the stages that are sharded (the plant level stages), and those whose partial results are reduced
+shardedStages = ['windSpeedsToCF_singleYr','windSpeedsToCF_sweep','getHourlyGenByIso','getMonthlyGenByPlant']
+reducedStages = ['getHourlyGenByIso','getMonthlyGenByPlant']
+
+taskFolders = ['tasks','running','done','failed','partials']
+
+# crosswalk between BA names of ISOs and the ISO names, as in the stages' scripts
+baToIso = {
+	'CISO':'CAISO',
+	'ERCO':'ERCOT',
+	'MISO':'MISO' ,
+	'PJM' :'PJM'  ,
+	'SWPP':'SPP'  ,
+	'ISNE':'ISONE',
+	'NYIS':'NYISO'
+}
+
+# the User Input variables of stage's script: its defaults, overridden by the common variables it has and then its own variables in config
+def userInput(stage,config):
+	scope = {'__name__':'__main__','__file__':stageScripts[stage]}
+	argv = sys.argv
+	sys.argv = [stageScripts[stage],'0'] # the per-year scripts read their year from the command line
+	try:
+		exec(compile(splitScript(stageScripts[stage])[0],stageScripts[stage],'exec'),scope)
+	finally:
+		sys.argv = argv
+	scope.update({k:v for k,v in config.get('common',{}).items() if k in scope})
+	scope.update({k:v for k,v in config.get(stage,{}).items() if k != 'byYear'})
+	return scope
+
+# the (EIA_ID, year)s of plants that any of the sharded stages has work for: those with an input profile for the year (the wind speed files of
+# windSpeedsToCF_singleYr or windSpeedsToCF_sweep, or else the modelled generation profiles), that are in the stage's plantIds (if any), and, for
+# the stages that filter plants by ISO, capacity, and COD, that pass those filters. So no shard is made only of plants that every stage leaves out
+# (the filters that need the EIA 923 data aren't applied here, so a shard can still end up with no plants left; the stages then stop without any output)
+def plantYearsWithWork(config,stages,plants):
+	common = config.get('common',{})
+	plantYears = set()
+	for stage in stages:
+		settings = userInput(stage,config)
+		years = config.get(stage,{}).get('years',common.get('years')) if stage in perYearStages else settings['years']
+		stagePlants = set(plants) if settings.get('plantIds') is None else set(plants) & {int(eiaId) for eiaId in settings['plantIds']}
+		if stage != 'windSpeedsToCF_singleYr':
+			plantInfo = pd.read_csv(settings['plantInfoFile'],index_col='EIA_ID')
+			required = ['USWTDB-MW','USWTDB-SP'] if stage == 'windSpeedsToCF_sweep' else [settings['capacityCol']]
+			passes = plantInfo['eia_ba'].isin(baToIso.keys()) & plantInfo[required + ['eia_COD_Year','eia_COD_Month']].notna().all(axis=1)
+			stagePlants &= set(plantInfo.index[passes].astype(int))
+		# the stage's input profiles: wind speeds for the per-year stages, and for the others too when they are handed windSpeedsToCF_singleYr's CFs
+		profileStage = stage if stage in perYearStages else 'windSpeedsToCF_singleYr' if 'windSpeedsToCF_singleYr' in stages else None
+		for year in years:
+			if profileStage is not None:
+				profSettings = dict(userInput(profileStage,config),**config.get(profileStage,{}).get('byYear',{}).get(year,{}))
+				for fName in os.listdir(profSettings['windProfFolder']):
+					match = re.match(profSettings['windProfFileFormat'],fName)
+					if match and int(match.group('YEAR')) == year and int(match.group('EIA_ID')) in stagePlants:
+						plantYears.add((int(match.group('EIA_ID')),year))
+			else:
+				folder,fileFormat = (settings['gen2021Folder'],settings['gen2021ProfFormat']) if year == 2021 else (settings['genProfFolder'],settings['genProfFormat'])
+				plantYears.update((eiaId,year) for eiaId in stagePlants if os.path.exists(os.path.join(folder,fileFormat.format(EIA_ID=eiaId,YEAR=year))))
+	return plantYears
+
+# the tasks of a run: (task name, EIA_IDs, years) of each shard, and year if only per-year stages are sharded
+# only the plants the stages have work for (see plantYearsWithWork) are sharded; with per-year tasks, each year's plants are sharded separately
+def makeTasks(config,stages):
+	sharding = config['sharding']
+	if 'plantIds' in sharding:
+		plants = sorted(int(eiaId) for eiaId in sharding['plantIds'])
+	else:
+		plantInfoFile = sharding.get('plantInfoFile',config.get('common',{}).get('plantInfoFile'))
+		plants = sorted(pd.read_csv(plantInfoFile,usecols=['EIA_ID'])['EIA_ID'].astype(int).unique())
+	plantYears = plantYearsWithWork(config,stages,plants)
+	if not plantYears:
+		raise ValueError(f'None of the {len(plants)} plants to shard have a profile (for the years run) that passes the filters of {stages}')
+	print(f'{len({eiaId for eiaId,_ in plantYears})} of the {len(plants)} plants have work to shard')
+	years = config.get('common',{}).get('years')
+	perYear = all(stage in perYearStages for stage in stages)
+	if perYear:
+		years = sorted({year for stage in stages for year in config.get(stage,{}).get('years',years)})
+	size = sharding.get('plantsPerShard',100)
+	if perYear:
+		tasks = []
+		for year in years:
+			yearPlants = [eiaId for eiaId in plants if (eiaId,year) in plantYears]
+			tasks += [(f'shard{s:04d}_{year}',yearPlants[i:i+size],[year]) for s,i in enumerate(range(0,len(yearPlants),size))]
+		return tasks
+	plants = [eiaId for eiaId in plants if any((eiaId,year) in plantYears for year in years)]
+	return [(f'shard{s:04d}',plants[i:i+size],years) for s,i in enumerate(range(0,len(plants),size))]
+
+# the config a task runs: the shard's plants and years, with the reduced stages' outputs kept in memory and the sweep's written to the task's partials folder
+def taskConfig(config,task,partialFolder):
+	config = copy.deepcopy(config)
+	config.setdefault('common',{})['plantIds'] = task['plantIds']
+	for stage in task['stages']:
+		config.setdefault(stage,{})
+		if config[stage].get('plantIds') is not None: # a stage's own plantIds replace the common ones, so are limited to the shard's
+			config[stage]['plantIds'] = [eiaId for eiaId in config[stage]['plantIds'] if eiaId in task['plantIds']]
+		if stage in perYearStages:
+			config[stage]['years'] = task['years']
+		if stage in reducedStages:
+			config[stage]['writeOutputs'] = False
+		if stage == 'windSpeedsToCF_sweep':
+			config[stage].update(
+				variantsOutN=os.path.join(partialFolder,'variants_{YEAR}.csv'),
+				isoHourlyOutN=os.path.join(partialFolder,'isoHourly_{YEAR}_variant{VARIANT}.csv'),
+				plantMonthlyOutN=os.path.join(partialFolder,'plantMonthly_{YEAR}_variant{VARIANT}.csv'),
+			)
+	return config
+
+# runs a task, writing the outputs of its reduced stages to its partials folder
+def runTask(shardFolder,task):
+	partialFolder = os.path.join(shardFolder,'partials',task['name'])
+	shutil.rmtree(partialFolder,ignore_errors=True)
+	os.makedirs(partialFolder)
+	config = loadConfig(os.path.join(shardFolder,'config.json'))
+	results = runPipeline(taskConfig(config,task,partialFolder),task['stages'])
+	for stage in reducedStages:
+		if stage in results:
+			results[stage].to_pickle(os.path.join(partialFolder,f'{stage}.pkl'))
+
+# a worker: claims and runs tasks from shardFolder until there are none left
+def worker(shardFolder):
+	workerId = f'{socket.gethostname()}-{os.getpid()}'
+	while True:
+		waiting = sorted(os.listdir(os.path.join(shardFolder,'tasks')))
+		if not waiting:
+			return
+		claimed = os.path.join(shardFolder,'running',f'{waiting[0]}.{workerId}')
+		try:
+			os.rename(os.path.join(shardFolder,'tasks',waiting[0]),claimed) # atomic, so only one worker claims each task
+		except FileNotFoundError: # another worker claimed it first
+			continue
+		with open(claimed) as f:
+			task = json.load(f)
+		print(f'{workerId} running {task["name"]} ({len(task["plantIds"])} plants, {task["years"]})')
+		try:
+			runTask(shardFolder,task)
+			os.rename(claimed,os.path.join(shardFolder,'done',waiting[0]))
+		except Exception:
+			with open(os.path.join(shardFolder,'failed',waiting[0].replace('.json','.txt')),'w') as f:
+				f.write(traceback.format_exc())
+			os.rename(claimed,os.path.join(shardFolder,'failed',waiting[0]))
+
+# writes the task files of a run to shardFolder, keeping the tasks already done if the config hasn't changed since they were run
+def queueTasks(shardFolder,config,stages):
+	configText = json.dumps(config,default=str)
+	key = hashlib.md5((configText + json.dumps(stages)).encode()).hexdigest()
+	keyFile = os.path.join(shardFolder,'config.key')
+	if not os.path.exists(keyFile) or open(keyFile).read() != key:
+		for folder in taskFolders:
+			shutil.rmtree(os.path.join(shardFolder,folder),ignore_errors=True)
+	for folder in ['tasks','running','failed']: # tasks not done are queued again
+		shutil.rmtree(os.path.join(shardFolder,folder),ignore_errors=True)
+	for folder in taskFolders:
+		os.makedirs(os.path.join(shardFolder,folder),exist_ok=True)
+	with open(os.path.join(shardFolder,'config.json'),'w') as f:
+		f.write(configText)
+	with open(keyFile,'w') as f:
+		f.write(key)
+
+	done = set(os.listdir(os.path.join(shardFolder,'done')))
+	names = []
+	for name,plants,years in makeTasks(config,stages):
+		names.append(name)
+		if f'{name}.json' in done:
+			continue
+		with open(os.path.join(shardFolder,'tasks',f'{name}.json'),'w') as f:
+			json.dump({'name':name,'plantIds':[int(p) for p in plants],'years':years,'stages':stages},f)
+	return names
+
+# waits for the tasks to be done, by the local workers (processes) and any others; raises an error if any fail
+def waitForTasks(shardFolder,names,processes):
+	while True:
+		done = {f[:-len('.json')] for f in os.listdir(os.path.join(shardFolder,'done'))}
+		failed = sorted(f for f in os.listdir(os.path.join(shardFolder,'failed')) if f.endswith('.json'))
+		if failed:
+			raise RuntimeError(f'{len(failed)} tasks failed (see the .txt files in {os.path.join(shardFolder,"failed")}): {failed}')
+		if done >= set(names):
+			return
+		running = os.listdir(os.path.join(shardFolder,'running'))
+		if processes and all(p.poll() is not None for p in processes) and not running:
+			raise RuntimeError(f'The local workers have stopped with {len(set(names) - done)} tasks not done')
+		time.sleep(1)
+
+# adds up partial ISO-hourly generation: the modelled columns are summed, and columns that are the same in every partial (e.g reported generation) are kept
+# the rows are in the order they first appear in partials
+def sumIsoHourly(partials,sumCols):
+	combined = pd.concat(partials)
+	levels = list(combined.index.names)
+	summed = combined[sumCols].groupby(level=levels,observed=True,sort=False).sum()
+	kept = combined.drop(columns=sumCols).groupby(level=levels,observed=True,sort=False).first()
+	return pd.concat([summed,kept],axis=1)[combined.columns]
+
+# reduces the partial results of the tasks, writes them where the stages would have (if writeOutputs), and returns the reduced outputs by stage
+def reducePartials(shardFolder,names,config,stages):
+	partialFolders = [os.path.join(shardFolder,'partials',name) for name in names]
+	readPartials = lambda fName: [pd.read_pickle(os.path.join(folder,fName)) for folder in partialFolders if os.path.exists(os.path.join(folder,fName))]
+	reduced = {}
+	if 'getHourlyGenByIso' in stages:
+		print('Adding up the ISO-hourly partial sums')
+		partials = readPartials('getHourlyGenByIso.pkl') # a task whose shard had no plants left after the stage's filters has no partial
+		if not partials:
+			raise ValueError('None of the tasks had plants that passed the filters of getHourlyGenByIso')
+		genByIso = sumIsoHourly(partials,[c for c in partials[0].columns if c != 'Reported Gen MWh']).sort_index()
+		settings = userInput('getHourlyGenByIso',config)
+		if settings['writeOutputs']:
+			genByIso.groupby('ISO',observed=True).apply(lambda g: g.to_csv(settings['outN'].format(ISO=g.name)))
+		reduced['getHourlyGenByIso'] = genByIso
+	if 'getMonthlyGenByPlant' in stages:
+		print('Concatenating the plant-monthly partials')
+		partials = readPartials('getMonthlyGenByPlant.pkl')
+		if not partials:
+			raise ValueError('None of the tasks had plants that passed the filters of getMonthlyGenByPlant')
+		monthlyModGen = pd.concat(partials).sort_index()
+		settings = userInput('getMonthlyGenByPlant',config)
+		if settings['writeOutputs']:
+			monthlyModGen.to_csv(settings['outN'])
+		reduced['getMonthlyGenByPlant'] = monthlyModGen
+	if 'windSpeedsToCF_sweep' in stages:
+		print('Reducing the sweep partials')
+		settings = userInput('windSpeedsToCF_sweep',config)
+		for year in config['windSpeedsToCF_sweep'].get('years',config.get('common',{}).get('years')):
+			yearFolders = [folder for folder in partialFolders if os.path.exists(os.path.join(folder,f'variants_{year}.csv'))]
+			if not yearFolders: # none of the plants have a wind profile for year, so it has no tasks
+				print(f'No sweep partials for {year}')
+				continue
+			variants = pd.read_csv(os.path.join(yearFolders[0],f'variants_{year}.csv'),index_col='Variant')
+			variants.to_csv(settings['variantsOutN'].format(YEAR=year))
+			for v in variants.index:
+				isoHourly = [pd.read_csv(os.path.join(folder,f'isoHourly_{year}_variant{v}.csv'),index_col=['ISO','gmt']) for folder in yearFolders]
+				isoHourly = sumIsoHourly(isoHourly,list(isoHourly[0].columns))
+				plantMonthly = pd.concat([pd.read_csv(os.path.join(folder,f'plantMonthly_{year}_variant{v}.csv'),index_col=['EIA_ID','Year','Month']) for folder in yearFolders]).sort_index()
+				isoHourly.to_csv(settings['isoHourlyOutN'].format(YEAR=year,VARIANT=v))
+				plantMonthly.to_csv(settings['plantMonthlyOutN'].format(YEAR=year,VARIANT=v))
+	return reduced
+
+# runs config's stages (or the given stages): the sharded stages by the workers, then the rest in this process with the reduced outputs in memory
+# returns the outputs of the stages run whose outputs aren't used by any other stages run, as pipeline.runPipeline does
+def runSharded(config,stages=None,workers=0):
+	stages = stages or config.get('stages',[s for s in stageScripts if s not in optionalStages])
+	stages = [s for s in stageScripts if s in stages]
+	sharded = [s for s in stages if s in shardedStages]
+	rest = [s for s in stages if s not in shardedStages]
+	shardFolder = config['sharding']['shardFolder']
+	os.makedirs(shardFolder,exist_ok=True)
+
+	names = queueTasks(shardFolder,config,sharded)
+	print(f'{len(names)} tasks, {len(os.listdir(os.path.join(shardFolder,"tasks")))} left to run')
+	logFolder = os.path.join(shardFolder,'logs')
+	os.makedirs(logFolder,exist_ok=True)
+	processes = []
+	for w in range(workers):
+		with open(os.path.join(logFolder,f'worker{w}.log'),'w') as log:
+			processes.append(subprocess.Popen([sys.executable,os.path.abspath(__file__),'worker',shardFolder],stdout=log,stderr=subprocess.STDOUT))
+	try:
+		waitForTasks(shardFolder,names,processes)
+	finally:
+		for p in processes:
+			p.wait()
+
+	reduced = reducePartials(shardFolder,names,config,sharded)
+	if not rest:
+		return {stage:output for stage,output in reduced.items() if not any(consumer in stages for consumer,_ in handoffs.get(stage,[]))}
+	inputs = {}
+	if config.get('inMemory',True):
+		for stage,output in reduced.items():
+			for consumer,variable in handoffs.get(stage,[]):
+				if consumer in rest:
+					inputs.setdefault(consumer,{})[variable] = output
+	results = runPipeline(config,rest,inputs)
+	results.update({stage:output for stage,output in reduced.items() if not any(consumer in stages for consumer,_ in handoffs.get(stage,[]))})
+	return results
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Runs the plant level stages of the pipeline split by plant across workers, coordinated through a shared folder')
+	subparsers = parser.add_subparsers(dest='command',required=True)
+	run = subparsers.add_parser('run',help='queue the tasks, run them (with local workers, and any others started on shardFolder), and reduce their results')
+	run.add_argument('config',help='JSON config file (see loadConfig in pipeline.py), with a "sharding" section')
+	run.add_argument('--workers',type=int,default=os.cpu_count(),help='number of local worker processes (0 to only use workers started separately)')
+	run.add_argument('--stages',nargs='+',choices=list(stageScripts),help='the stages to run (by default, those in the config, or else all but the optional ones)')
+	work = subparsers.add_parser('worker',help='run tasks from shardFolder until none are left')
+	work.add_argument('shardFolder')
+	args = parser.parse_args()
+	if args.command == 'run':
+		runSharded(loadConfig(args.config),args.stages,args.workers)
+	else:
+		worker(args.shardFolder)
@@ -0,0 +1,142 @@
+import functools
+import numpy as np
+import pandas as pd
+
+# Shared timestamp codec
+# Our inputs hold hourly timestamps in two formats: YYYYMMDDHH integers (e.g 2020010113; the wind speed, air density, and CF profiles, and older HSL files)
+# and ISO-style strings (e.g '2020-01-01 13:00:00+00:00'; the outputs of pandas, e.g reported and modelled ISO-wide generation and the curtailment files).
+# Both are decoded straight to hours since the epoch (1970-01-01 00:00 UTC) with integer arithmetic on their digits,
+# instead of pd.to_datetime parsing (or inferring the format of) every string. Other formats fall back to pd.to_datetime.
+# Time is held as an int32 hour index, and only turned into pandas timestamps where they're needed (toTimestamps).
+# The local Year, Quarter, Month, and Hour of each hour of a year are looked up from tables built once per year and time zone and cached.
+#
+# Example uses:
+#	prof['gmt'] = parseTimes(prof['gmt'],utc=False)                              # YYYYMMDDHH integers -> tz-naive timestamps
+#	gen['gmt'] = parseTimes(gen['gmt'])                                          # '2020-01-01 13:00:00+00:00' -> UTC timestamps
+#	hours = decodeTimes(hsl['gmt_int'],'%Y%m%d%H')                              # -> int32 hours since the epoch
+#	labels = localCalendar(hours,['Month','Hour'],'US/Central')                 # the local month and hour of each hour
+
+EPOCH = pd.Timestamp('1970-01-01',tz='UTC')
+ONE_HOUR = pd.Timedelta(hours=1)
+hourDtype = np.int32 # enough for any hour until the year 246,000
+nsPerHour = 3600 * 10**9
+
+def hoursInYear(year):
+	return 8784 if year % 4 == 0 and not (year % 100 == 0 and year % 400 != 0) else 8760
+
+# returns the number of hours between the epoch and the start (00:00 UTC on Jan 1) of year
+def yearStartHour(year):
+	return (pd.Timestamp(year=year,month=1,day=1,tz='UTC') - EPOCH) // ONE_HOUR
+
+# returns the days between the epoch and each (proleptic Gregorian) date, from integer arrays of years, months, and days
+# (Howard Hinnant's days_from_civil: years are counted from March so the leap day is the last day of the year)
+def daysFromCivil(year,month,day):
+	year = np.asarray(year,dtype=np.int64) - (np.asarray(month) <= 2)
+	era = np.floor_divide(year,400)
+	yearOfEra = year - era*400
+	monthFromMarch = (np.asarray(month,dtype=np.int64) + 9) % 12
+	dayOfYear = (153*monthFromMarch + 2)//5 + np.asarray(day,dtype=np.int64) - 1
+	dayOfEra = yearOfEra*365 + yearOfEra//4 - yearOfEra//100 + dayOfYear
+	return era*146097 + dayOfEra - 719468
+
+# returns the hours since the epoch of each UTC date and hour, from integer arrays (e.g the first hour of each plant's COD month: civilHours(codYears,codMonths))
+def civilHours(year,month,day=1,hour=0):
+	return (daysFromCivil(year,month,day)*24 + np.asarray(hour,dtype=np.int64)).astype(hourDtype)
+
+# decodes YYYYMMDDHH integers (or strings of them) to hours since the epoch
+def decodeYmdh(values):
+	values = np.asarray(values).astype(np.int64)
+	return civilHours(values // 1000000,values // 10000 % 100,values // 100 % 100,values % 100)
+
+# the character positions of the year, month, day, and hour digits of ISO-style timestamps ('YYYY-MM-DD HH'), and of the separators between them
+isoFields = [[0,1,2,3],[5,6],[8,9],[11,12]]
+isoSeparators = {4:b'-',7:b'-',10:b' T',13:b':\x00'}
+
+# decodes ISO-style strings ('YYYY-MM-DD HH', optionally followed by ':MM:SS' and a UTC offset, e.g '2020-01-01 13:00:00+00:00') to hours since the epoch
+# timestamps without a UTC offset are taken to be in UTC; minutes (of the time and of the offset) are dropped
+# returns None if any of values isn't in this format
+def decodeIsoStrings(values):
+	strings = np.asarray(values,dtype='S32')
+	if len(strings) == 0:
+		return np.zeros(0,dtype=hourDtype)
+	chars = strings.view(np.uint8).reshape(len(strings),-1)
+	if chars.shape[1] < 14:
+		chars = np.pad(chars,((0,0),(0,14 - chars.shape[1]))) # so a timestamp that ends at the hour has a (null) character after it
+	digits = chars[:,:13] - np.uint8(ord('0')) # characters below '0' wrap around to above 9
+	if (digits[:,[p for positions in isoFields for p in positions]] > 9).any():
+		return None
+	for p,seps in isoSeparators.items():
+		if not np.isin(chars[:,p],np.frombuffer(seps,dtype=np.uint8)).all():
+			return None
+	year,month,day,hour = (sum(digits[:,p].astype(np.int64)*10**(len(positions)-1-i) for i,p in enumerate(positions)) for positions in isoFields)
+	hours = civilHours(year,month,day,hour).astype(np.int64)
+	# a UTC offset follows the seconds: '+HH:MM' or '-HH:MM' at position 19 (anything else after the seconds, e.g fractional seconds, isn't decoded here)
+	if chars.shape[1] > 19:
+		sign = chars[:,19]
+		if not np.isin(sign,np.frombuffer(b'+-Z\x00',dtype=np.uint8)).all():
+			return None
+		offsets = (chars[:,20].astype(np.int64) - ord('0'))*10 + chars[:,21].astype(np.int64) - ord('0')
+		hours = hours - np.where(sign == ord('+'),offsets,0) + np.where(sign == ord('-'),offsets,0)
+	return hours.astype(hourDtype)
+
+# decodes timestamps to hours since the epoch: YYYYMMDDHH integers, ISO-style strings, or (as a fallback) anything pd.to_datetime can parse
+# fmt (optional) is the strftime format of values, e.g '%Y%m%d%H' for YYYYMMDDHH strings; it's only needed to tell pd.to_datetime about other formats
+def decodeTimes(values,fmt=None):
+	values = values if isinstance(values,(pd.Series,pd.Index)) else pd.Series(values)
+	if values.dtype.kind in 'iu' or fmt == '%Y%m%d%H':
+		return decodeYmdh(values.to_numpy())
+	if values.dtype.kind == 'M':
+		return hourOffsets(values)
+	if fmt is None or fmt.startswith('%Y-%m-%d'):
+		hours = decodeIsoStrings(values.astype(str).to_numpy())
+		if hours is not None:
+			return hours
+	return hourOffsets(pd.to_datetime(values,format=fmt,utc=True,cache=True))
+
+# turns hours since the epoch into timestamps: UTC if utc, and otherwise tz-naive (in UTC)
+def toTimestamps(hours,utc=True,name=None):
+	times = pd.DatetimeIndex(np.asarray(hours,dtype=np.int64)*nsPerHour,name=name)
+	return times.tz_localize('UTC') if utc else times
+
+# parses timestamps (see decodeTimes) into a DatetimeIndex, as pd.to_datetime(values,utc=utc) would
+def parseTimes(values,fmt=None,utc=True):
+	return toTimestamps(decodeTimes(values,fmt),utc,getattr(values,'name',None))
+
+# converts a DatetimeIndex (tz-naive times are assumed to be in UTC) to integer hours since the epoch
+# works at any resolution of the timestamps (e.g pandas 3 parses strings to microseconds, so their asi8 isn't in nanoseconds)
+def hourOffsets(gmt):
+	gmt = pd.DatetimeIndex(gmt)
+	gmt = gmt.tz_localize('UTC') if gmt.tz is None else gmt.tz_convert('UTC')
+	return np.asarray((gmt - EPOCH) // ONE_HOUR,dtype=hourDtype)
+
+# returns a DataFrame with one row per UTC hour in year, giving the (local, if timeZone isn't UTC) Year, Quarter, Month, and Hour of that hour
+# e.g calendarLookup(2020,'US/Eastern').loc[0] is Year 2019, Quarter 4, Month 12, Hour 19
+# the result is cached, so don't modify it inplace
+@functools.lru_cache(maxsize=None)
+def calendarLookup(year,timeZone='UTC'):
+	gmt = pd.date_range(f'{year}-01-01',periods=hoursInYear(year),freq='h',tz='UTC')
+	local = gmt.tz_convert(timeZone)
+	return pd.DataFrame({
+		'Year':local.year,
+		'Quarter':local.quarter,
+		'Month':local.month,
+		'Hour':local.hour,
+	}).astype(np.int16)
+
+# calendarLookup for every year from firstYear to lastYear (inclusive), stacked into one table
+# row i of the table is the i-th hour after the start of firstYear
+@functools.lru_cache(maxsize=None)
+def calendarTable(firstYear,lastYear,timeZone='UTC'):
+	return pd.concat([calendarLookup(yr,timeZone) for yr in range(firstYear,lastYear+1)],ignore_index=True)
+
+# returns the given calendar columns (any of 'Year', 'Quarter', 'Month', and 'Hour') of each of hours (since the epoch) in timeZone, as a DataFrame of integer arrays
+def localCalendar(hours,cols,timeZone='UTC'):
+	hours = np.asarray(hours,dtype=np.int64)
+	if len(hours) == 0:
+		return pd.DataFrame({col:np.zeros(0,dtype=np.int16) for col in cols})
+	# the lookup tables are indexed by UTC hour, so only the UTC years of the first and last hours are needed
+	firstYear = (EPOCH + int(hours.min()) * ONE_HOUR).year
+	lastYear = (EPOCH + int(hours.max()) * ONE_HOUR).year
+	table = calendarTable(firstYear,lastYear,timeZone)
+	positions = hours - yearStartHour(firstYear)
+	return pd.DataFrame({col:table[col].to_numpy()[positions] for col in cols})
@@ -3,6 +3,12 @@ import re
 import sys
 import numpy as np
 import pandas as pd
+from powerCurves import loadPowerCurves,bracketPowerCurves,blendCurveValues,evalPowerCurves,powerCurveTables,smoothedPowerCurveTables,lookupPowerCurves,airDensityCorrection,wakeLossCorrection
+from airDensity import fleetAirDensity
+from biasCorrection import loadQuantileMaps,biasCorrectCFs
+from timeCodec import parseTimes
+from floatDtypes import compactFloats
+from runReport import startRun,beginStage,addToStage,endRun
 
 # ----- User Input -----
 year = int(sys.argv[1])
@@ -11,6 +17,7 @@ models = ['ERA5','MERRA2','HRRR'] # the wind models whose speeds are being turne
 
 windProfFolder = 'path/to/folderWithFilesContainingWindSpeeds' # folder with files containing wind speeds
 windProfFileFormat = '(?P<EIA_ID>\d+)_(?P<YEAR>\d+)_withHRRR.csv$' # file name format of the wind speed files within windProfFolder (as a python regular expression) 
+plantIds = None # if not None, a list of the EIA_IDs to include (e.g a shard's plants, see shardedRun.py); otherwise all plants with a wind speed file are included
 
 airDensityFolder = 'path/to/folderWithAirDensityFiles' # folder with air density files
 airDensityFileFormat = '(?P<EIA_ID>\d+)_(?P<YEAR>\d+).csv' # file name format of air density files
@@ -18,8 +25,37 @@ airDensityFileFormat = '(?P<EIA_ID>\d+)_(?P<YEAR>\d+).csv' # file name format of
 airDensityColName = 'MERRA2 air density (kg/m^3)' # Name of column in air density files with the air density data
 airDensityReference = 1.225 # air density at sea level in kg/m^3
 
+# where the air densities come from: 'files' reads them from the per-plant files in airDensityFolder, 'reanalysis' computes them at each plant's hub height,
+# for all plants at once, from the surface pressure, temperature, and humidity point series in pointSeriesFolder (see airDensity.py)
+airDensitySource = 'files'
+pointSeriesFolder = 'path/to/pointSeries' # folder compact_point_series.py (in downloadWindspeeds/) writes to (its PATH_OUT)
+densityModel = 'MERRA2' # the model of the point series
+densityVariables = {'pressure':'ps','temperature':'t2m','humidity':'qv2m'} # the point series' variables of surface pressure (Pa), 2 m temperature (K), and 2 m specific humidity (kg/kg)
+hubHeightCol = None # if not None, a column of specificPowerFile with each plant's hub height (m), used where it isn't empty
+defaultHubHeight = 80 # hub height (m) of plants without one in hubHeightCol
+lapseRate = 0.0065 # temperature lapse rate (K/m) from 2 m to hub height
+
 powerCurvesFolder = 'path/to/folderWithPowerCurveFiles' # folder of power curves
 powerCurveFileFormat = '(?P<SPECIFIC_POWER>\d+).csv$' # file name format of the power curves (as a python regular expression)
+maxTurbineOutput = 1500 # the maximum 'Turbine Output' of the power curves, which normalizes them into CFs. NOTE: If reusing this script, check that 1500 is still the maximum output!
+
+# how each plant's power curve is chosen from the power curves, by its specific power (see powerCurves.bracketPowerCurves):
+# 'nearest' uses the curve with the closest specific power, 'interpolate' blends the two curves whose specific powers bracket the plant's, weighted by how close each is
+powerCurveSelection = 'nearest'
+powerCurveTableStep = None # if not None, each plant's power curve is precomputed into a lookup table at this wind speed step (m/s, e.g 0.01), and CFs are looked up in it (interpolating linearly between entries) instead of evaluating the curve's polynomial
+
+# multi-turbine plant power curves (see powerCurves.smoothPowerCurveTables): if not None, each plant's power curve is smoothed with a normal distribution of wind speeds
+# around the modelled hourly speed, to account for the speeds varying across the plant's turbines and within the hour
+# either the distribution's standard deviation in m/s (e.g 1.0), or a dict of them by model (e.g {'ERA5':1.0,'MERRA2':1.2,'HRRR':0.8})
+# the smoothed curves are precomputed into lookup tables (at powerCurveTableStep, or 0.01 m/s if it is None), so they cost no more per hour than unsmoothed tables
+powerCurveSmoothing = None
+powerCurveSmoothingCol = None # if not None, a column of specificPowerFile with each plant's standard deviation (m/s), used instead of powerCurveSmoothing where it isn't empty
+powerCurveCacheFolder = None # if not None, the smoothed lookup tables are cached in this folder and re-used on later runs (as long as the power curves and standard deviations are the same)
+
+# wake losses (see powerCurves.wakeLoss): maxWakeLoss below (rated speed - wakeRampBelowRated), ramping down to no loss at (rated speed + wakeRampAboveRated)
+maxWakeLoss = 0.07
+wakeRampBelowRated = 0.5
+wakeRampAboveRated = 2.0
 
 specificPowerFile = 'path/to/fileWithSpecificPowerForEachPlant.csv' # file with specific power by EIA_ID
 
@@ -42,10 +78,22 @@ outputCols = [ # the desired columns to output
 	'HRRR CF (density and loss adjusted)'
 ]
 
+biasCorrectionFile = None # if not None, quantile maps fit by fitBiasCorrection.py; each model's CFs (of the variant the maps were fit to) are bias corrected with them and output as e.g 'HRRR CF (bias corrected)'
+
 fOutName = './path/to/outputFolder/ERA5_MERRA2_HRRR_windSpeedAndCF_2021/{EIA_ID}_{YEAR}.csv' # file name format for output files
+writeOutputs = True # if False, the outputs aren't written to fOutName (e.g when pipeline.py hands them to the next stage in memory instead)
+
+compactDtypes = False # if True, wind speeds, air densities, and CFs are stored (and written out) as float32 instead of float64, roughly halving memory use and output size
+runReportFile = None # if not None, a JSON file that the wall time, CPU time, peak memory, and rows processed of each stage of this run are written to (see runReport.py)
+profileFolder = None # if not None, each stage is profiled with cProfile and its profile is written to this folder
 # ----------------------
 
+floatDtype = np.float32 if compactDtypes else np.float64
+
+startRun(os.path.basename(__file__),runReportFile,profileFolder)
+
 # load in wind profile files
+beginStage('load')
 print('Loading in wind profiles')
 windProfs = {}
 for fName in os.listdir(windProfFolder):
@@ -54,11 +102,19 @@ for fName in os.listdir(windProfFolder):
 	eiaId = int(match.group('EIA_ID'))
 	yr = int(match.group('YEAR'))
 	if yr != year: continue # if file is for the wrong year, skip it
+	if plantIds is not None and eiaId not in plantIds: continue
 	if len(windProfs) % 100 == 0: # just a progress tracker as this for loop can take a long time
 		print(f'{len(windProfs)} loaded in')
 	prof = pd.read_csv(os.path.join(windProfFolder,fName))
-	prof['gmt'] = pd.to_datetime(prof['gmt'],format='%Y%m%d%H')
-	windProfs[eiaId] = prof.set_index('gmt')
+	prof['gmt'] = parseTimes(prof['gmt'],utc=False)
+	windProfs[eiaId] = compactFloats(prof,floatDtype).set_index('gmt')
+
+if not windProfs:
+	# nothing to turn into CFs (e.g a shard none of whose plants have a wind profile for year), so stop without any output
+	print(f'No wind profiles to turn into CFs for {year}')
+	windProfs = None
+	endRun()
+	sys.exit()
 
 windProfs = pd.concat(windProfs,names=['EIA_ID'])
 windProfs.sort_index(inplace=True) # improves performance later
@@ -66,84 +122,80 @@ windProfs.rename(columns=dict(
 	(f'{model}_wind_speed_m_per_sec',f'{model} wind speed (m/s)')
 	for model in models
 ),inplace=True) # just rename the columns to the desired format
+addToStage(windProfs)
 
 
 # load in air density
-print('Loading in air density files')
-
-# parses an air density file name and returns the EIA ID if one is found and None otherwise
-def eiaIdFromAirDensityFile(fName):
-	match = re.match(airDensityFileFormat,fName)
-	if match is None:
-		return None
-	return int(match.group('EIA_ID'))
-
-# create a dictionary mapping EIA IDs to the file name of their associated air density file
-airDensityFNames = dict(
-	(eiaIdFromAirDensityFile(fName),fName) for fName in os.listdir(airDensityFolder)
-)
-for i,eiaId in enumerate(windProfs.index.unique(level='EIA_ID')):
-	if i % 100 == 0: # progress tracker as this loop can take a while
-		print(f'{i}/{len(windProfs.index.unique(level="EIA_ID"))} air density files loaded in')
-	airDensityData = pd.read_csv(os.path.join(airDensityFolder,airDensityFNames[eiaId]))
-	airDensityData['gmt'] = pd.to_datetime(airDensityData['gmt'],format='%Y%m%d%H')
-	airDensityData.set_index('gmt',inplace=True)
-	# Note: the next line requires 8760/8784 rows for both the wind profile and the air density data
-	windProfs.loc[eiaId,'MERRA2 air density (kg/m^3)'] = airDensityData[airDensityColName].values
-
-# Apply air density correction to the wind speeds, according to:
-# WS_corrected = WS * (rho/rho_0)^(1/3)
-# where rho is air density, rho_0 is air density where the power curves (to be used later) are valid for, e.g sea level
-# WS is raw wind speed, and WS_corrected is the density corrected wind speed
+beginStage('density')
+
+if airDensitySource == 'reanalysis':
+	print(f'Computing hub-height air densities from {densityModel} point series')
+	eiaIds = windProfs.index.unique(level='EIA_ID')
+	hubHeights = pd.Series(float(defaultHubHeight),index=eiaIds)
+	if hubHeightCol is not None:
+		hubHeights = pd.read_csv(specificPowerFile,index_col='EIA_ID')[hubHeightCol].reindex(eiaIds).fillna(defaultHubHeight)
+	airDensities = fleetAirDensity(pointSeriesFolder,densityModel,year,eiaIds,hubHeights.to_numpy(),densityVariables,lapseRate) # (plants, hours)
+	# write each row's density straight from the fleet array, by its plant and hour of the year
+	plantPos = eiaIds.get_indexer(windProfs.index.get_level_values('EIA_ID'))
+	hourPos = ((windProfs.index.get_level_values('gmt') - pd.Timestamp(year=year,month=1,day=1)) / pd.Timedelta(hours=1)).to_numpy().astype(np.int64)
+	windProfs['MERRA2 air density (kg/m^3)'] = airDensities[plantPos,hourPos].astype(floatDtype)
+else:
+	print('Loading in air density files')
+
+	# parses an air density file name and returns the EIA ID if one is found and None otherwise
+	def eiaIdFromAirDensityFile(fName):
+		match = re.match(airDensityFileFormat,fName)
+		if match is None:
+			return None
+		return int(match.group('EIA_ID'))
+
+	# create a dictionary mapping EIA IDs to the file name of their associated air density file
+	airDensityFNames = dict(
+		(eiaIdFromAirDensityFile(fName),fName) for fName in os.listdir(airDensityFolder)
+	)
+	windProfs['MERRA2 air density (kg/m^3)'] = floatDtype(np.nan) # create the column up front so it keeps floatDtype as it is filled in below
+	for i,eiaId in enumerate(windProfs.index.unique(level='EIA_ID')):
+		if i % 100 == 0: # progress tracker as this loop can take a while
+			print(f'{i}/{len(windProfs.index.unique(level="EIA_ID"))} air density files loaded in')
+		airDensityData = pd.read_csv(os.path.join(airDensityFolder,airDensityFNames[eiaId]))
+		airDensityData['gmt'] = parseTimes(airDensityData['gmt'],utc=False)
+		airDensityData.set_index('gmt',inplace=True)
+		# Note: the next line requires 8760/8784 rows for both the wind profile and the air density data
+		windProfs.loc[eiaId,'MERRA2 air density (kg/m^3)'] = airDensityData[airDensityColName].values.astype(floatDtype)
+
+# Apply air density correction to the wind speeds (see powerCurves.airDensityCorrection)
 print('Applying air density correction to wind speeds')
 
-def airDensityCorrection(windSpeeds,airDensities,airDensityReference):
-	return windSpeeds * np.power(airDensities/airDensityReference,1/3)
-
 airDensities = windProfs['MERRA2 air density (kg/m^3)']
 for modelName in models:
 	windSpeeds = windProfs[f'{modelName} wind speed (m/s)']
 	windProfs[f'{modelName} density-corrected wind speed (m/s)'] = airDensityCorrection(windSpeeds,airDensities,airDensityReference)
 
 # load in power curve data
+beginStage('power curve')
 print('Loading in power curves')
 
-# finds cut-in speed, rated-speed,cut-out speed, and the coefficients of a 10th degree polynomial to model the curved part of the power curve
-# pwrCrv is a DataFrame of power curve data, with an index of wind speeds and a generation column (e.g 'CF' or 'Turbine Output')
-def fitPowerCurve(pwrCrv,genCol='CF'):
-	cutIn  = pwrCrv.index[pwrCrv[genCol] != 0].min()
-	cutOut = pwrCrv.index[pwrCrv[genCol] != 0].max()
-	rated  = pwrCrv.index[pwrCrv[genCol] == pwrCrv[genCol].max()].min()
-	polySpeeds = pwrCrv.index[(pwrCrv.index >= cutIn) & (pwrCrv.index <= rated)]
-	polyCoeffs = np.polyfit(polySpeeds,pwrCrv.loc[polySpeeds,genCol],10)
-	return (cutIn,cutOut,rated,polyCoeffs)
-
-powerCurves = {}
-for fName in os.listdir(powerCurvesFolder):
-	match = re.match(powerCurveFileFormat,fName)
-	if match is None: continue # if file name doesn't match the format of a power curve file, skip it
-	specificPower = int(match.group('SPECIFIC_POWER'))
-	powerCurve = pd.read_csv(os.path.join(powerCurvesFolder,fName),index_col='Wind Speed (m/s)')
-	powerCurve['CF'] = powerCurve['Turbine Output'] / 1500 # NOTE: If reusing this script, check that 1500 is still the maximum output!
-	powerCurves[specificPower] = fitPowerCurve(powerCurve) # store the cut-in speed, rated speed, etc in powerCurves
-
-powerCurves = pd.DataFrame.from_dict(powerCurves,orient='index',columns=['cutIn','cutOut','rated','coeffs'])
-powerCurves.sort_index(inplace=True) # improves performance later
-powerCurves.index.rename('Specific Power',inplace=True) # just for clarity, it isn't important otherwise
+# the cut-in speed, rated speed, cut-out speed, and polynomial coefficients of each power curve, by specific power (see powerCurves.fitPowerCurve)
+powerCurves = loadPowerCurves(powerCurvesFolder,powerCurveFileFormat,maxTurbineOutput)
 
 # load in Specific Powers of each plant
 specificPowers = pd.read_csv(specificPowerFile,index_col='EIA_ID')
 
-# match each plant's SP to the closest SP among the SPs of the power curves
-# returns the specific power in powerCurves.index closest to the given specific power
-def closestPowerCurveSP(plantSp):
-	if np.isnan(plantSp):
-		return np.nan
-	dists = (powerCurves.index - plantSp).map(abs)
-	return powerCurves.index[dists.argmin()]
-
-specificPowers['closestPowerCurveSP'] = specificPowers['USWTDB-SP'].apply(closestPowerCurveSP) # 'USWTDB-SP contains the specific power for each plant
-windProfs['pwrCrvSP'] = specificPowers.loc[windProfs.index.get_level_values('EIA_ID'),'closestPowerCurveSP'].values
+# match each plant's SP to the SPs of the power curves, for all plants at once with a sorted search
+# curveLo and curveHi are the positions (in powerCurves) of each plant's curves, and curveWeight the weight of curveHi (0 unless interpolating)
+curveLo,curveHi,curveWeight = bracketPowerCurves(powerCurves.index,specificPowers['USWTDB-SP'],interpolate=(powerCurveSelection == 'interpolate')) # 'USWTDB-SP contains the specific power for each plant
+plantIdx = specificPowers.index.get_indexer(windProfs.index.get_level_values('EIA_ID')) # the position (in specificPowers) of each row's plant
+if (plantIdx < 0).any(): # get_indexer gives -1 for plants not in specificPowerFile, which would index the last plant's curves
+	missingIds = windProfs.index.get_level_values('EIA_ID')[plantIdx < 0].unique()
+	raise KeyError(f'EIA_IDs missing from specificPowerFile: {sorted(missingIds)}')
+smoothCurves = powerCurveSmoothing is not None or powerCurveSmoothingCol is not None
+blendCurves = powerCurveSelection == 'interpolate' or powerCurveTableStep is not None or smoothCurves
+
+if not blendCurves:
+	specificPowers['closestPowerCurveSP'] = pd.Series(powerCurves.index[curveLo],index=specificPowers.index).where(curveLo >= 0)
+	windProfs['pwrCrvSP'] = specificPowers['closestPowerCurveSP'].to_numpy()[plantIdx]
+	if compactDtypes:
+		windProfs['pwrCrvSP'] = windProfs['pwrCrvSP'].astype('category') # stores a small integer code per hour instead of a float64
 
 # runs an np.ndarray through the power curve data in powerCurves.loc[specificPower]
 # returns CFs, not generation
@@ -165,10 +217,53 @@ genCols = genRawCols + genCorrCols
 # run wind speeds through power curves
 print('Running wind speeds through power curves')
 
-for sp in windProfs['pwrCrvSP'].unique():
-	idx = windProfs['pwrCrvSP'] == sp # select plants with SP matchin sp
-	ws = windProfs.loc[idx,wsCols]    # select the wind speeds for those plants
-	windProfs.loc[idx,genCols] = evalPowerCurve(ws,sp) # run the wind speeds through the power curve associated with sp
+for col in genCols:
+	windProfs[col] = floatDtype(np.nan) # create the columns up front so they keep floatDtype as they are filled in below
+
+if not blendCurves:
+	for sp in windProfs['pwrCrvSP'].unique():
+		idx = windProfs['pwrCrvSP'] == sp # select plants with SP matchin sp
+		ws = windProfs.loc[idx,wsCols]    # select the wind speeds for those plants
+		windProfs.loc[idx,genCols] = evalPowerCurve(ws,sp).astype(floatDtype) # run the wind speeds through the power curve associated with sp
+elif powerCurveTableStep is None and not smoothCurves:
+	# each row's CF is the weighted sum of its plant's two curves, so each curve is evaluated for the rows of every plant it is one of the two curves of
+	rowLo,rowHi,rowWeight = curveLo[plantIdx],curveHi[plantIdx],curveWeight[plantIdx]
+	ws = windProfs[wsCols].to_numpy(dtype=np.float64)
+	gen = np.zeros_like(ws)
+	for c in np.union1d(rowLo,rowHi):
+		if c < 0: continue # plants without a specific power
+		cutIn,cutOut,rated,polyCoeffs = powerCurves.iloc[c]
+		for rows,weight in [(rowLo == c,1-rowWeight),((rowHi == c) & (rowHi != rowLo),rowWeight)]:
+			if rows.any():
+				gen[rows] += weight[rows,None] * evalPowerCurves(ws[rows],cutIn,cutOut,rated,polyCoeffs)
+	gen[rowLo < 0] = np.nan
+	windProfs[genCols] = gen.astype(floatDtype)
+	del ws,gen
+elif smoothCurves:
+	# each plant's smoothing width for each model, with the smoothed tables of each curve precomputed once per unique width
+	tableStep = powerCurveTableStep or 0.01
+	smoothingByModel = powerCurveSmoothing if isinstance(powerCurveSmoothing,dict) else {model:powerCurveSmoothing or 0.0 for model in models}
+	plantWidths = pd.DataFrame({model:float(smoothingByModel[model]) for model in models},index=specificPowers.index)
+	if powerCurveSmoothingCol is not None:
+		plantWidths = plantWidths.apply(lambda col: specificPowers[powerCurveSmoothingCol].astype(float).fillna(col))
+	speeds,widths,smoothedTables = smoothedPowerCurveTables(powerCurves,plantWidths.to_numpy().ravel(),tableStep,powerCurveCacheFolder)
+	nCurves = len(powerCurves)
+	smoothedTables = smoothedTables.reshape(len(widths)*nCurves,len(speeds)) # (widths x curves, wind speeds)
+	for model,wsRawCol,wsCorrCol,genRawCol,genCorrCol in zip(models,wsRawCols,wsCorrCols,genRawCols,genCorrCols):
+		widthIdx = np.searchsorted(widths,np.round(plantWidths[model].to_numpy()/tableStep) * tableStep)
+		widthIdx = np.clip(widthIdx,0,len(widths)-1) # guards against floating point differences in the rounding
+		plantTables = blendCurveValues(smoothedTables,np.where(curveLo >= 0,widthIdx*nCurves + curveLo,-1),widthIdx*nCurves + curveHi,curveWeight)
+		for wsCol,genCol in [(wsRawCol,genRawCol),(wsCorrCol,genCorrCol)]:
+			windProfs[genCol] = lookupPowerCurves(plantTables,plantIdx,windProfs[wsCol].to_numpy(dtype=np.float64),tableStep).astype(floatDtype)
+		del plantTables
+	del smoothedTables
+else:
+	# precompute each plant's (possibly blended) power curve into a lookup table, so each CF is a gather from its plant's table
+	speeds,curveTables = powerCurveTables(powerCurves,powerCurveTableStep)
+	plantTables = blendCurveValues(curveTables,curveLo,curveHi,curveWeight) # (plants, wind speeds)
+	for wsCol,genCol in zip(wsCols,genCols):
+		windProfs[genCol] = lookupPowerCurves(plantTables,plantIdx,windProfs[wsCol].to_numpy(dtype=np.float64),powerCurveTableStep).astype(floatDtype)
+	del plantTables
 
 """ Quick Aside:
 	* The above for loop can be simplified to the following two lines
@@ -178,29 +273,40 @@ windProfs.set_index('pwrCrvSP',append=True,inplace=True)
 windProfs[genCols] = windProfs.groupby('pwrCrvSP')[wsCols].transform(lambda g: evalPowerCurve(g,g.index[0][-1])).values
 """
 
-# apply Wake losses to generation, according to:
+# apply Wake losses to generation (see powerCurves.wakeLoss), by default:
 # When: WS < (RS - 0.5): loss = 7% (i.e., multiply power curve output by 93%) 
 # When: WS >= (RS - 0.5) and WS <= (RS + 2.0): loss = 7% - (7%)(WS - RS*)/(2.5), where RS* = RS - 0.5 
 # When: WS > RS+2: loss = 0%  
 # where, WS = wind speed in meters per second and 
 # RS = Rated speed of the turbine power curve (i.e., the first WS at which output equals its peak value)
+beginStage('losses')
 print('Applying Wake losses to generation')
 
-def wakeLossCorrection(ws,rs,generation):
-	loss = np.zeros_like(ws) # start with all losses being 0
-	loss[ws < rs - 0.5] = 0.07
-	np.putmask(loss,(ws >= rs - 0.5) & (ws <= rs + 2),0.07 - 0.07 * (ws - rs + 0.5)/2.5)
-	# Note: the entries of loss[ws > rs + 2] are 0 because loss started out as all zeros
-	return generation * (1 - loss)
-
-windProfs['Rated Speed'] = powerCurves.loc[windProfs['pwrCrvSP'],'rated'].values
+if not blendCurves:
+	windProfs['Rated Speed'] = powerCurves.loc[windProfs['pwrCrvSP'],'rated'].values.astype(floatDtype)
+else:
+	windProfs['Rated Speed'] = blendCurveValues(powerCurves['rated'],curveLo,curveHi,curveWeight)[plantIdx].astype(floatDtype) # interpolated plants use the blend of their curves' rated speeds
 for model in models:
 	wsDensityCorr = windProfs[f'{model} density-corrected wind speed (m/s)']
 	genDensityCorr = windProfs[f'{model} CF (density adjusted)']
 	genWakeLossCol = f'{model} CF (density and loss adjusted)'
-	windProfs[genWakeLossCol] = wakeLossCorrection(wsDensityCorr,windProfs['Rated Speed'],genDensityCorr)
+	windProfs[genWakeLossCol] = wakeLossCorrection(wsDensityCorr,windProfs['Rated Speed'],genDensityCorr,maxWakeLoss,wakeRampBelowRated,wakeRampAboveRated).astype(floatDtype)
+
+# bias correct the CFs toward reported generation with quantile maps (see biasCorrection.py)
+if biasCorrectionFile is not None:
+	beginStage('bias correction')
+	print('Bias correcting CFs')
+	maps,mapsVariant = loadQuantileMaps(biasCorrectionFile)
+	for model in models:
+		windProfs[f'{model} CF (bias corrected)'] = biasCorrectCFs(windProfs[f'{model} CF ({mapsVariant})'],maps,model).astype(floatDtype)
+	outputCols = outputCols + [f'{model} CF (bias corrected)' for model in models]
+	addToStage(windProfs)
 
 # output final data to CSVs
-print('Outputting wind speeds and CFs to CSVS')
-for eiaId in windProfs.index.get_level_values('EIA_ID').unique():
-	windProfs.loc[eiaId,outputCols].to_csv(fOutName.format(EIA_ID=eiaId,YEAR=year),index_label='gmt',date_format='%Y%m%d%H')
+if writeOutputs:
+	beginStage('write')
+	print('Outputting wind speeds and CFs to CSVS')
+	for eiaId in windProfs.index.get_level_values('EIA_ID').unique():
+		windProfs.loc[eiaId,outputCols].to_csv(fOutName.format(EIA_ID=eiaId,YEAR=year),index_label='gmt',date_format='%Y%m%d%H')
+
+endRun()
@@ -0,0 +1,233 @@
+import os
+import re
+import sys
+import numpy as np
+import pandas as pd
+from powerCurves import loadPowerCurves,bracketPowerCurves,evalPowerCurves,wakeLoss
+from airDensity import fleetAirDensity
+from calendarAggregation import hoursInYear,periodSums
+from runReport import startRun,beginStage,addToStage,endRun
+
+# Parameter sweep of the power curve and loss assumptions of windSpeedsToCF_singleYr.py
+# Every combination (variant) of the air density reference, the maximum turbine output the power curves are normalized by, and the wake loss parameters
+# is evaluated in one pass over the wind speeds: the CF computation has a variant axis (arrays of shape (variants, plants, hours)), so the wind speed
+# and air density files are only read once, a batch of plants at a time.
+# Instead of full plant profiles, each variant's density and loss adjusted generation is summed into ISO-hourly and plant-monthly totals,
+# which are written to one pair of files per variant (as named in the variants file).
+# Like getHourlyGenByIso.py and getMonthlyGenByPlant.py, missing hours are interpolated, instantModels are hour-beginning averaged,
+# and hours before a plant's COD are dropped (but as only one year is swept, its last hour is hour-beginning averaged with itself rather than with the next year's first hour).
+# The EIA 923 CF and repowering screening of those scripts is not applied
+# (pass the plants they keep as plantIds to compare variants on the same plants).
+# Usage: python windSpeedsToCF_sweep.py YEAR
+
+# ----- User Input -----
+year = int(sys.argv[1])
+
+models = ['ERA5','MERRA2','HRRR'] # the wind models whose speeds are being turned into CFs, e.g ['ERA5','MERRA2','HRRR']
+
+windProfFolder = 'path/to/folderWithFilesContainingWindSpeeds' # folder with files containing wind speeds
+windProfFileFormat = '(?P<EIA_ID>\d+)_(?P<YEAR>\d+)_withHRRR.csv$' # file name format of the wind speed files within windProfFolder (as a python regular expression)
+
+airDensityFolder = 'path/to/folderWithAirDensityFiles' # folder with air density files
+airDensityFileFormat = '(?P<EIA_ID>\d+)_(?P<YEAR>\d+).csv' # file name format of air density files
+airDensityColName = 'MERRA2 air density (kg/m^3)' # Name of column in air density files with the air density data
+
+# where the air densities come from: 'files' or 'reanalysis' (see windSpeedsToCF_singleYr.py and airDensity.py)
+airDensitySource = 'files'
+pointSeriesFolder = 'path/to/pointSeries' # folder compact_point_series.py (in downloadWindspeeds/) writes to (its PATH_OUT)
+densityModel = 'MERRA2' # the model of the point series
+densityVariables = {'pressure':'ps','temperature':'t2m','humidity':'qv2m'} # the point series' variables of surface pressure (Pa), 2 m temperature (K), and 2 m specific humidity (kg/kg)
+hubHeightCol = None # if not None, a column of plantInfoFile with each plant's hub height (m), used where it isn't empty
+defaultHubHeight = 80 # hub height (m) of plants without one in hubHeightCol
+lapseRate = 0.0065 # temperature lapse rate (K/m) from 2 m to hub height
+
+powerCurvesFolder = 'path/to/folderWithPowerCurveFiles' # folder of power curves
+powerCurveFileFormat = '(?P<SPECIFIC_POWER>\d+).csv$' # file name format of the power curves (as a python regular expression)
+
+plantInfoFile = 'path/to/fileWithPlantSpecifics.csv' # file containing, for each plant (indexed by EIA_ID): capacity (MW), the BA it is in, the COD year and month, and specific power
+plantIds = None # if not None, a list of the EIA_IDs to include (e.g the plants kept by getHourlyGenByIso.py); otherwise all plants in an ISO with a capacity, COD, and specific power are included
+
+# the grid of assumptions to sweep: every combination of these is a variant
+airDensityReferences = [1.225] # air densities (kg/m^3) the power curves are valid at
+maxTurbineOutputs = [1500] # maximum 'Turbine Output' of the power curves, which normalizes them into CFs
+maxWakeLosses = [0.07] # wake losses below rated speed (see powerCurves.wakeLoss)
+wakeRampsBelowRated = [0.5] # the wake losses ramp down to 0 from (rated speed - wakeRampBelowRated)...
+wakeRampsAboveRated = [2.0] # ...to (rated speed + wakeRampAboveRated)
+
+hourBegAvg = True # True if the models in instantModels should have their generation hour-beginning averaged, False otherwise
+instantModels = ['ERA5','HRRR'] # only populate if hourBegAvg is True. Otherwise, this variable is not used
+
+plantBatchSize = 50 # number of plants whose wind speeds are held (with every variant's generation) at a time; peak memory scales with plantBatchSize x variants x hours
+
+variantsOutN = './path/to/outputFolder/powerCurveSweep/variants_{YEAR}.csv' # file listing the assumptions of each variant
+isoHourlyOutN = './path/to/outputFolder/powerCurveSweep/hourlyGenByIso_{YEAR}_variant{VARIANT}.csv' # ISO-hourly generation of each variant
+plantMonthlyOutN = './path/to/outputFolder/powerCurveSweep/monthlyGenByPlant_{YEAR}_variant{VARIANT}.csv' # plant-monthly generation of each variant
+
+runReportFile = None # if not None, a JSON file that the wall time, CPU time, peak memory, and rows processed of each stage of this run are written to (see runReport.py)
+profileFolder = None # if not None, each stage is profiled with cProfile and its profile is written to this folder
+# ----------------------
+
+# crosswalk between BA names of ISOs and the ISO names
+baToIso = {
+	'CISO':'CAISO',
+	'ERCO':'ERCOT',
+	'MISO':'MISO' ,
+	'PJM' :'PJM'  ,
+	'SWPP':'SPP'  ,
+	'ISNE':'ISONE',
+	'NYIS':'NYISO'
+}
+
+startRun(os.path.basename(__file__),runReportFile,profileFolder)
+beginStage('power curve')
+
+# the variants, in the order of the variant axis below
+variants = pd.MultiIndex.from_product(
+	[airDensityReferences,maxTurbineOutputs,maxWakeLosses,wakeRampsBelowRated,wakeRampsAboveRated],
+	names=['airDensityReference','maxTurbineOutput','maxWakeLoss','wakeRampBelowRated','wakeRampAboveRated']
+).to_frame(index=False).rename_axis('Variant')
+nVariants = len(variants)
+print(f'Sweeping {nVariants} variants')
+
+# the wake loss parameters of each combination, shaped to broadcast against (plants, hours)
+wakeParams = pd.MultiIndex.from_product([maxWakeLosses,wakeRampsBelowRated,wakeRampsAboveRated]).to_frame(index=False).to_numpy()
+maxLoss,rampBelow,rampAbove = (wakeParams[:,i,None,None] for i in range(3))
+densityRefs = np.array(airDensityReferences,dtype=float)[:,None,None]
+
+# the power curves normalized by each maxTurbineOutput
+# (only their polynomials change, as the cut-in, rated, and cut-out speeds don't depend on the normalization)
+curvesByOutput = [loadPowerCurves(powerCurvesFolder,powerCurveFileFormat,maxOutput) for maxOutput in maxTurbineOutputs]
+powerCurves = curvesByOutput[0]
+curveCoeffs = np.stack([np.stack(curves['coeffs'].to_numpy()) for curves in curvesByOutput]) # (outputs, specific powers, polynomial coefficients)
+
+# choose the plants to sweep, and match each to the power curve with the closest specific power
+plantInfo = pd.read_csv(plantInfoFile,index_col='EIA_ID')
+plantInfo = plantInfo[plantInfo['eia_ba'].isin(baToIso.keys()) & plantInfo[['USWTDB-MW','USWTDB-SP','eia_COD_Year','eia_COD_Month']].notna().all(axis=1)]
+if plantIds is not None:
+	plantInfo = plantInfo[plantInfo.index.isin(plantIds)]
+
+windProfFNames = {}
+for fName in os.listdir(windProfFolder):
+	match = re.match(windProfFileFormat,fName)
+	if match and int(match.group('YEAR')) == year:
+		windProfFNames[int(match.group('EIA_ID'))] = fName
+airDensityFNames = {}
+for fName in os.listdir(airDensityFolder) if airDensitySource == 'files' else []:
+	match = re.match(airDensityFileFormat,fName)
+	if match:
+		airDensityFNames[int(match.group('EIA_ID'))] = fName
+
+plantInfo = plantInfo[plantInfo.index.isin(list(windProfFNames)) & (plantInfo.index.isin(list(airDensityFNames)) | (airDensitySource == 'reanalysis'))].sort_index()
+plants = plantInfo.index
+isos = [iso for iso in baToIso.values() if iso in set(plantInfo['eia_ba'].map(baToIso))]
+plantIsos = plantInfo['eia_ba'].map(baToIso).map({iso:i for i,iso in enumerate(isos)}).to_numpy()
+plantCurves,_,_ = bracketPowerCurves(powerCurves.index,plantInfo['USWTDB-SP'])
+print(f'{len(plants)} plants in {len(isos)} ISOs')
+
+# hours of the year, and whether each plant is operating (after its COD) in each hour
+nHours = hoursInYear(year)
+gmt = pd.date_range(f'{year}-01-01',periods=nHours,freq='h',tz='UTC',name='gmt')
+cods = pd.to_datetime(plantInfo[['eia_COD_Year','eia_COD_Month']].rename(columns={'eia_COD_Year':'year','eia_COD_Month':'month'}).assign(day=1),utc=True)
+# months with at least one hour after the plant's COD (the other months have no plant-monthly generation)
+operatingMonths,_ = periodSums((gmt.to_numpy()[None,:] >= cods.to_numpy()[:,None]).astype(np.int64),year,'Month',axis=-1)
+operatingMonths = operatingMonths > 0
+
+# with airDensitySource = 'reanalysis', the hub-height air densities of every plant are computed up front, for all plants at once
+fleetAirDensities = None
+if airDensitySource == 'reanalysis':
+	print(f'Computing hub-height air densities from {densityModel} point series')
+	hubHeights = plantInfo[hubHeightCol].fillna(defaultHubHeight) if hubHeightCol is not None else pd.Series(float(defaultHubHeight),index=plants)
+	fleetAirDensities = fleetAirDensity(pointSeriesFolder,densityModel,year,plants,hubHeights.to_numpy(),densityVariables,lapseRate) # (plants, hours)
+
+# fills NaNs in the last axis of gen (variants, hours) by linear interpolation between the nearest valid hours (missing hours at the ends take the nearest valid value)
+# valid is the hours that aren't missing, which are the same for every variant
+def interpolateMissing(gen,valid):
+	validIdx = np.flatnonzero(valid)
+	if len(validIdx) == len(valid) or len(validIdx) == 0:
+		return gen
+	missingIdx = np.flatnonzero(~valid)
+	k = np.searchsorted(validIdx,missingIdx)
+	lo = validIdx[np.maximum(k-1,0)]
+	hi = validIdx[np.minimum(k,len(validIdx)-1)]
+	w = np.where(hi > lo,(missingIdx-lo)/np.maximum(hi-lo,1),0)
+	gen[:,missingIdx] = gen[:,lo]*(1-w) + gen[:,hi]*w
+	return gen
+
+# the hour-beginning average of the last axis of gen (the last hour keeps its value)
+def hourBeginningAvg(gen):
+	return (gen + np.concatenate([gen[...,1:],gen[...,-1:]],axis=-1))/2
+
+# the ISO-hourly and plant-monthly sums of every variant's generation
+isoHourlyGen = np.zeros((nVariants,len(isos),nHours,len(models)))
+plantMonthlyGen = np.full((nVariants,len(plants),12,len(models)),np.nan)
+
+nBatches = -(-len(plants) // plantBatchSize) # ceiling division
+for b in range(nBatches):
+	batch = slice(b*plantBatchSize,min((b+1)*plantBatchSize,len(plants)))
+	batchPlants = plants[batch]
+	print(f'Sweeping plant batch {b+1}/{nBatches}')
+
+	# load in the wind speeds and air densities of the batch's plants
+	beginStage('load')
+	windSpeeds = np.empty((len(models),len(batchPlants),nHours))
+	airDensities = np.empty((len(batchPlants),nHours)) if fleetAirDensities is None else fleetAirDensities[batch]
+	for j,eiaId in enumerate(batchPlants):
+		prof = pd.read_csv(os.path.join(windProfFolder,windProfFNames[eiaId]),usecols=[f'{model}_wind_speed_m_per_sec' for model in models])
+		# Note: like windSpeedsToCF_singleYr.py, this requires 8760/8784 rows for both the wind profile and the air density data
+		assert len(prof) == nHours, f'{eiaId} does not have one row per hour of {year}'
+		for m,model in enumerate(models):
+			windSpeeds[m,j] = prof[f'{model}_wind_speed_m_per_sec'].to_numpy()
+		if fleetAirDensities is None:
+			airDensity = pd.read_csv(os.path.join(airDensityFolder,airDensityFNames[eiaId]),usecols=[airDensityColName])
+			assert len(airDensity) == nHours, f'{eiaId} does not have one row per hour of {year}'
+			airDensities[j] = airDensity[airDensityColName].to_numpy()
+	addToStage(rows=len(batchPlants)*nHours)
+
+	# each plant's power curve, shaped to broadcast against (plants, hours)
+	curves = powerCurves.iloc[plantCurves[batch]]
+	cutIn,cutOut,rated = (curves[c].to_numpy(dtype=float)[:,None] for c in ['cutIn','cutOut','rated'])
+	coeffs = curveCoeffs[:,plantCurves[batch],None,:] # (outputs, plants, 1, coefficients)
+	caps = plantInfo['USWTDB-MW'].to_numpy()[batch,None]
+	operating = gmt.to_numpy()[None,:] >= cods.to_numpy()[batch,None]
+
+	densityFactor = np.power(airDensities[None]/densityRefs,1/3) # (density references, plants, hours)
+	for m,model in enumerate(models):
+		# density corrected wind speeds through every normalization of the power curves, then every set of wake losses
+		beginStage('power curve')
+		wsCorr = windSpeeds[m][None] * densityFactor
+		cf = evalPowerCurves(wsCorr[:,None],cutIn,cutOut,rated,coeffs) # (density references, outputs, plants, hours)
+		beginStage('losses')
+		loss = wakeLoss(wsCorr[:,None],rated,maxLoss,rampBelow,rampAbove) # (density references, wake losses, plants, hours)
+		gen = (cf[:,:,None] * (1 - loss[:,None])).reshape(nVariants,len(batchPlants),nHours) * caps
+		del cf,loss
+
+		beginStage('aggregation')
+		valid = ~np.isnan(windSpeeds[m])
+		for j in range(len(batchPlants)):
+			gen[:,j] = interpolateMissing(gen[:,j],valid[j])
+		if hourBegAvg and model in instantModels:
+			gen = hourBeginningAvg(gen)
+		gen = np.where(operating,gen,0) # hours before a plant's COD are dropped
+
+		for i in range(len(isos)):
+			inIso = plantIsos[batch] == i
+			if inIso.any():
+				isoHourlyGen[:,i,:,m] += gen[:,inIso].sum(axis=1)
+		monthly,_ = periodSums(gen,year,'Month',axis=-1)
+		plantMonthlyGen[:,batch,:,m] = np.where(operatingMonths[batch],monthly,np.nan)
+		del gen
+
+# write out the variants, then each variant's ISO-hourly and plant-monthly generation
+beginStage('write')
+genCols = [f'{model} Gen MWh (density and loss adjusted)' for model in models]
+variants.to_csv(variantsOutN.format(YEAR=year))
+isoHourlyIdx = pd.MultiIndex.from_product([isos,gmt],names=['ISO','gmt'])
+plantMonthlyIdx = pd.MultiIndex.from_product([plants,[year],range(1,13)],names=['EIA_ID','Year','Month'])
+for v in range(nVariants):
+	print(f'Outputting variant {v}: {variants.loc[v].to_dict()}')
+	pd.DataFrame(isoHourlyGen[v].reshape(-1,len(models)),index=isoHourlyIdx,columns=genCols).to_csv(isoHourlyOutN.format(YEAR=year,VARIANT=v))
+	plantMonthly = pd.DataFrame(plantMonthlyGen[v].reshape(-1,len(models)),index=plantMonthlyIdx,columns=genCols).dropna(how='all')
+	plantMonthly.to_csv(plantMonthlyOutN.format(YEAR=year,VARIANT=v))
+	addToStage(rows=len(isoHourlyIdx)+len(plantMonthly))
+
+endRun()
@@ -0,0 +1,237 @@
+################################################################################
+# @note: This script compacts the downloaded ERA5 model-level files and MERRA2
+#           daily files into point series: only the grid cells that the
+#           plants' (bilinear) interpolation needs, plus NEIGHBORS rings of
+#           cells around them, are kept.
+#        Run it after download_ERA5.py and download_MERRA.r. For each model and
+#           year it writes, to PATH_OUT:
+#           {MODEL}_{VARIABLE}_{YEAR}.npy - a (time x cell x level) float32
+#               array of each variable, with one row per hour of the year
+#               (hours without data are NaN), so a cell's series over any
+#               period is one contiguous read
+#           {MODEL}_points_{YEAR}.json - the start of the time axis, the
+#               latitude and longitude of each cell, the levels of each
+#               variable, the files compacted, and for each plant the
+#               positions and bilinear weights of its four surrounding cells
+#        Read the arrays with np.load(path, mmap_mode = 'r'), so only the hours
+#           and cells used are read from disk.
+#        Rerunning the script only compacts the files that are new (or have
+#           changed) since the last run, unless the plants' cells changed.
+################################################################################
+
+import xarray as xr
+import pandas as pd
+import numpy as np
+import json
+import re
+import os
+
+################################################################################
+# Functions
+################################################################################
+def normalize_lon (lon):
+    # longitudes in -180 - 180
+    return ((np.asarray(lon, dtype = float) + 180) % 360) - 180
+
+def find_name (ds, names):
+    # the first of names that is a coordinate or dimension of ds
+    for name in names:
+        if name in ds.coords or name in ds.dims:
+            return (name)
+    raise KeyError ('none of {} in the file'.format(names))
+
+def plant_cells (lats, lons, plant_lat, plant_lon, neighbors):
+    # the grid indexes (lat, lon) of the cells around a plant, and the bilinear
+    #   weights of its four surrounding cells (the first four returned)
+    # returns None if the plant is outside the grid
+    lat_order, lon_order = np.argsort(lats), np.argsort(lons)
+    la, lo = lats[lat_order], lons[lon_order]
+    if not (la[0] <= plant_lat <= la[-1] and lo[0] <= plant_lon <= lo[-1]):
+        return (None)
+    i = int(np.clip(np.searchsorted(la, plant_lat, side = 'right') - 1, 0, len(la) - 2))
+    j = int(np.clip(np.searchsorted(lo, plant_lon, side = 'right') - 1, 0, len(lo) - 2))
+    ti = (plant_lat - la[i]) / (la[i + 1] - la[i])
+    tj = (plant_lon - lo[j]) / (lo[j + 1] - lo[j])
+    cells = [(i, j), (i, j + 1), (i + 1, j), (i + 1, j + 1)]
+    weights = [(1 - ti) * (1 - tj), (1 - ti) * tj, ti * (1 - tj), ti * tj]
+    for di in range(-neighbors, neighbors + 2):
+        for dj in range(-neighbors, neighbors + 2):
+            if (i + di, j + dj) not in cells and 0 <= i + di < len(la) and 0 <= j + dj < len(lo):
+                cells.append((i + di, j + dj))
+    return ([(int(lat_order[a]), int(lon_order[b])) for a, b in cells], weights)
+
+def cell_key (lat, lon):
+    # cells are identified by their coordinates, so files of different regions share them
+    return ('{:.4f},{:.4f}'.format(float(lat), float(normalize_lon(lon))))
+
+def has_variable (ds, spec, var):
+    # True if the file has var (all of its variables, if stacked)
+    names = spec['variables'][var]
+    return (all(name in ds.data_vars for name in (names if isinstance(names, list) else [names])))
+
+def file_levels (ds, spec, var):
+    # the levels of var: the level coordinate of a variable with a level
+    #   dimension, or the names of the variables stacked as levels
+    names = spec['variables'][var]
+    if isinstance(names, list):
+        return (names)
+    level_dims = [d for d in ds[names].dims if d not in [spec['time'], spec['lat'], spec['lon']]]
+    return ([int(l) if float(l).is_integer() else float(l) for l in ds[level_dims[0]].values] if level_dims else [names])
+
+def read_cells (ds, spec, var, lat_idx, lon_idx):
+    # the values of var at the cells (lat_idx, lon_idx), as (time, cell, level),
+    #   reading only the rows and columns of the grid that contain them
+    names = spec['variables'][var]
+    rows, row_pos = np.unique(lat_idx, return_inverse = True)
+    cols, col_pos = np.unique(lon_idx, return_inverse = True)
+    fields = []
+    for name in (names if isinstance(names, list) else [names]):
+        da = ds[name].isel({spec['lat']: rows, spec['lon']: cols})
+        da = da.transpose(spec['time'], spec['lat'], spec['lon'], ...)
+        values = da.values.reshape(da.shape[:3] + (-1,))
+        fields.append(values[:, row_pos, col_pos, :])
+    return (np.concatenate(fields, axis = 2))
+
+################################################################################
+# Options
+################################################################################
+PATH_IN = './'
+PATH_OUT = './pointSeries/'
+
+PLANT_LOCATIONS_FILE = 'path/to/fileWithPlantLocations.csv' # columns EIA_ID, latitude, longitude
+
+NEIGHBORS = 1 # rings of cells kept around each plant's four surrounding cells
+
+#-------------------------------------------------------------------------------
+# Models: the file names (python regular expression, searched for in PATH_IN),
+#   the names of the time, latitude, and longitude coordinates (the first of
+#   each found), and the variables to keep: either the name of a variable
+#   with a level dimension, or a list of variables stacked as levels
+#   (variables missing from a model's first file are skipped; MERRA2's PS,
+#   T2M, and QV2M are only there if the download list requests them, and are
+#   used by createWindProfiles/airDensity.py for hub-height air density)
+#-------------------------------------------------------------------------------
+MODELS = {
+    'ERA5': {
+        'files': r'ERA5_UV_ml_.*\.nc$',
+        'time': ['time', 'valid_time'],
+        'lat': ['latitude', 'lat'],
+        'lon': ['longitude', 'lon'],
+        'variables': {'u': 'u', 'v': 'v'},
+    },
+    'MERRA2': {
+        'files': r'MERRA2_.*tavg1_2d_slv_Nx.*\.nc4?(\.nc)?$',
+        'time': ['time'],
+        'lat': ['lat', 'latitude'],
+        'lon': ['lon', 'longitude'],
+        'variables': {'u': ['U2M', 'U10M', 'U50M'], 'v': ['V2M', 'V10M', 'V50M'], 'disph': ['DISPH'], \
+                'ps': ['PS'], 't2m': ['T2M'], 'qv2m': ['QV2M']},
+    },
+}
+
+################################################################################
+# Compact each model
+################################################################################
+plants = pd.read_csv(PLANT_LOCATIONS_FILE)
+plants['longitude'] = normalize_lon(plants['longitude'])
+os.makedirs(PATH_OUT, exist_ok = True)
+
+for model, spec in MODELS.items():
+    files = sorted(os.path.join(PATH_IN, f) for f in os.listdir(PATH_IN) if re.search(spec['files'], f))
+    print ('{}: {} files'.format(model, len(files)))
+    if not files:
+        continue
+
+    #===============================================================================
+    # Pass 1: the coordinates of each file (no data is read), the cells each
+    #   year needs, and each plant's cells and weights
+    #===============================================================================
+    by_year = {}
+    file_info = {}
+    grid_cells = {} # the cells of each plant, by grid (files of the same region share them)
+    for path in files:
+        with xr.open_dataset(path) as ds:
+            names = {k: find_name(ds, spec[k]) for k in ['time', 'lat', 'lon']}
+            times = pd.DatetimeIndex(ds[names['time']].values).floor('h')
+            lats, lons = ds[names['lat']].values, normalize_lon(ds[names['lon']].values)
+            levels = {var: file_levels(ds, dict(spec, **names), var) for var in spec['variables'] if has_variable(ds, spec, var)}
+        file_info[path] = dict(names, times = times, lats = lats, lons = lons)
+        grid = (lats.tobytes(), lons.tobytes())
+        if grid not in grid_cells:
+            grid_cells[grid] = {}
+            for eia_id, plant_lat, plant_lon in plants[['EIA_ID', 'latitude', 'longitude']].itertuples(index = False):
+                found = plant_cells(lats, lons, plant_lat, plant_lon, NEIGHBORS)
+                if found is not None:
+                    grid_cells[grid][str(eia_id)] = ([cell_key(lats[a], lons[b]) for a, b in found[0]], found[1])
+        for year in np.unique(times.year):
+            info = by_year.setdefault(int(year), {'cells': {}, 'plants': {}, 'files': [], 'levels': levels})
+            info['files'].append(path)
+            for eia_id, (keys, weights) in grid_cells[grid].items():
+                if eia_id in info['plants']:
+                    continue
+                for key in keys:
+                    info['cells'].setdefault(key, len(info['cells']))
+                info['plants'][eia_id] = {'cells': [info['cells'][key] for key in keys[:4]], 'weights': weights}
+
+    #===============================================================================
+    # Pass 2: the cells' values, written into each year's arrays
+    #===============================================================================
+    for year, info in sorted(by_year.items()):
+        missing = sorted(set(plants['EIA_ID'].astype(str)) - set(info['plants']))
+        if missing:
+            print ('{} {}: {} plants are outside every file: {}'.format(model, year, len(missing), missing[:10]))
+        index_out = os.path.join(PATH_OUT, '{}_points_{}.json'.format(model, year))
+        start = pd.Timestamp(year = year, month = 1, day = 1)
+        n_hours = int((pd.Timestamp(year = year + 1, month = 1, day = 1) - start) / pd.Timedelta(hours = 1))
+        cells = sorted(info['cells'], key = info['cells'].get)
+
+        # reuse the arrays of the last run if the cells are the same
+        paths_out = {var: os.path.join(PATH_OUT, '{}_{}_{}.npy'.format(model, var, year)) for var in info['levels']}
+        done = {}
+        if os.path.exists(index_out) and all(os.path.exists(path_out) for path_out in paths_out.values()):
+            with open(index_out) as f:
+                old = json.load(f)
+            if old['cells'] == [[float(c) for c in key.split(',')] for key in cells] and old['levels'] == info['levels']:
+                done = old['files']
+        arrays = {}
+        for var, levels in info['levels'].items():
+            if done:
+                arrays[var] = np.load(paths_out[var], mmap_mode = 'r+')
+            else:
+                arrays[var] = np.lib.format.open_memmap(paths_out[var], mode = 'w+', dtype = np.float32, shape = (n_hours, len(cells), len(levels)))
+                arrays[var][:] = np.nan
+
+        new_files = [path for path in info['files'] if done.get(path) != os.path.getmtime(path)]
+        print ('{} {}: {} cells, {} new files'.format(model, year, len(cells), len(new_files)))
+        for path in new_files:
+            fi = file_info[path]
+            lat_pos = {'{:.4f}'.format(float(lat)): a for a, lat in enumerate(fi['lats'])}
+            lon_pos = {'{:.4f}'.format(float(lon)): b for b, lon in enumerate(fi['lons'])}
+            in_file = [(p, key.split(',')) for p, key in enumerate(cells)]
+            in_file = [(p, lat_pos[lat], lon_pos[lon]) for p, (lat, lon) in in_file if lat in lat_pos and lon in lon_pos]
+            if not in_file:
+                continue
+            positions, lat_idx, lon_idx = (np.array(x) for x in zip(*in_file))
+            in_year = np.asarray(fi['times'].year == year)
+            hours = ((fi['times'][in_year] - start) / pd.Timedelta(hours = 1)).to_numpy().astype(np.int64)
+            with xr.open_dataset(path) as ds:
+                for var in info['levels']:
+                    if not has_variable(ds, spec, var):
+                        continue
+                    values = read_cells(ds, dict(spec, **fi), var, lat_idx, lon_idx)[in_year]
+                    arrays[var][hours[:, None], positions[None, :], :] = values
+            done[path] = os.path.getmtime(path)
+
+        for array in arrays.values():
+            array.flush()
+        with open(index_out, 'w') as f:
+            json.dump({
+                'start': str(start),
+                'hours': n_hours,
+                'cells': [[float(c) for c in key.split(',')] for key in cells],
+                'levels': info['levels'],
+                'plants': info['plants'],
+                'files': done,
+            }, f)
+
+print ('ALL DONE')
@@ -2,6 +2,14 @@
 # @author: Seongeun Jeong, LBNL
 # @note: This scripts downloads the HRRR hourly 80-m wind data 
 #           using the "herbie" package.
+#        U and V are fetched together with byte-range requests built from the
+#           GRIB2 index file, merging the ranges of adjacent fields so each
+#           hour takes as few requests as possible.
+#        Optionally (CROP), each hour is cropped to windows around the plants,
+#           or to the grid points nearest the plants, before it is written, and
+#           saved as a compressed .npz file instead of GRIB2. A year of cropped
+#           HRRR is a few GB instead of hundreds, and much faster to read
+#           (createWindProfiles/ingestHRRR.py reads both formats).
 ################################################################################
 
 from herbie import Herbie #https://github.com/blaylockbk/Herbie
@@ -11,6 +19,8 @@ import sys
 import importlib
 from os.path import expanduser
 import os
+import tempfile
+import requests # installed along with herbie
 HOME = expanduser("~")
 
 ################################################################################
@@ -22,13 +32,81 @@ def get_dates_month (year, month, time_zone = 'GMT'):
     print ('Days in month {}'.format (days_in_month))
 
     dt = pd.date_range(start=year+ '-' + month + '-01-00', \
-            end = year + '-' + month + '-' + str(days_in_month) + '-23', tz=time_zone, freq='1H')
+            end = year + '-' + month + '-' + str(days_in_month) + '-23', tz=time_zone, freq='1h')
 
     dt = dt.strftime ('%Y-%m-%d %H:%M')
     return (dt)
 
-def download (H, var):
-    H.download(var)
+def coalesce_ranges (inventory, max_gap = 0):
+    # byte ranges [(start, end), ...] of the index rows in inventory, merging
+    # ranges that touch or are at most max_gap bytes apart; end is None for
+    # the last field in the file (i.e. read to the end of the file)
+    ranges = []
+    rows = inventory[['start_byte', 'end_byte']].sort_values('start_byte')
+    for start, end in rows.itertuples(index=False):
+        start = int(start)
+        end = None if pd.isna(end) else int(end)
+        if ranges and ranges[-1][1] is not None and start <= ranges[-1][1] + 1 + max_gap:
+            last_end = ranges[-1][1]
+            ranges[-1] = (ranges[-1][0], None if end is None else max(end, last_end))
+        else:
+            ranges.append((start, end))
+    return (ranges)
+
+def fetch_ranges (session, url, ranges):
+    # fetches the byte ranges of url, one request per (coalesced) range;
+    # GRIB2 messages are self-contained, so the ranges concatenate into a
+    # valid GRIB2 file
+    chunks = []
+    for start, end in ranges:
+        byte_range = 'bytes={}-{}'.format(start, '' if end is None else end)
+        response = session.get(url, headers = {'Range': byte_range}, timeout = 60)
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise IOError ('{} ignored the byte range request'.format(url))
+        chunks.append(response.content)
+    return (b''.join(chunks))
+
+def decode_winds (grib_bytes):
+    # decodes the 80-m U and V (whichever are present) from GRIB2 bytes
+    # returns the valid time, a dict of the components ('u' and/or 'v'), and
+    # the grid's latitudes and longitudes
+    import xarray as xr # installed along with herbie (with cfgrib)
+    with tempfile.NamedTemporaryFile (suffix = '.grib2', delete = False) as f:
+        f.write(grib_bytes)
+    try:
+        ds = xr.open_dataset(f.name, engine = 'cfgrib', backend_kwargs = \
+                {'filter_by_keys': {'typeOfLevel': 'heightAboveGround', 'level': 80}, 'indexpath': ''})
+        winds = {c: ds[c].values for c in ['u', 'v'] if c in ds.data_vars}
+        lats, lons = ds['latitude'].values, ds['longitude'].values
+        valid_time = np.datetime64(pd.Timestamp(np.ravel(ds['valid_time'].values)[0]), 'ns')
+        ds.close()
+    finally:
+        os.remove(f.name)
+    return (valid_time, winds, lats, lons)
+
+def nearest_cells (lats, lons, plant_lats, plant_lons):
+    # position (in the flattened grid) of the grid point nearest each plant,
+    # by great circle distance
+    to_xyz = lambda lat, lon: np.stack([np.cos(np.radians(lat)) * np.cos(np.radians(lon)), \
+            np.cos(np.radians(lat)) * np.sin(np.radians(lon)), np.sin(np.radians(lat))], axis = -1)
+    grid = to_xyz(lats.ravel(), lons.ravel())
+    return (np.array([np.argmax(grid @ xyz) for xyz in to_xyz(np.asarray(plant_lats), np.asarray(plant_lons))], dtype = np.int64))
+
+def crop_cells (lats, lons, plants):
+    # positions (in the flattened grid) of the grid points kept by CROP
+    if CROP == 'points':
+        return (np.unique(nearest_cells(lats, lons, plants['latitude'], plants['longitude'])))
+    keep = np.zeros(lats.shape, dtype = bool)
+    if WINDOWS is not None:
+        lons_180 = (lons + 180) % 360 - 180 # HRRR longitudes are 0-360
+        for lat_min, lat_max, lon_min, lon_max in WINDOWS:
+            keep |= (lats >= lat_min) & (lats <= lat_max) & (lons_180 >= lon_min) & (lons_180 <= lon_max)
+    else:
+        ys, xs = np.unravel_index(nearest_cells(lats, lons, plants['latitude'], plants['longitude']), lats.shape)
+        for y, x in zip(ys, xs):
+            keep[max(y - WINDOW_MARGIN, 0):y + WINDOW_MARGIN + 1, max(x - WINDOW_MARGIN, 0):x + WINDOW_MARGIN + 1] = True
+    return (np.flatnonzero(keep))
 
 ################################################################################
 # Options
@@ -40,16 +118,38 @@ PRIORITY = ['google', 'pando', 'nomads'] # Priority for downloading data from th
 
 PATH_OUT = './'
 
+# Byte-range requests: ranges at most this many bytes apart are fetched in
+# one request (the fields in between are fetched too, and dropped by CROP)
+MAX_GAP = 0
+
+# Cropping (before anything is written to disk):
+#   None      - the full CONUS grid is saved, as GRIB2
+#   'windows' - only the grid points within WINDOW_MARGIN grid points of a
+#               plant (or within WINDOWS, if set) are saved, as .npz
+#   'points'  - only the grid point nearest each plant is saved, as .npz
+CROP = None
+PLANT_LOCATIONS_FILE = 'path/to/fileWithPlantLocations.csv' # columns EIA_ID, latitude, longitude
+WINDOW_MARGIN = 10 # grid points (3 km each) around each plant
+WINDOWS = None # e.g. [(lat_min, lat_max, lon_min, lon_max), ...] in degrees (longitudes -180 - 180)
+
 ################################################################################
 # Variable
 #   Note: see: https://rapidrefresh.noaa.gov/hrrr/HRRRv4_GRIB2_WRFTWO.txt
 ################################################################################
 #VAR = "UGRD:80 m" # Long name: #"UGRD:80 m above ground:anl"
-VAR = "VGRD:80 m" # Long name: #"VGRD:80 m above ground:anl"
+#VAR = "VGRD:80 m" # Long name: #"VGRD:80 m above ground:anl"
+VAR = ":[UV]GRD:80 m" # both U and V (adjacent in the file, so fetched in one request)
 
 # Product: 80-m winds are available in the "sfc" product.
 PRODUCT = 'sfc'
 
+assert CROP in [None, 'windows', 'points']
+if CROP is not None:
+    plants = pd.read_csv(PLANT_LOCATIONS_FILE)
+cells = None # the grid points kept by CROP, found from the first hour's grid
+grid_shape = None # the shape of the grid cells were found from
+session = requests.Session() # reuses the connection across requests
+
 ################################################################################
 # Iterate by months for a specific year:
 #   The user can specify the months to download.
@@ -83,13 +183,33 @@ for this_month in MONTHS:
                 priority=PRIORITY) 
 
         #===============================================================================
-        # Download
+        # Download: byte ranges of VAR from the index file, cropped if CROP
         #===============================================================================
+        file_name = 'hrrr.t{}z.wrf{}f00'.format(H.date.strftime('%H'), PRODUCT)
+        path_out = os.path.join(PATH_OUT, 'hrrr', H.date.strftime('%Y%m%d'), file_name + ('.grib2' if CROP is None else '.npz'))
+        if os.path.exists(path_out):
+            continue
         try:
-            download (H, VAR)
+            ranges = coalesce_ranges(H.inventory(VAR), MAX_GAP)
+            grib_bytes = fetch_ranges(session, H.grib, ranges)
         except Exception:
             print ('\nlikely no data\n')
-            pass
+            continue
+
+        os.makedirs(os.path.dirname(path_out), exist_ok = True)
+        if CROP is None:
+            with open(path_out, 'wb') as f:
+                f.write(grib_bytes)
+            continue
+
+        valid_time, winds, lats, lons = decode_winds(grib_bytes)
+        if cells is None or lats.shape != grid_shape:
+            grid_shape = lats.shape
+            cells = crop_cells(lats, lons, plants)
+            print ('Keeping {} of {} grid points'.format(len(cells), lats.size))
+        np.savez_compressed(path_out, valid_time = valid_time, cell = cells, grid_shape = np.array(grid_shape), \
+                latitude = lats.ravel()[cells], longitude = lons.ravel()[cells], \
+                **{c: w.ravel()[cells].astype(np.float32) for c, w in winds.items()})
 
 print ('ALL DONE')
 
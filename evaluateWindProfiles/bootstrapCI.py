@@ -0,0 +1,110 @@
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from workerPool import forkedPool
+
+# Bootstrap confidence intervals for ISO-level skill metrics
+# The ISO-level metrics are a statistic (the median or mean) over units (e.g plants) of each unit's mean over its rows (e.g its plant-years).
+# Each group (e.g ISO and time period) is bootstrapped by resampling its units with replacement, and optionally each resampled unit's rows as well,
+# using matrices of random indices for a batch of replicates at a time, so the replicates of all columns are computed without Python loops.
+# The groups are independent of each other, so they are spread over a pool of worker processes (on Linux; elsewhere they are run serially, see workerPool.py).
+# Each group gets its own random stream spawned from seed, so the results don't depend on the number of workers.
+# Used by summaryStatsOfWindModels.py
+
+# median along axis, ignoring NaNs
+# (np.nanmedian falls back to a Python loop over the other axes for long axes; this sorts once instead)
+def nanMedian(a,axis):
+	a = np.sort(a,axis=axis) # NaNs are sorted last
+	nValid = np.expand_dims((~np.isnan(a)).sum(axis=axis),axis)
+	lo = np.take_along_axis(a,np.maximum(nValid-1,0)//2,axis=axis)
+	hi = np.take_along_axis(a,nValid//2,axis=axis)
+	median = np.where(nValid > 0,(lo+hi)/2,np.nan)
+	return np.squeeze(median,axis=axis)
+
+stats = {
+	'median':nanMedian,
+	'mean':np.nanmean,
+}
+
+# arranges the rows of values (2d) into an array of shape (nUnits, max rows per unit, nCols), padded with NaN
+# unitCodes are integer unit codes (0 to nUnits-1), one per row
+# returns the padded array and the number of rows of each unit
+def padByUnit(values,unitCodes):
+	order = np.argsort(unitCodes,kind='stable')
+	values,unitCodes = values[order],unitCodes[order]
+	counts = np.bincount(unitCodes)
+	rowInUnit = np.arange(len(unitCodes)) - np.repeat(np.cumsum(counts)-counts,counts)
+	padded = np.full((len(counts),counts.max(),values.shape[1]),np.nan)
+	padded[unitCodes,rowInUnit] = values
+	return padded,counts
+
+# returns nBoot bootstrap replicates (an array of shape (nBoot, nCols)) of stat over the units of padded (from padByUnit)
+# if resampleRows, each resampled unit's rows are also resampled (a two-stage bootstrap), otherwise each unit's value is the mean of all its rows
+# replicates are computed batchSize at a time to bound memory use
+def bootstrapGroup(padded,counts,stat='median',resampleRows=False,nBoot=10000,seed=None,batchSize=500):
+	rng = np.random.default_rng(seed)
+	nUnits,maxRows,nCols = padded.shape
+	statFunc = stats[stat]
+	replicates = np.empty((nBoot,nCols))
+	with warnings.catch_warnings():
+		warnings.simplefilter('ignore',category=RuntimeWarning) # all-NaN units/replicates are NaN
+		unitMeans = np.nanmean(padded,axis=1)
+		for start in range(0,nBoot,batchSize):
+			b = min(batchSize,nBoot-start)
+			unitIdx = rng.integers(0,nUnits,size=(b,nUnits))
+			if resampleRows:
+				nRows = counts[unitIdx][...,None]
+				rowIdx = (rng.random((b,nUnits,maxRows))*nRows).astype(np.int64)
+				samples = padded[unitIdx[...,None],rowIdx] # (b, nUnits, maxRows, nCols)
+				samples[np.arange(maxRows) >= nRows] = np.nan # each unit keeps its own number of rows
+				unitVals = np.nanmean(samples,axis=2)
+			else:
+				unitVals = unitMeans[unitIdx]
+			replicates[start:start+b] = statFunc(unitVals,axis=1)
+	return replicates
+
+# bootstrapGroup, returning the lower and upper bounds of the ci confidence interval instead of the replicates
+def groupCI(padded,counts,ci=0.95,**kwargs):
+	replicates = bootstrapGroup(padded,counts,**kwargs)
+	with warnings.catch_warnings():
+		warnings.simplefilter('ignore',category=RuntimeWarning)
+		return np.nanquantile(replicates,[(1-ci)/2,1-(1-ci)/2],axis=0)
+
+# finds bootstrap confidence intervals of stat ('median' or 'mean') over the units in each group of df
+# df is indexed by (at least) groupLevels and unitLevel; its rows are the units, or the rows of the units (e.g plant-years, with unitLevel = 'EIA_ID')
+# if resampleRows, the rows of each resampled unit are resampled too
+# groups is a MultiIndex of the groups to find the intervals of, in the order to report them (by default, all groups in df in order of appearance)
+# returns a DataFrame with the same columns as df, indexed by groupLevels + ['Bound'], where 'Bound' is 'Lower' or 'Upper'
+def bootstrapCI(df,groupLevels,unitLevel,stat='median',resampleRows=False,nBoot=10000,ci=0.95,seed=12345,nWorkers=os.cpu_count(),batchSize=500,groups=None):
+	keys = pd.MultiIndex.from_arrays([df.index.get_level_values(l) for l in groupLevels])
+	if groups is None:
+		groupCodes,groups = keys.factorize()
+	else:
+		groupCodes = groups.get_indexer(keys) # -1 for rows not in any of groups
+	values = df.to_numpy(dtype=np.float64)
+	units = df.index.get_level_values(unitLevel)
+	seeds = np.random.SeedSequence(seed).spawn(len(groups))
+	kwargs = dict(ci=ci,stat=stat,resampleRows=resampleRows,nBoot=nBoot,batchSize=batchSize)
+
+	# the groups without any rows have NaN bounds
+	bounds = [np.full((2,values.shape[1]),np.nan) for _ in range(len(groups))]
+	tasks = {}
+	for g in range(len(groups)):
+		inGroup = groupCodes == g
+		if inGroup.any():
+			unitCodes,_ = pd.factorize(units[inGroup])
+			tasks[g] = padByUnit(values[inGroup],unitCodes)
+
+	pool = forkedPool(nWorkers,len(tasks))
+	if pool is None:
+		for g,(padded,counts) in tasks.items():
+			bounds[g] = groupCI(padded,counts,seed=seeds[g],**kwargs)
+	else:
+		with pool:
+			futures = {g:pool.submit(groupCI,padded,counts,seed=seeds[g],**kwargs) for g,(padded,counts) in tasks.items()}
+			for g,future in futures.items():
+				bounds[g] = future.result()
+
+	idx = pd.MultiIndex.from_tuples([(*group,bound) for group in groups for bound in ['Lower','Upper']],names=list(groupLevels)+['Bound'])
+	return pd.DataFrame(np.concatenate(bounds),index=idx,columns=df.columns)
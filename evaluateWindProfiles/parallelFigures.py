@@ -0,0 +1,72 @@
+import os
+import json
+import pickle
+import hashlib
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+from workerPool import forkedPool
+
+# Parallel rendering of multi-page PDFs of figures
+# Each PDF is described as a list of pages, where each page is a (plotFunction, args, kwargs) tuple and plotFunction returns a Figure.
+# The PDFs are independent of each other, so they are dispatched to a pool of worker processes (using the non-interactive Agg backend);
+# the pages within a PDF are rendered in order by a single worker, so page order is deterministic.
+# A PDF is skipped if it exists and the inputs of all its pages (the plot functions and the arguments passed to them) are unchanged since it was last rendered
+# (global variables the plot functions use are not part of the inputs, so delete hashFile to force re-rendering after changing them).
+#
+# NOTE: the worker processes are forked and inherit the pages to render, so nothing is pickled and the plot functions may be defined in the calling script.
+# Forking is only used on Linux (see workerPool.py); elsewhere (e.g macOS and Windows), the PDFs are rendered serially.
+
+# returns a hash of the inputs of all pages of a PDF
+def pagesHash(pages):
+	h = hashlib.sha1()
+	for plotFunc,args,kwargs in pages:
+		h.update(f'{plotFunc.__module__}.{plotFunc.__qualname__}'.encode())
+		h.update(pickle.dumps((args,kwargs),protocol=4))
+	return h.hexdigest()
+
+# renders each page of pages and saves them, in order, to the PDF at outPath
+def renderPdf(outPath,pages):
+	plt.switch_backend('Agg')
+	pp = PdfPages(outPath)
+	for plotFunc,args,kwargs in pages:
+		fig = plotFunc(*args,**kwargs)
+		pp.savefig(fig)
+		plt.close(fig)
+	pp.close()
+	return outPath
+
+# the PDFs being rendered by renderPdfs, inherited by the forked worker processes
+_pendingPdfs = {}
+
+# renders the PDF at outPath from _pendingPdfs (in a worker process)
+def _renderPending(outPath):
+	return renderPdf(outPath,_pendingPdfs[outPath])
+
+# renders each PDF in pdfs, a dict mapping output paths to lists of pages, using nWorkers processes
+# hashFile (if not None) is a JSON file recording the input hash of each rendered PDF, used to skip PDFs whose inputs haven't changed
+def renderPdfs(pdfs,nWorkers=os.cpu_count(),hashFile=None):
+	oldHashes = {}
+	if hashFile is not None and os.path.exists(hashFile):
+		with open(hashFile) as f:
+			oldHashes = json.load(f)
+
+	newHashes = {outPath:pagesHash(pages) for outPath,pages in pdfs.items()}
+	toRender = [outPath for outPath in pdfs if not (os.path.exists(outPath) and oldHashes.get(outPath) == newHashes[outPath])]
+	print(f'Rendering {len(toRender)} of {len(pdfs)} PDFs ({len(pdfs)-len(toRender)} unchanged)')
+
+	pool = forkedPool(nWorkers,len(toRender))
+	if pool is None:
+		for outPath in toRender:
+			renderPdf(outPath,pdfs[outPath])
+	else:
+		_pendingPdfs.update(pdfs) # before the workers are forked, so they inherit it
+		with pool:
+			futures = [pool.submit(_renderPending,outPath) for outPath in toRender]
+			for future in futures:
+				future.result() # re-raises any exception from the worker
+		_pendingPdfs.clear()
+
+	if hashFile is not None:
+		oldHashes.update(newHashes)
+		with open(hashFile,'w') as f:
+			json.dump(oldHashes,f,indent=1)
@@ -1,8 +1,13 @@
 import os
+import sys
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','createWindProfiles'))
+from parallelFigures import renderPdfs
+from timeCodec import parseTimes
+from runReport import startRun,beginStage,addToStage,endRun
+from sufficientStats import accumulate,cachedAccumulators,modelMean,correlation
 
 # ----- User Input -----
 years = [2018,2019,2020,2021]
@@ -21,9 +26,17 @@ lineColors = {
 }
 
 genByIsoFileFormat = '/Users/sesuser/Documents/HRRR/analyzingHRRR/allIsosAnalysis/out/HourlyGenByIso/hourlyGen_hrBegAvg_curtAdj_clip995_2018-2021_{ISO}-20230129.csv'
+genByIsoInMemory = None # if not None, a DataFrame of the hourly generation of all ISOs (indexed by ISO and gmt, as computed by curtAdjustHourlyGenByIso.py), used instead of the files in genByIsoFileFormat (see pipeline.py)
 
 diurnalGen_outN = './../out/HourBeginningDiurnalFigures/diurnalGen_{ISO}_{YEAR_START}-{YEAR_END}_interp_hrBegAvg-20230202.pdf'
 diurnalCoefOfDet_outN = './../out/HourBeginningDiurnalFigures/diurnalCoefOfDet_{ISO}_{YEAR_START}-{YEAR_END}_interp_hrBegAvg-20230202.pdf'
+
+nFigureWorkers = os.cpu_count() # number of processes to render the PDFs with (1 renders them serially)
+figureHashFile = None # if not None, a JSON file recording the inputs of each rendered PDF, so PDFs whose inputs haven't changed are skipped on later runs
+
+statsCacheFile = None # if not None, the sufficient statistics (see sufficientStats.py) of the hourly data are cached in this CSV and re-used while it is newer than the hourly files and was built from the same files and columns (see sufficientStats.cachedAccumulators)
+runReportFile = None # if not None, a JSON file that the wall time, CPU time, peak memory, and rows processed of each stage of this run are written to (see runReport.py)
+profileFolder = None # if not None, each stage is profiled with cProfile and its profile is written to this folder
 # ----------------------
 
 # list of ISO names
@@ -47,31 +60,53 @@ if not isinstance(modelsByYear,dict):
 
 ### Part 1: Load in, filter, and format data ###
 
+startRun(os.path.basename(__file__),runReportFile,profileFolder)
+
 # load in hourly modelled and reported generation by ISO
-allModels = {m for models in modelsByYear.values() for m in models}
+allModels = sorted({m for models in modelsByYear.values() for m in models})
 cols = [f'{model} Gen MWh (density and loss adjusted)' for model in allModels]+['curtAdjustedGen MWh','ISO','gmt']
-genByIso = []
-for iso in isos:
-	gen = pd.read_csv(genByIsoFileFormat.format(ISO=iso),usecols=cols)
-	gen['gmt'] = pd.to_datetime(gen['gmt'],infer_datetime_format=True,cache=True)
-	genByIso.append(gen)
-
-genByIso = pd.concat(genByIso).set_index(['ISO','gmt'])
-
-# rename columns to be easier to work with
-renamer = lambda cName: cName.replace(' (density and loss adjusted)','')
-genByIso.rename(columns=renamer,inplace=True)
+def loadGenByIso():
+	beginStage('load')
+	genByIso = []
+	for iso in isos:
+		if genByIsoInMemory is not None:
+			gen = genByIsoInMemory.xs(iso,level='ISO',drop_level=False).reset_index()
+			gen = gen[[c for c in gen.columns if c in cols]] # in the same column order as reading the file with usecols
+		else:
+			gen = pd.read_csv(genByIsoFileFormat.format(ISO=iso),usecols=cols)
+			gen['gmt'] = parseTimes(gen['gmt'])
+		genByIso.append(gen)
+
+	genByIso = pd.concat(genByIso).set_index(['ISO','gmt'])
+
+	# rename columns to be easier to work with
+	renamer = lambda cName: cName.replace(' (density and loss adjusted)','')
+	genByIso.rename(columns=renamer,inplace=True)
+	addToStage(genByIso)
+	beginStage('metrics')
+	return genByIso
+
+# accumulate the sufficient statistics of each model (and the reported generation) against the reported generation
+# by ISO, year, and local quarter and hour, so the diurnal means and correlations below don't need to rescan the hourly data
+statCols = [f'{model} Gen MWh' for model in allModels]+['curtAdjustedGen MWh']
+beginStage('metrics')
+genFiles = [genByIsoFileFormat.format(ISO=iso) for iso in isos]
+if genByIsoInMemory is not None:
+	genStats = accumulate(loadGenByIso(),statCols,isoToTimeZone) # there are no files to check a cache against
+else:
+	genStats = cachedAccumulators(statsCacheFile,genFiles,loadGenByIso,statCols,isoToTimeZone)
+diurnalLevels = ['ISO','Year','Local Quarter','Local Hour']
+diurnalMeans = modelMean(genStats,diurnalLevels)
+diurnalCors = correlation(genStats,diurnalLevels)
 
 
 ### Part 2: Create the graphs analyzing the data ###
 
 # plot diurnal generation by quarter
-# genData is the generation data for a single ISO and year
+# diurnalGen is the mean generation by (local) quarter and hour of day for a single ISO and year, with a column for each generation source
 # isoName and year are just necessary for titling the graphs
 # models is the list of model names (e.g ['HRRR','ERA5','MERRA2']) whose data you want to plot
-def plotDiurnalGenerationByQuarter(genData,isoName,year,models):
-	# find the mean generation by hour of day for each quarter
-	diurnalGen = genData.groupby([genData.index.quarter,genData.index.hour]).mean()
+def plotDiurnalGenerationByQuarter(diurnalGen,isoName,year,models):
 	maxGen = diurnalGen.max().max()
 	# create axes to plot data on
 	fig,axs = plt.subplots(nrows=2,ncols=2,sharex=True)
@@ -98,12 +133,11 @@ def plotDiurnalGenerationByQuarter(genData,isoName,year,models):
 
 
 # plot diurnal coefficient of determination (i.e Pearson's correlation squared) by quarter
-# genData is the generation data for a single ISO and year
+# diurnalCor is the correlation between each model (e.g HRRR, ERA5, MERRA2) and the Reported generation
+# by (local) quarter and hour of day for a single ISO and year
 # isoName and year are just necessary for titling the graphs
 # models is the list of model names (e.g ['HRRR','ERA5','MERRA2']) whose data you want to plot
-def plotDiurnalCoefOfDeterminationByQuarter(genData,isoName,year,models):
-	# find the correlation between each model (e.g HRRR, ERA5, MERRA2) and the Reported generation at each hour of day and for each quarter
-	diurnalCor = genData.groupby([genData.index.quarter,genData.index.hour]).corr(method='pearson').xs('curtAdjustedGen MWh',level=-1)
+def plotDiurnalCoefOfDeterminationByQuarter(diurnalCor,isoName,year,models):
 	diurnalCoefOfDet = diurnalCor ** 2 # coefficient of determination is the square of correlation
 	# create the axes to plot data on
 	fig,axs = plt.subplots(nrows=2,ncols=2,sharex=True)
@@ -127,21 +161,22 @@ def plotDiurnalCoefOfDeterminationByQuarter(genData,isoName,year,models):
 	return fig
 
 # create plots for each ISO and year
+beginStage('figures')
 print('Plotting diurnal generation and coefficient of determination')
 
-for iso in genByIso.index.unique(level='ISO'):
-	# open PDFs to store the plots for iso
-	genPlots = PdfPages(diurnalGen_outN.format(ISO=iso,YEAR_START=min(years),YEAR_END=max(years)))
-	coefOfDetPlots = PdfPages(diurnalCoefOfDet_outN.format(ISO=iso,YEAR_START=min(years),YEAR_END=max(years)))
+# each ISO's two PDFs are independent, so they are rendered in parallel (see parallelFigures.py)
+pdfs = {}
+for iso in genStats.index.unique(level='ISO'):
+	genPlots = pdfs[diurnalGen_outN.format(ISO=iso,YEAR_START=min(years),YEAR_END=max(years))] = []
+	coefOfDetPlots = pdfs[diurnalCoefOfDet_outN.format(ISO=iso,YEAR_START=min(years),YEAR_END=max(years))] = []
 	for year in years:
-		# select the generation data for this iso and year
-		genData = genByIso.loc[(iso,str(year))]
-		# convert the GMT dates to Local Time
-		genData.set_index(genData.index.tz_convert(isoToTimeZone[iso]).rename('Local Time'),inplace=True)
-		# save the plots to their respective PDFs
-		genPlots.savefig(plotDiurnalGenerationByQuarter(genData,iso,year,modelsByYear[year]))
-		coefOfDetPlots.savefig(plotDiurnalCoefOfDeterminationByQuarter(genData,iso,year,modelsByYear[year]))
-		plt.close('all')
-	# close the PDFs
-	genPlots.close()
-	coefOfDetPlots .close()
+		# select the diurnal statistics for this iso and year (the year is in GMT, the quarters and hours are in local time)
+		diurnalGen = diurnalMeans.loc[(iso,year)]
+		diurnalCor = diurnalCors.loc[(iso,year)]
+		# add the plots to their respective PDFs
+		genPlots.append((plotDiurnalGenerationByQuarter,(diurnalGen,iso,year,modelsByYear[year]),{}))
+		coefOfDetPlots.append((plotDiurnalCoefOfDeterminationByQuarter,(diurnalCor,iso,year,modelsByYear[year]),{}))
+
+renderPdfs(pdfs,nWorkers=nFigureWorkers,hashFile=figureHashFile)
+
+endRun()
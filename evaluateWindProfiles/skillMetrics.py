@@ -0,0 +1,57 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','createWindProfiles'))
+from calendarAggregation import rollupLevels
+
+# Plant-month model skill metrics
+# Computes the normalized bias and absolute error of every model column against the reported generation, annually and quarterly,
+# from one segment sum of the monthly residuals (the annual sums are then rolled up from the much smaller quarterly sums),
+# and averages them over years with one groupby per frequency for all models and both metrics at once.
+# Plant-years without all of their months are dropped using group counts rather than a per-group Python filter.
+# Only uses groupby reductions (no DataFrame.sum(level=...)/mean(level=...)), so it works with pandas 2.
+# Used by summaryStatsOfWindModels.py
+
+metrics = ['Bias','AbsErr']
+
+# keeps only the rows of df whose combination of levels (e.g each plant-year) has exactly nRows rows
+def completeGroups(df,levels,nRows=12):
+	codes,_ = pd.MultiIndex.from_arrays([df.index.get_level_values(l) for l in levels]).factorize()
+	return df[np.bincount(codes)[codes] == nRows]
+
+# sums the residuals (modelled - reported) and absolute residuals of each of modCols, and the reported generation (repCol),
+# of genByPlant (monthly data indexed by ['EIA_ID','Year','Quarter','Month']) into quarterly and annual totals
+# returns (quarterly, annual), each with columns ('Bias', col) and ('AbsErr', col) for each of modCols, and ('Reported', repCol)
+def residualSums(genByPlant,modCols,repCol='curtAdjustedGen MWh'):
+	rep = genByPlant[repCol].to_numpy(dtype=np.float64)
+	res = genByPlant[modCols].to_numpy(dtype=np.float64) - rep[:,None]
+	cols = pd.MultiIndex.from_tuples([(m,col) for m in metrics for col in modCols]+[('Reported',repCol)],names=['Metric',None])
+	values = pd.DataFrame(np.hstack([res,np.abs(res),rep[:,None]]),index=genByPlant.index,columns=cols)
+	quarterly = rollupLevels(values,['EIA_ID','Year','Quarter'])
+	annual = rollupLevels(quarterly,['EIA_ID','Year'])
+	return quarterly,annual
+
+# divides the summed residuals of residualSums by the summed reported generation
+# returns a DataFrame with the same index and columns ('Bias', col) and ('AbsErr', col) for each model column
+def normalize(sums):
+	return sums[metrics].div(sums['Reported'].iloc[:,0],axis=0)
+
+# returns the normalized quarterly (by ['EIA_ID','Year','Quarter']) and annual (by ['EIA_ID','Year']) bias and absolute error of each of modCols
+def normalizedByPeriod(genByPlant,modCols,repCol='curtAdjustedGen MWh'):
+	quarterly,annual = residualSums(genByPlant,modCols,repCol)
+	return normalize(quarterly),normalize(annual)
+
+# averages the normalized quarterly and annual metrics of normalizedByPeriod over years
+# returns the mean normalized annual bias (MNAB) and absolute error (MNAAE) by plant
+# and the mean normalized quarterly bias (MNQB) and absolute error (MNQAE) by plant and quarter, of each model column
+# as a dict of DataFrames with the model columns as columns
+def meanSkill(quarterly,annual):
+	annMeans = annual.groupby(level='EIA_ID').mean()
+	quartMeans = quarterly.groupby(level=['EIA_ID','Quarter']).mean()
+	return {
+		'MNAB':annMeans['Bias'],
+		'MNAAE':annMeans['AbsErr'],
+		'MNQB':quartMeans['Bias'],
+		'MNQAE':quartMeans['AbsErr'],
+	}
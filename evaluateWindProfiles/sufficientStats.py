@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','createWindProfiles'))
+from calendarAggregation import calendarLabels
+
+# Sufficient statistics engine for comparing modelled and reported hourly ISO-wide generation
+# One pass over the hourly data accumulates, for each (ISO, Year, Quarter, Local Quarter, Local Hour, Model):
+#	n   - number of hours where both the model and the reported generation are present
+#	Sx  - sum of the model's generation             Sxx - sum of its squares
+#	Sy  - sum of the reported generation             Syy - sum of its squares
+#	Sxy - sum of the products of the model's and the reported generation
+# ('Year' and 'Quarter' are in UTC, as in summaryStatsOfWindModels.py, and 'Local Quarter' and 'Local Hour' are in the ISO's time zone, as in plotDiurnalFigures_allUS.py)
+# The mean, bias, and Pearson correlation for any coarser grouping (e.g by ISO and Year, or by ISO, Year, Local Quarter, and Local Hour)
+# are then found by summing the accumulators, without rescanning the hourly data.
+# The accumulators can be cached to a CSV, so evaluation reruns don't need to read the hourly data at all.
+
+statCols = ['n','Sx','Sy','Sxx','Syy','Sxy']
+keyCols = ['Year','Quarter','Local Quarter','Local Hour']
+
+# accumulates the sufficient statistics of each of cols against repCol
+# genByIso is indexed by ['ISO','gmt'] (tz-aware or UTC); isoToTimeZone maps each ISO to its time zone
+# returns a DataFrame with statCols as columns, indexed by ['ISO','Year','Quarter','Local Quarter','Local Hour','Model'] where 'Model' is the column name
+def accumulate(genByIso,cols,isoToTimeZone,repCol='curtAdjustedGen MWh'):
+	accs = {}
+	for iso,gen in genByIso.groupby(level='ISO',sort=True):
+		gmt = gen.index.get_level_values('gmt')
+		utc = calendarLabels(gmt,['Year','Quarter'])
+		local = calendarLabels(gmt,['Quarter','Hour'],isoToTimeZone[iso])
+		keys = pd.MultiIndex.from_arrays([utc['Year'],utc['Quarter'],local['Quarter'],local['Hour']],names=keyCols)
+		codes,groups = keys.factorize()
+		sumByGroup = lambda v: np.bincount(codes,weights=v,minlength=len(groups))
+		y = gen[repCol].to_numpy(dtype=np.float64)
+		stats = {}
+		for col in cols:
+			x = gen[col].to_numpy(dtype=np.float64)
+			valid = ~(np.isnan(x) | np.isnan(y)) # like DataFrame.corr, only use hours where both are present
+			xv = np.where(valid,x,0)
+			yv = np.where(valid,y,0)
+			stats[col] = pd.DataFrame({
+				'n':sumByGroup(valid),
+				'Sx':sumByGroup(xv),
+				'Sy':sumByGroup(yv),
+				'Sxx':sumByGroup(xv*xv),
+				'Syy':sumByGroup(yv*yv),
+				'Sxy':sumByGroup(xv*yv),
+			},index=groups)
+		accs[iso] = pd.concat(stats,names=['Model']+keyCols)
+	acc = pd.concat(accs,names=['ISO','Model']+keyCols)
+	return acc.reorder_levels(['ISO']+keyCols+['Model']).sort_index()
+
+# returns accumulate(loadGen(),cols,isoToTimeZone,repCol), cached in cacheFile (if it isn't None)
+# the cache is re-used only if it is newer than all of sourceFiles (the files loadGen reads) and was built from the same
+# sourceFiles, cols, repCol, and time zones, which are recorded next to it in cacheFile + '.json'; otherwise it is rebuilt
+def cachedAccumulators(cacheFile,sourceFiles,loadGen,cols,isoToTimeZone,repCol='curtAdjustedGen MWh'):
+	if cacheFile is None:
+		return accumulate(loadGen(),cols,isoToTimeZone,repCol)
+	keyFile = cacheFile + '.json'
+	key = {
+		'sourceFiles':[os.path.abspath(f) for f in sourceFiles],
+		'cols':list(cols),
+		'repCol':repCol,
+		'isoToTimeZone':dict(isoToTimeZone),
+	}
+	if os.path.exists(cacheFile) and os.path.exists(keyFile):
+		with open(keyFile) as f:
+			sameKey = json.load(f) == key
+		if sameKey and all(os.path.getmtime(cacheFile) >= os.path.getmtime(f) for f in sourceFiles):
+			print(f'Using cached sufficient statistics: {cacheFile}')
+			return pd.read_csv(cacheFile,index_col=['ISO']+keyCols+['Model'])
+	acc = accumulate(loadGen(),cols,isoToTimeZone,repCol)
+	acc.to_csv(cacheFile)
+	with open(keyFile,'w') as f:
+		json.dump(key,f,indent=1)
+	return acc
+
+# sums the accumulators over every level not in levels (the 'Model' level is always kept)
+def reduceStats(acc,levels):
+	return acc.groupby(level=list(levels)+['Model']).sum()
+
+# the following return DataFrames indexed by levels with one column per model
+
+# mean of each model's generation
+def modelMean(acc,levels):
+	s = reduceStats(acc,levels)
+	return (s['Sx'] / s['n']).unstack('Model')
+
+# mean of the reported generation (over the hours each model is compared against)
+def reportedMean(acc,levels):
+	s = reduceStats(acc,levels)
+	return (s['Sy'] / s['n']).unstack('Model')
+
+# mean bias (modelled - reported)
+def bias(acc,levels):
+	s = reduceStats(acc,levels)
+	return ((s['Sx'] - s['Sy']) / s['n']).unstack('Model')
+
+# Pearson correlation between each model and the reported generation
+def correlation(acc,levels):
+	s = reduceStats(acc,levels)
+	cov = s['n']*s['Sxy'] - s['Sx']*s['Sy']
+	varX = s['n']*s['Sxx'] - s['Sx']**2
+	varY = s['n']*s['Syy'] - s['Sy']**2
+	denom = np.sqrt(varX*varY)
+	r = (cov / denom).where(denom > 0)
+	return r.clip(-1,1).unstack('Model') # clip to guard against rounding pushing |r| just above 1
+
+# coefficient of determination (the square of the Pearson correlation)
+def coefOfDetermination(acc,levels):
+	return correlation(acc,levels) ** 2
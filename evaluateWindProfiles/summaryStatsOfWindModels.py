@@ -1,9 +1,16 @@
 import os
+import sys
 from collections import OrderedDict
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','createWindProfiles'))
+from parallelFigures import renderPdfs
+from skillMetrics import completeGroups,normalizedByPeriod,meanSkill
+from bootstrapCI import bootstrapCI
+from timeCodec import parseTimes
+from runReport import startRun,beginStage,addToStage,endRun
+from sufficientStats import accumulate,cachedAccumulators,correlation
 
 # ----- User Input -----
 years = [2018,2019,2020,2021]
@@ -21,6 +28,8 @@ genType = 'hrBegAvg' # 'instant' or 'hrBegAvg'
 
 genByIsoFileFormat = '/Users/sesuser/Documents/HRRR/analyzingHRRR/allIsosAnalysis/out/HourlyGenByIso/hourlyGen_{genType}_curtAdj_clip995_2018-2021_{ISO}-20230129.csv'
 genByPlantFile = '/Users/sesuser/Documents/HRRR/analyzingHRRR/allIsosAnalysis/out/MonthlyGenByPlant/monthlyGenByPlant_{genType}_curtAdj_2018-2021-20230129.csv'
+genByIsoInMemory = None # if not None, a DataFrame of the hourly generation of all ISOs (indexed by ISO and gmt, as computed by curtAdjustHourlyGenByIso.py), used instead of the files in genByIsoFileFormat (see pipeline.py)
+genByPlantInMemory = None # if not None, a DataFrame of the monthly generation by plant (indexed by EIA_ID, Year, and Month, as computed by curtAdjustMonthlyGenByPlant.py), used instead of genByPlantFile
 
 outPath = './../out/SummaryStatsAndFigs_v2/'
 meanNormAnnBiasByPlant_outN = f'meanNormAnnBiasByPlant_2018-2021_{genType}-20230202.csv'
@@ -33,6 +42,21 @@ meanR2ByIso_outN = f'meanR2ByIso_2018-2021_{genType}-20230202.csv'
 lineFigSeasonalMeanNormBias_outN = f'lineFigSeasonalMeanNormBiasByIso_2018-2021_{genType}-20230202.pdf'
 lineFigSeasonalMeanNormAbsErr_outN = f'lineFigSeasonalMeanNormAbsErrByIso_2018-2021_{genType}-20230202.pdf'
 lineFigSeasonalMeanR2_outN = f'lineFigSeasonalMeanR2ByIso_2018-2021_{genType}-20230202.pdf'
+medianMeanNormBiasByIsoCI_outN = f'medianMeanNormBiasByIsoCI_2018-2021_{genType}-20230202.csv'
+medianMeanNormAbsErrByIsoCI_outN = f'medianMeanNormAbsErrByIsoCI_2018-2021_{genType}-20230202.csv'
+meanR2ByIsoCI_outN = f'meanR2ByIsoCI_2018-2021_{genType}-20230202.csv'
+
+bootstrapReplicates = 0 # if > 0, the number of bootstrap replicates (e.g 10000) used to find confidence intervals of the ISO-level metrics; 0 skips the bootstrap
+bootstrapPlantYears = False # if True, the years of each resampled plant are also resampled (otherwise only plants are resampled)
+bootstrapCILevel = 0.95 # confidence level of the intervals
+bootstrapWorkers = os.cpu_count() # number of processes to run the bootstrap with (1 runs it serially)
+
+nFigureWorkers = os.cpu_count() # number of processes to render the PDFs with (1 renders them serially)
+figureHashFile = None # if not None, a JSON file recording the inputs of each rendered PDF, so PDFs whose inputs haven't changed are skipped on later runs
+
+statsCacheFile = None # if not None, the sufficient statistics (see sufficientStats.py) of the hourly data are cached in this CSV and re-used while it is newer than the hourly files and was built from the same files and columns (see sufficientStats.cachedAccumulators)
+runReportFile = None # if not None, a JSON file that the wall time, CPU time, peak memory, and rows processed of each stage of this run are written to (see runReport.py)
+profileFolder = None # if not None, each stage is profiled with cProfile and its profile is written to this folder
 # ----------------------
 
 # list of ISO names
@@ -48,24 +72,49 @@ baToIso = {
 	'ISNE':'ISONE',
 	'NYIS':'NYISO'
 }
+# crosswalk between ISO names and time zomes
+isoToTimeZone = {
+	'CAISO':'US/Pacific',
+	'ERCOT':'US/Central',
+	'MISO' :'US/Central',
+	'PJM'  :'US/Eastern',
+	'SPP'  :'US/Central',
+	'ISONE':'US/Eastern',
+	'NYISO':'US/Eastern'
+}
 
 ### Part 1: Load in, filter, and format data ###
 
+startRun(os.path.basename(__file__),runReportFile,profileFolder)
+beginStage('load')
+
 # load in plant info file
 plantInfo = pd.read_csv(plantInfoFile,index_col='EIA_ID')
 plantInfo['ISO'] = plantInfo['eia_ba'].replace(baToIso)
 
 # load in hourly modelled and reported generation by ISO
-genByIso = []
-for iso in isos:
-	gen = pd.read_csv(genByIsoFileFormat.format(genType=genType,ISO=iso))
-	gen['gmt'] = pd.to_datetime(gen['gmt'],infer_datetime_format=True,cache=True)
-	genByIso.append(gen)
-
-genByIso = pd.concat(genByIso).set_index(['ISO','gmt'])
+# (only needed to build the sufficient statistics used for R^2 below, so it is skipped if they are cached)
+def loadGenByIso():
+	beginStage('load')
+	genByIso = []
+	for iso in isos:
+		if genByIsoInMemory is not None:
+			gen = genByIsoInMemory.xs(iso,level='ISO',drop_level=False).reset_index()
+		else:
+			gen = pd.read_csv(genByIsoFileFormat.format(genType=genType,ISO=iso))
+			gen['gmt'] = parseTimes(gen['gmt'])
+		genByIso.append(gen)
+
+	genByIso = pd.concat(genByIso).set_index(['ISO','gmt'])
+	addToStage(genByIso)
+	beginStage('metrics')
+	return genByIso
 
 # load in monthly modelled and reported generation by plant
-genByPlant = pd.read_csv(genByPlantFile.format(genType=genType))
+if genByPlantInMemory is not None:
+	genByPlant = genByPlantInMemory.reset_index()
+else:
+	genByPlant = pd.read_csv(genByPlantFile.format(genType=genType))
 genByPlant['Quarter'] = (genByPlant['Month']-1)//3 + 1
 genByPlant.set_index(['EIA_ID','Year','Quarter','Month'],inplace=True)
 
@@ -79,30 +128,25 @@ cods['day'] = 1
 cods = pd.to_datetime(cods,utc=True)
 postTeething = cods + pd.DateOffset(years=1)
 idxDate = pd.to_datetime(genByPlant.index.map(lambda x: f'{x[1]}-{x[2]}-01'),format='%Y-%m-%d',utc=True)
-genByPlant = genByPlant[idxDate >= postTeething]
+genByPlant = genByPlant[idxDate >= pd.DatetimeIndex(postTeething)] # compared by position, not aligned on EIA_ID
 
 # exclude months where reported generation is 0, negative, or missing
 posNotNaN = (genByPlant['curtAdjustedGen MWh'] > 0) & (genByPlant['curtAdjustedGen MWh'].notna())
 genByPlant = genByPlant[posNotNaN]
 
 # by plant, exclude years without all 12 months of data
-genByPlant = genByPlant.groupby(['EIA_ID','Year']).filter(lambda g: len(g) == 12)
+genByPlant = completeGroups(genByPlant,['EIA_ID','Year'],12)
 
 # Part 2: Calculate summary statistics
+addToStage(genByPlant)
+beginStage('metrics')
 
-# find mean normalized annual bias (MNAB) and mean normalized absolute error (MNAE) by plant
+# find mean normalized annual and quarterly bias (MNAB, MNQB) and absolute error (MNAAE, MNQAE) by plant, for all model columns at once (see skillMetrics.py)
 modGenCols = [f'{model} Gen MWh ({gtype})' for model in models for gtype in ['raw','density adjusted','density and loss adjusted']]
-resByPlant = genByPlant[modGenCols].sub(genByPlant['curtAdjustedGen MWh'],axis=0)
-
-normAnnBiasByPlant = resByPlant.sum(level=['EIA_ID','Year']).div(
-	genByPlant['curtAdjustedGen MWh'].sum(level=['EIA_ID','Year']),axis=0
-)
-MNABByPlant = normAnnBiasByPlant.mean(level='EIA_ID')
-
-normAnnErrByPlant = resByPlant.abs().sum(level=['EIA_ID','Year']).div(
-	genByPlant['curtAdjustedGen MWh'].sum(level=['EIA_ID','Year']),axis=0
-)
-MNAAEByPlant = normAnnErrByPlant.mean(level='EIA_ID')
+normQuarterly,normAnnual = normalizedByPeriod(genByPlant,modGenCols,'curtAdjustedGen MWh')
+skill = meanSkill(normQuarterly,normAnnual)
+MNABByPlant = skill['MNAB']
+MNAAEByPlant = skill['MNAAE']
 
 MNABByPlant.to_csv(os.path.join(outPath,meanNormAnnBiasByPlant_outN))
 MNAAEByPlant.to_csv(os.path.join(outPath,meanNormAnnAbsErrByPlant_outN))
@@ -142,69 +186,62 @@ def scatterWithJitter_allModels(df,colForm,title,yLabel,modelColors,jitterMag=0.
 	fig.subplots_adjust(left=0.15,bottom=0.07,right=0.98,top=0.9)
 	return fig
 
+# the PDFs of figures to make, as lists of (plot function, args, kwargs) for each page
+# they are all rendered in parallel at the end of the script (see parallelFigures.py)
+pdfs = {}
+
 # make mean normalized annual bias figures
-pp = PdfPages(os.path.join(outPath,scatterMeanNormAnnBias_outN))
 yLabel = 'Mean Normalized Annual Bias (Modeled - Observed)'
-rawFig = scatterWithJitter_allModels(MNABByPlant,'{} Gen MWh (raw)','Mean Normalized Annual Bias by Plant:\nRaw Gen',yLabel,modelColors,yLims=(-1.1,1.5))
-pp.savefig(rawFig)
-daFig = scatterWithJitter_allModels(MNABByPlant,'{} Gen MWh (density adjusted)','Mean Normalized Annual Bias by Plant:\nDensity Adjusted Gen',yLabel,modelColors,yLims=(-1.1,1.5))
-pp.savefig(daFig)
-dlaFig = scatterWithJitter_allModels(MNABByPlant,'{} Gen MWh (density and loss adjusted)','Mean Normalized Annual Bias by Plant:\nDensity and Loss Adjusted Gen',yLabel,modelColors,yLims=(-1.1,1.5))
-pp.savefig(dlaFig)
-pp.close()
+pdfs[os.path.join(outPath,scatterMeanNormAnnBias_outN)] = [
+	(scatterWithJitter_allModels,(MNABByPlant,'{} Gen MWh (raw)','Mean Normalized Annual Bias by Plant:\nRaw Gen',yLabel,modelColors),dict(yLims=(-1.1,1.5))),
+	(scatterWithJitter_allModels,(MNABByPlant,'{} Gen MWh (density adjusted)','Mean Normalized Annual Bias by Plant:\nDensity Adjusted Gen',yLabel,modelColors),dict(yLims=(-1.1,1.5))),
+	(scatterWithJitter_allModels,(MNABByPlant,'{} Gen MWh (density and loss adjusted)','Mean Normalized Annual Bias by Plant:\nDensity and Loss Adjusted Gen',yLabel,modelColors),dict(yLims=(-1.1,1.5))),
+]
 
 # make mean normalized annual error figures
-pp = PdfPages(os.path.join(outPath,scatterMeanNormAnnAbsErr_outN))
-rawFig = scatterWithJitter_allModels(MNAAEByPlant,'{} Gen MWh (raw)','Mean Normalized Annual Error by Plant: Raw Gen','Mean Normalized Annual Error',modelColors,yLims=(0,1.5),zeroLine=False)
-pp.savefig(rawFig)
-daFig = scatterWithJitter_allModels(MNAAEByPlant,'{} Gen MWh (density adjusted)','Mean Normalized Annual Error by Plant: Density Adjusted Gen','Mean Normalized Annual Error',modelColors,yLims=(0,1.5),zeroLine=False)
-pp.savefig(daFig)
-dlaFig = scatterWithJitter_allModels(MNAAEByPlant,'{} Gen MWh (density and loss adjusted)','Mean Normalized Annual Error by Plant:\nDensity and Loss Adjusted Gen','Mean Normalized Annual Error',modelColors,yLims=(0,1.5),zeroLine=False)
-pp.savefig(dlaFig)
-pp.close()
-
-# calculate mean normalized quarterly bias (MNQB) and absolute error (MNQAE) by plant
-normAnnQuartBiasByPlant = resByPlant.sum(level=['EIA_ID','Year','Quarter']).div(
-	genByPlant['curtAdjustedGen MWh'].sum(level=['EIA_ID','Year','Quarter']),axis=0
-)
-MNQBByPlant = normAnnQuartBiasByPlant.mean(level=['EIA_ID','Quarter'])
-
-normAnnQuartErrByPlant = resByPlant.abs().sum(level=['EIA_ID','Year','Quarter']).div(
-	genByPlant['curtAdjustedGen MWh'].sum(level=['EIA_ID','Year','Quarter']),axis=0
-)
-MNQAEByPlant = normAnnQuartErrByPlant.mean(level=['EIA_ID','Quarter'])
+pdfs[os.path.join(outPath,scatterMeanNormAnnAbsErr_outN)] = [
+	(scatterWithJitter_allModels,(MNAAEByPlant,'{} Gen MWh (raw)','Mean Normalized Annual Error by Plant: Raw Gen','Mean Normalized Annual Error',modelColors),dict(yLims=(0,1.5),zeroLine=False)),
+	(scatterWithJitter_allModels,(MNAAEByPlant,'{} Gen MWh (density adjusted)','Mean Normalized Annual Error by Plant: Density Adjusted Gen','Mean Normalized Annual Error',modelColors),dict(yLims=(0,1.5),zeroLine=False)),
+	(scatterWithJitter_allModels,(MNAAEByPlant,'{} Gen MWh (density and loss adjusted)','Mean Normalized Annual Error by Plant:\nDensity and Loss Adjusted Gen','Mean Normalized Annual Error',modelColors),dict(yLims=(0,1.5),zeroLine=False)),
+]
+
+# mean normalized quarterly bias (MNQB) and absolute error (MNQAE) by plant
+MNQBByPlant = skill['MNQB']
+MNQAEByPlant = skill['MNQAE']
 
 # by ISO, find median quarterly mean normalized bias/error over all plants in the ISO
 def findMediansByIsoQuarter(df):
-	isos = plantInfo.loc[df.index.get_level_values('EIA_ID'),'ISO'].to_numpy()
+	isos = pd.Index(plantInfo.loc[df.index.get_level_values('EIA_ID'),'ISO'].to_numpy(),name='ISO')
 	return df.groupby([isos,'Quarter']).median()
 
 medMNQBByIso = findMediansByIsoQuarter(MNQBByPlant)
 medMNQAEByIso = findMediansByIsoQuarter(MNQAEByPlant)
 
 # calculate R^2
-yrIdx = genByIso.index.get_level_values('gmt').year.rename('Year')
-quarterIdx = genByIso.index.get_level_values('gmt').quarter.rename('Quarter')
-meanAnnR2ByIso = (
-	genByIso.groupby(['ISO',yrIdx])
-	.corr(method='pearson')
-	.xs('curtAdjustedGen MWh',level=-1)
-	.mean(level='ISO')
-)
-meanQuartR2ByIso = (
-	genByIso.groupby(['ISO',yrIdx,quarterIdx])
-	.corr(method='pearson')
-	.xs('curtAdjustedGen MWh',level=-1)
-	.mean(level=['ISO','Quarter'])
-)
-
+# the correlations by ISO and (GMT) year or quarter are derived from sufficient statistics accumulated in a single pass over the hourly data
+# NOTE: as in earlier versions of this script, the "R^2" metrics are the means of the Pearson correlations (r), not of their squares
+genFiles = [genByIsoFileFormat.format(genType=genType,ISO=iso) for iso in isos]
+if genByIsoInMemory is not None:
+	genStats = accumulate(loadGenByIso(),modGenCols,isoToTimeZone) # there are no files to check a cache against
+else:
+	genStats = cachedAccumulators(statsCacheFile,genFiles,loadGenByIso,modGenCols,isoToTimeZone)
+meanAnnR2ByIso = correlation(genStats,['ISO','Year']).groupby(level='ISO').mean()
+meanQuartR2ByIso = correlation(genStats,['ISO','Year','Quarter']).groupby(level=['ISO','Quarter']).mean()
+
+
+# stack annual and quarterly metrics (indexed by e.g ['ISO'] and ['ISO','Quarter']) into one DataFrame,
+# with a 'TimePeriod' level that is 'Annual' for the annual rows and the quarter for the quarterly rows
+def withTimePeriod(annual,quarterly):
+	annual = annual.set_index(pd.Index(['Annual']*len(annual),name='TimePeriod'),append=True)
+	return pd.concat([annual,quarterly.rename_axis(index={'Quarter':'TimePeriod'})])
 
 # combine the quarterly and annual metrics (mean normalized bias, mean normalized absolute error, mean R^2) into single DataFrames
+# sorted by ISO, with each ISO's quarters before its annual value, as in earlier outputs
+# (a sort_index of the mixed quarter/'Annual' level would put 'Annual' first in newer versions of pandas)
 def concatAnnualQuarterly(annual,quarterly):
-	# add 'TimePeriod' level to annual's index, analogous to the 'Quarter' level of quarterly
-	annualIdx = pd.Index(['Annual']*len(annual),name='TimePeriod')
-	annual.set_index(annualIdx,append=True,inplace=True)
-	return pd.concat([annual,quarterly]).sort_index()
+	stacked = withTimePeriod(annual,quarterly)
+	isAnnual = stacked.index.get_level_values('TimePeriod') == 'Annual'
+	return stacked.iloc[np.lexsort((isAnnual,stacked.index.get_level_values('ISO')))] # lexsort is stable, so the quarters stay in order
 
 medMNBByIso  = concatAnnualQuarterly(medMNABByIso,medMNQBByIso)
 medMNAEByIso = concatAnnualQuarterly(medMNAAEByIso,medMNQAEByIso)
@@ -214,7 +251,28 @@ medMNBByIso.to_csv(os.path.join(outPath,medianMeanNormBiasByIso_outN))
 medMNAEByIso.to_csv(os.path.join(outPath,medianMeanNormAbsErrByIso_outN))
 meanR2ByIso[modGenCols].to_csv(os.path.join(outPath,meanR2ByIso_outN))
 
+# find bootstrap confidence intervals of the ISO-level metrics (see bootstrapCI.py)
+# the medians of the plants' mean normalized bias/absolute error are bootstrapped by resampling plants (and optionally their years),
+# and the mean R^2 by resampling years
+if bootstrapReplicates > 0:
+	beginStage('bootstrap')
+	print(f'Bootstrapping confidence intervals with {bootstrapReplicates} replicates')
+	bootstrapArgs = dict(nBoot=bootstrapReplicates,ci=bootstrapCILevel,nWorkers=bootstrapWorkers,
+		groups=pd.MultiIndex.from_product([isos,['Annual',1,2,3,4]],names=['ISO','TimePeriod']))
+
+	normByPlantYear = withTimePeriod(normAnnual,normQuarterly)
+	plantIsos = plantInfo.loc[normByPlantYear.index.get_level_values('EIA_ID'),'ISO'].to_numpy()
+	normByPlantYear = normByPlantYear.set_index(pd.Index(plantIsos,name='ISO'),append=True)
+	for metric,outN in [('Bias',medianMeanNormBiasByIsoCI_outN),('AbsErr',medianMeanNormAbsErrByIsoCI_outN)]:
+		ci = bootstrapCI(normByPlantYear[metric],['ISO','TimePeriod'],'EIA_ID','median',resampleRows=bootstrapPlantYears,**bootstrapArgs)
+		ci.to_csv(os.path.join(outPath,outN))
+
+	r2ByIsoYear = withTimePeriod(correlation(genStats,['ISO','Year']),correlation(genStats,['ISO','Year','Quarter']))
+	ci = bootstrapCI(r2ByIsoYear[modGenCols],['ISO','TimePeriod'],'Year','mean',**bootstrapArgs)
+	ci.to_csv(os.path.join(outPath,meanR2ByIsoCI_outN))
+
 # plot annual and quarterly values as 5 lines per ISO
+beginStage('figures')
 # (one line per quarter, and one for annual)
 def plotAllTimeAndQuarterlyMetricsByIso(values,col,yLabel,title,lineLen,colors,yLims=None,zeroLine=False):
 	fig,ax = plt.subplots(1,1)
@@ -253,34 +311,29 @@ qColors = dict(zip(quarters,plt.get_cmap('Blues')([0.8,0.6,0.4,0.2])))
 colors = {'Annual':'black',**qColors}
 
 # plot mean normalized biases
-pp = PdfPages(os.path.join(outPath,lineFigSeasonalMeanNormBias_outN))
+pages = pdfs[os.path.join(outPath,lineFigSeasonalMeanNormBias_outN)] = []
 for model in models:
 	col = f'{model} Gen MWh (density and loss adjusted)'
 	yLabel = 'Median of Mean Normalized Bias (Modeled - Observed)'
 	title = f'Seasonal Medians of ISO-Wide Mean Normalized Biases for {model}:\nDensity and Loss Adjusted Gen\n'
-	fig = plotAllTimeAndQuarterlyMetricsByIso(medMNBByIso,col,yLabel,title,0.15,colors,yLims=(-0.9,0.7),zeroLine=True)
-	pp.savefig(fig)
-
-pp.close()
+	pages.append((plotAllTimeAndQuarterlyMetricsByIso,(medMNBByIso,col,yLabel,title,0.15,colors),dict(yLims=(-0.9,0.7),zeroLine=True)))
 
 # plot mean normalized absolute errors
-pp = PdfPages(os.path.join(outPath,lineFigSeasonalMeanNormAbsErr_outN))
+pages = pdfs[os.path.join(outPath,lineFigSeasonalMeanNormAbsErr_outN)] = []
 for model in models:
 	col = f'{model} Gen MWh (density and loss adjusted)'
 	yLabel = 'Median of Mean Normalized Absolute Error'
 	title = f'Seasonal Medians of ISO-Wide Mean Normalized Absolute Errors for {model}:\nDensity and Loss Adjusted Gen\n'
-	fig = plotAllTimeAndQuarterlyMetricsByIso(medMNAEByIso,col,yLabel,title,0.15,colors,yLims=(0,0.9))
-	pp.savefig(fig)
-
-pp.close()
+	pages.append((plotAllTimeAndQuarterlyMetricsByIso,(medMNAEByIso,col,yLabel,title,0.15,colors),dict(yLims=(0,0.9))))
 
 # plot mean R^2
-pp = PdfPages(os.path.join(outPath,lineFigSeasonalMeanR2_outN))
+pages = pdfs[os.path.join(outPath,lineFigSeasonalMeanR2_outN)] = []
 for model in models:
 	col = f'{model} Gen MWh (density and loss adjusted)'
 	yLabel = 'Mean $R^2$'
 	title = f'Seasonal Mean $R^2$ for {model}:\nDensity and Loss Adjusted Gen\n'
-	fig = plotAllTimeAndQuarterlyMetricsByIso(meanR2ByIso,col,yLabel,title,0.15,colors,yLims=(0,1))
-	pp.savefig(fig)
+	pages.append((plotAllTimeAndQuarterlyMetricsByIso,(meanR2ByIso,col,yLabel,title,0.15,colors),dict(yLims=(0,1))))
+
+renderPdfs(pdfs,nWorkers=nFigureWorkers,hashFile=figureHashFile)
 
-pp.close()
+endRun()
@@ -0,0 +1,16 @@
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Worker process pools for the helpers of the evaluation scripts (parallelFigures.py and bootstrapCI.py)
+# The evaluation scripts run at the top level, without an `if __name__ == '__main__':` guard, so their workers can't be started with spawn
+# (the default on macOS and Windows), which re-runs the calling script in every worker. Forking is only safe on Linux: on macOS, forking a process
+# that has already initialised matplotlib (or any other Objective-C framework) can hang or crash.
+# So work is spread over forked worker processes on Linux, and run serially everywhere else.
+
+# returns a ProcessPoolExecutor of up to nWorkers forked worker processes for nTasks tasks,
+# or None if the tasks should be run serially (nWorkers is None or 1, there's only one task, or this isn't Linux)
+def forkedPool(nWorkers,nTasks):
+	if nWorkers is None or nWorkers <= 1 or nTasks <= 1 or not sys.platform.startswith('linux'):
+		return None
+	return ProcessPoolExecutor(max_workers=min(nWorkers,nTasks),mp_context=multiprocessing.get_context('fork'))